@@ -1,12 +1,24 @@
 from flask import Flask, render_template
 import os
 from dotenv import load_dotenv
+from sqlalchemy import inspect, text
 from werkzeug.middleware.proxy_fix import ProxyFix
 from app.auth.routes import auth_bp
 from app.users.routes import users_bp
 from app.approvals.routes import approvals_bp
-from app.models import db, FormTemplate
+from app.models import db, FormTemplate, Request, WorkQueueItem, ApprovalStep, ApproverLoad, RequestEvent, ApprovalRollup
+from app.approvals.work_queue import rebuild_work_queue
+from app.approvals.assignment import rebuild_load_counters
+from app.approvals.history import backfill_events, snapshot_timelines_command, audit_events_command
+from app.approvals.analytics import rebuild_rollups, rebuild_analytics_command, prune_analytics_command
+from app.approvals.archive import archive_requests_command
 from app.utils.forms_config import FORM_TEMPLATES
+from app.utils.request_io import export_requests_command, import_requests_command
+from app.utils.pdf_archive import archive_pdfs_command
+from app.utils.metrics import init_metrics
+from app.utils.profiler import init_profiler
+from app.utils.render_governor import init_render_governor
+from app.approvals.live import init_live_stream
 
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
@@ -17,15 +29,84 @@ MOCK_MODE = not all([CLIENT_ID, CLIENT_SECRET, TENANT_ID])
 if MOCK_MODE:
     print(" Running in DEMO MODE: Microsoft login is disabled.")
 
-def seed_form_templates():
-    """Insert form templates if they don't exist yet."""
+# Columns added to tables after they first shipped. db.create_all() only
+# creates missing tables, so databases from before a column existed get it
+# added here at startup (table -> {column: SQLite column definition}).
+ADDED_COLUMNS = {
+    "form_templates": {
+        "renderer": "VARCHAR(20) NOT NULL DEFAULT 'latex'",
+    },
+    "requests": {
+        "version": "INTEGER NOT NULL DEFAULT 1",
+    },
+    "approval_steps": {
+        "stage": "VARCHAR(80)",
+        "stage_mode": "VARCHAR(10) NOT NULL DEFAULT 'all'",
+        "claimed_by_id": "INTEGER REFERENCES users (id)",
+        "claim_expires_at": "DATETIME",
+        "version": "INTEGER NOT NULL DEFAULT 1",
+    },
+}
+
+def migrate_columns():
+    """
+    Add any ADDED_COLUMNS (and declared indexes) an existing database is
+    missing. Returns the (table, column) pairs added.
+    """
+    inspector = inspect(db.engine)
+    added = []
+    for table, columns in ADDED_COLUMNS.items():
+        present = {c["name"] for c in inspector.get_columns(table)}
+        for name, definition in columns.items():
+            if name not in present:
+                db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+                added.append((table, name))
+    db.session.commit()
+    # indexes declared on tables that already existed, e.g. ix_requests_requester_created
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    return added
+
+def seed_form_templates(added_columns=()):
+    """Insert form templates if they don't exist yet.
+
+    Templates that predate the ``renderer`` column (just added by
+    migrate_columns) take the renderer FORM_TEMPLATES gives them."""
     for f in FORM_TEMPLATES:
-        if not FormTemplate.query.filter_by(form_code=f["form_code"]).first():
+        template = FormTemplate.query.filter_by(form_code=f["form_code"]).first()
+        if not template:
             db.session.add(FormTemplate(**f))
+        elif ("form_templates", "renderer") in added_columns:
+            template.renderer = f.get("renderer", "latex")
     db.session.commit()
 
-def create_app():
-    """Application factory pattern for Flask app."""
+def backfill_work_queue():
+    """Populate the approver work queue once for databases created before it existed."""
+    if WorkQueueItem.query.first() is None and Request.query.filter_by(status="pending").first() is not None:
+        rebuild_work_queue()
+
+def backfill_approver_load():
+    """Populate the approver load counters once for databases created before they existed."""
+    if ApproverLoad.query.first() is None and ApprovalStep.query.filter_by(status="pending").first() is not None:
+        rebuild_load_counters()
+
+def backfill_request_events():
+    """Reconstruct the request event log once for databases created before it existed."""
+    if RequestEvent.query.first() is None and Request.query.filter(Request.submitted_at.isnot(None)).first() is not None:
+        backfill_events()
+
+def backfill_rollups():
+    """Build the turnaround analytics rollups once for databases created before they existed."""
+    if ApprovalRollup.query.first() is None and ApprovalStep.query.filter(ApprovalStep.actioned_at.isnot(None)).first() is not None:
+        rebuild_rollups()
+
+def create_app(config=None):
+    """Application factory pattern for Flask app.
+
+    ``config`` (optional dict) is applied on top of the defaults, e.g. to point
+    a benchmark or script at its own database.
+    """
     load_dotenv()
     app = Flask(__name__,
                 template_folder='ui/templates',
@@ -44,17 +125,46 @@ def create_app():
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     # Uploads
     app.config["UPLOAD_FOLDER"] = "uploads/signatures"
+    if config:
+        app.config.update(config)
     db.init_app(app)
+    # Latency / SQL / template / PDF timings on /metrics (+ X-Query-Count header in debug)
+    init_metrics(app)
+    # Per-request sampling profiles: admin ?_profile=1, or PROFILE_SAMPLE_RATE
+    init_profiler(app)
+    # Bounded render concurrency/queue, pdflatex time and memory limits (RENDER_* settings)
+    init_render_governor(app)
+    # Server-sent events for the approver dashboard, on LIVE_STREAM_PORT (started on first dashboard view)
+    init_live_stream(app)
 
     #Register existing blueprints
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(users_bp, url_prefix='/users')
     app.register_blueprint(approvals_bp, url_prefix='/approvals')
 
+    # Bulk JSONL import/export: `flask --app run export-requests` / `import-requests`
+    app.cli.add_command(export_requests_command)
+    app.cli.add_command(import_requests_command)
+    # Semester PDF bundles: `flask --app run archive-pdfs out.zip --form-code ...`
+    app.cli.add_command(archive_pdfs_command)
+    # Request history: `flask --app run audit-events log.jsonl --since ...` / `snapshot-timelines`
+    app.cli.add_command(audit_events_command)
+    app.cli.add_command(snapshot_timelines_command)
+    # Turnaround analytics: `flask --app run rebuild-analytics` / `prune-analytics` (hourly cells, nightly)
+    app.cli.add_command(rebuild_analytics_command)
+    app.cli.add_command(prune_analytics_command)
+    # Cold archive: `flask --app run archive-requests` (closed requests older than ARCHIVE_AFTER_DAYS)
+    app.cli.add_command(archive_requests_command)
+
     # Create tables and ensure upload directory when the app starts
     with app.app_context():
         db.create_all()
-        seed_form_templates()
+        added_columns = migrate_columns()
+        seed_form_templates(added_columns)
+        backfill_work_queue()
+        backfill_approver_load()
+        backfill_request_events()
+        backfill_rollups()
         # Ensure upload directory exists (relative to project root)
         base_dir = os.path.abspath(os.path.join(app.root_path, os.pardir, app.config["UPLOAD_FOLDER"]))
         os.makedirs(base_dir, exist_ok=True)
@@ -0,0 +1,499 @@
+# app/approvals/analytics.py
+"""
+Turnaround analytics: time to approve, return rates and backlog by form,
+approver, day or week, served from precomputed rollups.
+
+Every flush that moves work through the queue adds its deltas to the
+hourly, daily, weekly and monthly ApprovalRollup cells it touches (SQL-side
+increments in the same transaction, like the approver load counters):
+
+- a step entering an approver's queue counts as queued;
+- a step leaving it counts as dequeued, and an approval or return also adds
+  its wait (queue to decision) to the counters and to a histogram;
+- a request's final approval adds its turnaround (submit to approval).
+
+Durations go into fixed log-spaced buckets (BOUNDS, about 19% apart), so
+percentiles over any range of cells are a GROUP BY over the bucket counts
+and are accurate to within a bucket. Backlog at any point is queued minus
+dequeued up to it. A range is read from the coarsest cells that tile it
+(a year by form is twelve months of cells plus days at the ragged ends), so
+the report's cost follows the number of periods, not of steps.
+
+``flask --app run rebuild-analytics`` recomputes everything from the step
+rows in one pass (databases from before the rollups, bulk imports), and
+``flask --app run prune-analytics`` drops hourly cells older than
+HOURLY_DAYS; the coarser cells are kept.
+"""
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, bindparam, delete, event, func, insert, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models import (db, ApprovalRollup, ApprovalRollupBucket, ApprovalStep, FormTemplate, Request, User,
+                        WorkQueueItem)
+from app.approvals.work_queue import REBUILDING
+from app.approvals.archive import iter_archived
+
+BOUNDS = [60 * 2 ** (i / 4) for i in range(72)]  # seconds: 1 minute up to about 150 days
+HOURLY_DAYS = 35
+CHUNK_SIZE = 1000
+GRAINS = ("hour", "day", "week", "month")
+ALL = 0  # form_template_id / approver_id of the cells totalled over every form / approver
+GROUPS = ("form", "approver", "week", "day", "hour")
+_KEYS = ("grain", "period_start", "form_template_id", "approver_id")  # order of the cell tuples
+COUNTERS = ("queued", "dequeued", "approved", "returned", "wait_seconds", "completed", "turnaround_seconds")
+_DECIDED = ("approved", "returned", "rejected")
+
+
+def bucket(seconds: float) -> int:
+    return bisect_right(BOUNDS, seconds)
+
+
+def percentile(counts: Dict[int, int], q: float) -> Optional[float]:
+    """Estimated q-th percentile (0-100), in seconds, of a bucket histogram."""
+    total = sum(counts.values())
+    if not total:
+        return None
+    rank = q / 100 * total
+    seen = 0
+    for b in sorted(counts):
+        n = counts[b]
+        if n and seen + n >= rank:
+            frac = (rank - seen) / n
+            if b == 0:
+                return BOUNDS[0] * frac
+            if b >= len(BOUNDS):
+                return BOUNDS[-1]
+            lo, hi = BOUNDS[b - 1], BOUNDS[b]
+            return lo * (hi / lo) ** frac
+        seen += n
+    return BOUNDS[-1]
+
+
+def period(at: datetime, grain: str) -> datetime:
+    """Start of the ``grain`` period containing ``at`` (weeks start on Monday)."""
+    if grain == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    day = at.replace(hour=0, minute=0, second=0, microsecond=0)
+    if grain == "week":
+        return day - timedelta(days=day.weekday())
+    if grain == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _next(start: datetime, grain: str) -> datetime:
+    if grain == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(days=7)}[grain]
+
+
+class _Cells:
+    """
+    Counter and histogram deltas by rollup cell. Each change goes to its own
+    (form, approver) cell and, unless ``totals`` is off, to the form's, the
+    approver's and the overall total cells.
+    """
+
+    def __init__(self, grains: Iterable[str] = GRAINS, hourly_after: Optional[datetime] = None,
+                 totals: bool = True):
+        self.grains = tuple(grains)
+        self.hourly_after = hourly_after
+        self.totals = totals
+        self.counts: Dict[Tuple, Dict[str, float]] = {}
+        self.buckets: Dict[Tuple, int] = {}
+
+    def _keys(self, at: datetime, form_id: int, approver_id: int):
+        dims = [(form_id, approver_id)]
+        if self.totals:
+            dims += [(form_id, ALL), (ALL, approver_id), (ALL, ALL)]
+        for grain in self.grains:
+            if grain != "hour" or self.hourly_after is None or at >= self.hourly_after:
+                start = period(at, grain)
+                for f, a in dims:
+                    yield (grain, start, f, a)
+
+    def add(self, at: datetime, form_id: int, approver_id: int, **deltas) -> None:
+        for key in self._keys(at, form_id, approver_id):
+            cell = self.counts.setdefault(key, {})
+            for name, n in deltas.items():
+                cell[name] = cell.get(name, 0) + n
+
+    def observe(self, at: datetime, form_id: int, approver_id: int, metric: str, seconds: float) -> None:
+        b = bucket(seconds)
+        for key in self._keys(at, form_id, approver_id):
+            self.buckets[key + (metric, b)] = self.buckets.get(key + (metric, b), 0) + 1
+
+    def decided(self, at: datetime, form_id: int, approver_id: int, status: str, queued_at: datetime) -> None:
+        if status not in ("approved", "returned"):
+            self.add(at, form_id, approver_id, dequeued=1)
+            return
+        wait = max((at - queued_at).total_seconds(), 0.0)
+        self.add(at, form_id, approver_id, dequeued=1, wait_seconds=wait, **{status: 1})
+        self.observe(at, form_id, approver_id, "wait", wait)
+
+    def completed(self, at: datetime, form_id: int, approver_id: int, submitted_at: datetime) -> None:
+        turnaround = max((at - submitted_at).total_seconds(), 0.0)
+        self.add(at, form_id, approver_id, completed=1, turnaround_seconds=turnaround)
+        self.observe(at, form_id, approver_id, "turnaround", turnaround)
+
+    def _roll(self, targets) -> None:
+        """Add every cell into the cells ``targets(cell key)`` names."""
+        for key, deltas in list(self.counts.items()):
+            for target in targets(key):
+                cell = self.counts.setdefault(target, {})
+                for name, n in deltas.items():
+                    cell[name] = cell.get(name, 0) + n
+        for key, n in list(self.buckets.items()):
+            for target in targets(key[:4]):
+                self.buckets[target + key[4:]] = self.buckets.get(target + key[4:], 0) + n
+
+    def coarsen(self) -> None:
+        """Add the total cells, then the week and month cells, summed from (form, approver) hour and day cells."""
+        self._roll(lambda k: [(k[0], k[1], k[2], ALL), (k[0], k[1], ALL, k[3]), (k[0], k[1], ALL, ALL)])
+        starts: Dict[datetime, Tuple] = {}
+        for (grain, day, _, _) in self.counts:
+            if grain == "day" and day not in starts:
+                starts[day] = (("week", period(day, "week")), ("month", period(day, "month")))
+        self._roll(lambda k: [coarse + k[2:] for coarse in starts[k[1]]] if k[0] == "day" else [])
+
+
+# ----------------- Incremental maintenance -----------------
+
+@event.listens_for(Session, "after_flush")
+def _track_rollups(session, flush_context):
+    """Fold this flush's queue movements into the rollups (attribute history is still intact here)."""
+    if session.info.get(REBUILDING):
+        return  # rebuild_rollups recounts from the steps afterwards
+    now = datetime.utcnow()
+    cells = _Cells()
+    for obj in session.new:
+        if isinstance(obj, WorkQueueItem):
+            cells.add(obj.queued_at or now, obj.form_template_id, obj.approver_id, queued=1)
+    for obj in session.deleted:
+        if isinstance(obj, WorkQueueItem):
+            step = session.identity_map.get(session.identity_key(ApprovalStep, obj.step_id))
+            if step is not None and step.status in _DECIDED:
+                if step.approver_id != obj.approver_id:
+                    # decided by someone else (an admin): the step now names them, so the
+                    # queued count follows it, as rebuild_rollups would count it
+                    cells.add(obj.queued_at or now, obj.form_template_id, obj.approver_id, queued=-1)
+                    cells.add(obj.queued_at or now, obj.form_template_id, step.approver_id, queued=1)
+                cells.decided(step.actioned_at or now, obj.form_template_id, step.approver_id, step.status,
+                              obj.queued_at or now)
+            else:
+                cells.add(now, obj.form_template_id, obj.approver_id, dequeued=1)
+    for obj in session.dirty:
+        if isinstance(obj, WorkQueueItem):
+            history = inspect(obj).attrs.approver_id.history
+            if history.deleted and history.added:  # reassigned: moves to the other queue
+                cells.add(now, obj.form_template_id, history.deleted[0], dequeued=1)
+                cells.add(now, obj.form_template_id, history.added[0], queued=1)
+        elif isinstance(obj, Request) and obj.status == "approved" and obj.submitted_at:
+            history = inspect(obj).attrs.status.history
+            if history.added and "approved" not in (history.deleted or ()):
+                final = max((s for s in obj.approval_steps if s.actioned_at),
+                            key=lambda s: s.actioned_at, default=None)
+                if final is not None:
+                    cells.completed(final.actioned_at, obj.form_template_id, final.approver_id, obj.submitted_at)
+    if cells.counts or cells.buckets:
+        _apply(session, cells)
+
+
+def _increment(session, table, keys: Tuple[str, ...], names: Tuple[str, ...],
+               cells: Dict[Tuple, Dict[str, float]]) -> None:
+    """
+    Add each cell's deltas to its row of ``table``: one executemany UPDATE,
+    and when that missed some cells, one lookup and one INSERT for those.
+    """
+    c = table.c
+    params = [{**{f"k_{k}": v for k, v in zip(keys, key)}, **{f"d_{n}": deltas.get(n, 0) for n in names}}
+              for key, deltas in cells.items()]
+    stmt = (update(table)
+            .where(*(c[k] == bindparam(f"k_{k}") for k in keys))
+            .values({n: c[n] + bindparam(f"d_{n}") for n in names}))
+    if session.execute(stmt, params).rowcount == len(params):
+        return
+    # (an OR of key lookups rather than a row-value IN, which SQLite answers with a full scan)
+    found = set(session.execute(select(*(c[k] for k in keys))
+                                .where(or_(*(and_(*(c[k] == v for k, v in zip(keys, key))) for key in cells))))
+                .all())
+    missing = [{**dict(zip(keys, key)), **dict.fromkeys(names, 0), **deltas}
+               for key, deltas in cells.items() if key not in found]
+    session.execute(insert(table), missing)
+
+
+def _apply(session, cells: _Cells) -> None:
+    if cells.counts:
+        _increment(session, ApprovalRollup.__table__, _KEYS, COUNTERS, cells.counts)
+    if cells.buckets:
+        _increment(session, ApprovalRollupBucket.__table__, _KEYS + ("metric", "bucket"), ("count",),
+                   {key: {"count": n} for key, n in cells.buckets.items()})
+
+
+# ----------------- Rebuild -----------------
+
+def _replay(cells: _Cells, steps: List[Tuple]) -> None:
+    """
+    One request's step rows (request_id, sequence, status, approver_id,
+    actioned_at, form_template_id, submitted_at, request status), in
+    sequence order, as rollup deltas. Only what the rows still show is
+    recovered: approvals wiped by a return are gone.
+    """
+    _, _, _, _, _, form_id, submitted, req_status = steps[0]
+    queued_at = submitted
+    reachable = True  # every earlier stage is done
+    for _, stage in groupby(steps, key=itemgetter(1)):
+        stage = list(stage)
+        done = [s for s in stage if s[2] in _DECIDED and s[4]]
+        stage_end = max((s[4] for s in done), default=None)
+        for _, _, status, approver_id, actioned_at, _, _, _ in stage:
+            if status in _DECIDED and actioned_at:
+                cells.add(queued_at, form_id, approver_id, queued=1)
+                cells.decided(actioned_at, form_id, approver_id, status, queued_at)
+            elif status == "skipped" and stage_end:
+                cells.add(queued_at, form_id, approver_id, queued=1)
+                cells.add(stage_end, form_id, approver_id, dequeued=1)
+            elif status == "pending" and reachable and req_status == "pending":
+                cells.add(queued_at, form_id, approver_id, queued=1)
+        reachable = reachable and all(s[2] in ("approved", "skipped") for s in stage)
+        if stage_end:
+            queued_at = max(queued_at, stage_end)
+
+    if req_status == "approved":
+        final = max((s for s in steps if s[2] == "approved" and s[4]), key=itemgetter(4), default=None)
+        if final is not None:
+            cells.completed(final[4], form_id, final[3], submitted)
+
+
+def rebuild_rollups(hourly_days: int = HOURLY_DAYS, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Recompute the rollups from the request and step rows: one keyset pass
+    over the steps reading plain column tuples, then one over the archived
+    requests, aggregated in memory (the cells are bounded by periods x forms
+    x approvers; totals, weeks and months are summed from those) and written
+    back with two bulk inserts. Hourly cells only for the last
+    ``hourly_days``. Returns steps read.
+    """
+    cells = _Cells(("hour", "day"), hourly_after=datetime.utcnow() - timedelta(days=hourly_days), totals=False)
+    steps = (select(ApprovalStep.request_id, ApprovalStep.sequence, ApprovalStep.status, ApprovalStep.approver_id,
+                    ApprovalStep.actioned_at, Request.form_template_id, Request.submitted_at, Request.status)
+             .join(Request, Request.id == ApprovalStep.request_id)
+             .where(Request.submitted_at.isnot(None)))
+    read = 0
+    last_id = 0
+    while True:
+        ids = db.session.execute(select(Request.id)
+                                 .where(Request.id > last_id, Request.submitted_at.isnot(None))
+                                 .order_by(Request.id).limit(chunk_size)).scalars().all()
+        if not ids:
+            break
+        rows = db.session.execute(steps.where(ApprovalStep.request_id.between(ids[0], ids[-1]))
+                                  .order_by(ApprovalStep.request_id, ApprovalStep.sequence)).all()
+        for _, group in groupby(rows, key=itemgetter(0)):
+            _replay(cells, list(group))
+        read += len(rows)
+        last_id = ids[-1]
+    # closed requests moved out of the step table (see approvals.archive)
+    for chunk in iter_archived(chunk_size):
+        for req in chunk:
+            if not req["submitted_at"] or not req["steps"]:
+                continue
+            submitted = datetime.fromisoformat(req["submitted_at"])
+            rows = [(req["id"], s["sequence"], s["status"], s["approver_id"],
+                     datetime.fromisoformat(s["actioned_at"]) if s["actioned_at"] else None,
+                     req["form_template_id"], submitted, req["status"])
+                    for s in sorted(req["steps"], key=itemgetter("sequence"))]
+            _replay(cells, rows)
+            read += len(rows)
+    cells.coarsen()
+
+    db.session.execute(delete(ApprovalRollup.__table__))
+    db.session.execute(delete(ApprovalRollupBucket.__table__))
+    if cells.counts:
+        db.session.execute(insert(ApprovalRollup.__table__),
+                           [{**dict(zip(_KEYS, key)), **dict.fromkeys(COUNTERS, 0), **deltas}
+                            for key, deltas in cells.counts.items()])
+    if cells.buckets:
+        db.session.execute(insert(ApprovalRollupBucket.__table__),
+                           [dict(zip(_KEYS + ("metric", "bucket"), key), count=n)
+                            for key, n in cells.buckets.items()])
+    db.session.commit()
+    return read
+
+
+def prune_hourly(hourly_days: int = HOURLY_DAYS) -> int:
+    """Drop hourly cells from before the last ``hourly_days`` days. Returns rows deleted."""
+    cutoff = (datetime.utcnow() - timedelta(days=hourly_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    deleted = 0
+    for model in (ApprovalRollup, ApprovalRollupBucket):
+        deleted += db.session.execute(
+            delete(model.__table__).where(model.grain == "hour", model.period_start < cutoff)).rowcount
+    db.session.commit()
+    return deleted
+
+
+# ----------------- Report -----------------
+
+def _hours(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds / 3600, 2) if seconds is not None else None
+
+
+def _ranges(since: Optional[datetime], until: datetime, grain: str) -> List[Tuple]:
+    """
+    [since, until) as (grain, start, end) pieces: whole ``grain`` periods,
+    then weeks and days for the ragged ends. ``since`` None means from the
+    beginning. Both ends are day boundaries.
+    """
+    if grain in ("hour", "day"):
+        return [(grain, since, until)]
+    finer = "week" if grain == "month" else "day"
+    end = period(until, grain)
+    if since is None:
+        return [(grain, None, end)] + (_ranges(end, until, finer) if end < until else [])
+    start = period(since, grain)
+    if start < since:
+        start = _next(start, grain)
+    if start >= end:
+        return _ranges(since, until, finer)
+    pieces = [(grain, start, end)]
+    if since < start:
+        pieces += _ranges(since, start, finer)
+    if end < until:
+        pieces += _ranges(end, until, finer)
+    return pieces
+
+
+def _within(model, pieces: List[Tuple]):
+    return or_(*(and_(model.grain == grain,
+                      *([model.period_start >= start] if start is not None else []),
+                      model.period_start < end)
+                 for grain, start, end in pieces))
+
+
+def report(by: str = "form", since: Optional[datetime] = None, until: Optional[datetime] = None,
+           form_id: Optional[int] = None, approver_id: Optional[int] = None,
+           percentiles: Iterable[float] = (50, 90, 99)) -> List[Dict[str, Any]]:
+    """
+    Rows of counts, return rate, backlog and wait / turnaround percentiles
+    (hours) over [since, until), one per form, approver, week, day or hour
+    (``by``); the last year by default. Backlog is as of the end of the
+    row's period, or of the range for forms and approvers.
+    """
+    if by not in GROUPS:
+        raise ValueError(f"by must be one of {', '.join(GROUPS)}")
+    until = until or period(datetime.utcnow(), "day") + timedelta(days=1)
+    since = since or until - timedelta(days=365)
+    grain = {"form": "month", "approver": "month"}.get(by, by)
+
+    # the cells to read: one form's / approver's own when filtered, every
+    # form's / approver's when grouped by it, otherwise the total cells
+    if form_id is not None:
+        form_ids = [form_id]
+    elif by == "form":
+        form_ids = [f for (f,) in db.session.query(FormTemplate.id)]
+    else:
+        form_ids = [ALL]
+
+    if approver_id is not None:
+        approver_ids = [approver_id]
+    elif by == "approver":
+        approver_ids = [a for (a,) in db.session.query(ApprovalRollup.approver_id).distinct()
+                        .filter(ApprovalRollup.grain == "month", ApprovalRollup.form_template_id.in_(form_ids),
+                                ApprovalRollup.approver_id != ALL)]
+    else:
+        approver_ids = [ALL]
+
+    def scoped(model, pieces):
+        # (exact keys, so each combination is one seek plus its period range)
+        return [model.form_template_id.in_(form_ids), model.approver_id.in_(approver_ids), _within(model, pieces)]
+
+    def key_of(model):
+        return {"form": model.form_template_id, "approver": model.approver_id}.get(by, model.period_start)
+
+    def regroup(key):
+        # day cells at the ragged ends of a range of weeks belong to their week
+        return period(key, "week") if by == "week" else key
+
+    r, b = ApprovalRollup, ApprovalRollupBucket
+    pieces = _ranges(since, until, grain)
+    rows: Dict[Any, Dict[str, Any]] = {}
+    sums = (db.session.query(key_of(r), *(func.sum(getattr(r, c)) for c in COUNTERS))
+            .filter(*scoped(r, pieces))
+            .group_by(key_of(r)))
+    for key, *values in sums:
+        row = rows.setdefault(regroup(key), dict.fromkeys(COUNTERS, 0))
+        for name, value in zip(COUNTERS, values):
+            row[name] += value or 0
+    hists: Dict[Any, Dict[str, Dict[int, int]]] = {}
+    counts = (db.session.query(key_of(b), b.metric, b.bucket, func.sum(b.count))
+              .filter(*scoped(b, pieces))
+              .group_by(key_of(b), b.metric, b.bucket))
+    for key, metric, n_bucket, n in counts:
+        hist = hists.setdefault(regroup(key), {}).setdefault(metric, {})
+        hist[n_bucket] = hist.get(n_bucket, 0) + n
+
+    # backlog: everything queued minus everything dequeued up to the point in question
+    open_steps = func.sum(r.queued - r.dequeued)
+    if by in ("form", "approver"):
+        backlog = dict(db.session.query(key_of(r), open_steps)
+                       .filter(*scoped(r, _ranges(None, until, "month"))).group_by(key_of(r)))
+    else:
+        running = db.session.query(open_steps).filter(*scoped(r, _ranges(None, since, "month"))).scalar() or 0
+        backlog = {}
+        for key in sorted(rows):
+            running += rows[key]["queued"] - rows[key]["dequeued"]
+            backlog[key] = running
+
+    labels: Dict[Any, str] = {}
+    if by == "form":
+        labels = dict(db.session.query(FormTemplate.id, FormTemplate.name).filter(FormTemplate.id.in_(list(rows))))
+    elif by == "approver":
+        labels = dict(db.session.query(User.id, User.name).filter(User.id.in_(list(rows))))
+
+    out = []
+    for key in sorted(rows):
+        row, hist = rows[key], hists.get(key, {})
+        decided = row["approved"] + row["returned"]
+        out.append({
+            "key": key.isoformat() if isinstance(key, datetime) else key,
+            "label": labels.get(key) if by in ("form", "approver") else None,
+            "queued": row["queued"],
+            "approved": row["approved"],
+            "returned": row["returned"],
+            "return_rate": round(row["returned"] / decided, 4) if decided else None,
+            "completed": row["completed"],
+            "backlog": backlog.get(key, 0),
+            "wait_hours": dict(
+                mean=_hours(row["wait_seconds"] / decided) if decided else None,
+                **{f"p{q:g}": _hours(percentile(hist.get("wait", {}), q)) for q in percentiles}),
+            "turnaround_hours": dict(
+                mean=_hours(row["turnaround_seconds"] / row["completed"]) if row["completed"] else None,
+                **{f"p{q:g}": _hours(percentile(hist.get("turnaround", {}), q)) for q in percentiles}),
+        })
+    return out
+
+
+# ----------------- CLI -----------------
+
+@click.command("rebuild-analytics")
+@click.option("--hourly-days", type=int, default=HOURLY_DAYS, show_default=True)
+@click.option("--chunk-size", type=int, default=CHUNK_SIZE, show_default=True)
+@with_appcontext
+def rebuild_analytics_command(hourly_days, chunk_size):
+    """Recompute the turnaround rollups from the approval steps (after an import or restore)."""
+    click.echo(f"Rolled up {rebuild_rollups(hourly_days, chunk_size)} steps.")
+
+
+@click.command("prune-analytics")
+@click.option("--hourly-days", type=int, default=HOURLY_DAYS, show_default=True)
+@with_appcontext
+def prune_analytics_command(hourly_days):
+    """Drop hourly rollup cells older than --hourly-days (e.g. nightly); daily cells are kept."""
+    click.echo(f"Deleted {prune_hourly(hourly_days)} hourly rows.")
@@ -0,0 +1,208 @@
+# app/approvals/archive.py
+"""
+Cold archive for closed requests.
+
+Approved and rejected requests that haven't changed in ARCHIVE_AFTER_DAYS
+are moved out of requests / approval_steps into archived_requests: one row
+per request holding the columns My Requests lists and the request plus its
+steps as compressed JSON. The hot tables (and their indexes) then only grow
+with the requests still in play.
+
+    flask --app run archive-requests --older-than-days 365 --batch-size 200 --max-duty 0.2
+
+The mover works in keyset batches. Each batch is read and compressed
+first, then the archive insert and the deletes run in one short write
+transaction; afterwards the mover sleeps so that it spends at most
+``max_duty`` of its wall time holding the write lock, and a batch that
+took longer (because the database was busy) buys a longer pause. It is
+safe to run during the day and to interrupt: every batch is all or
+nothing, and a request changed underneath it is left for the next run.
+
+Archived requests stay readable: ``load_archived`` returns a read-only
+stand-in with the attributes the detail and preview views use. Events and
+timeline snapshots are not moved (they are keyed on the request id, which
+is kept), so history and ``audit-events`` see archived requests as before.
+"""
+import json
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models import db, ArchivedRequest, FormTemplate, Request, User
+
+ARCHIVE_AFTER_DAYS = 365
+BATCH_SIZE = 200
+MAX_DUTY = 0.2  # fraction of the mover's time spent in write transactions
+CHUNK_SIZE = 1000
+CLOSED = ("approved", "rejected")
+
+_stats_lock = threading.Lock()
+ARCHIVE_STATS = {
+    "archived": 0,   # requests moved to the archive
+    "conflicts": 0,  # batches rolled back because a request changed mid-move
+    "reads": 0,      # detail / preview views served from the archive
+}
+
+
+def _record(stat: str, n: int = 1) -> None:
+    with _stats_lock:
+        ARCHIVE_STATS[stat] += n
+
+
+# ----------------- Storage -----------------
+
+def pack(req: Request) -> bytes:
+    payload = dict(req.as_dict(), steps=[s.as_dict() for s in req.approval_steps])
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def unpack(blob: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(blob))
+
+
+def _archive_row(req: Request, now: datetime) -> Dict[str, Any]:
+    return {
+        "request_id": req.id,
+        "form_template_id": req.form_template_id,
+        "requester_id": req.requester_id,
+        "status": req.status,
+        "created_at": req.created_at,
+        "updated_at": req.updated_at,
+        "submitted_at": req.submitted_at,
+        "version": req.version,
+        "archived_at": now,
+        "payload": pack(req),
+    }
+
+
+def _dt(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+# ----------------- Mover -----------------
+
+def archive_closed(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = BATCH_SIZE,
+                   max_duty: float = MAX_DUTY, limit: Optional[int] = None) -> int:
+    """
+    Move approved / rejected requests last updated more than
+    ``older_than_days`` ago into the archive. Returns requests moved.
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    # SQLite hands out max(id) + 1 to the next insert, so the newest request
+    # stays put: moving it would let a new request reuse an archived id
+    newest = db.session.query(func.max(Request.id)).scalar() or 0
+    closed = (Request.status.in_(CLOSED), Request.updated_at < cutoff, Request.id < newest)
+
+    moved = 0
+    last_id = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        ids = db.session.execute(select(Request.id).where(Request.id > last_id, *closed)
+                                 .order_by(Request.id).limit(size)).scalars().all()
+        if not ids:
+            break
+        last_id = ids[-1]
+        batch = (Request.query.options(selectinload(Request.approval_steps))
+                 .filter(Request.id.in_(ids), *closed).all())
+        # compress before taking the write lock
+        rows = [_archive_row(r, now) for r in batch]
+
+        started = time.monotonic()
+        try:
+            db.session.execute(insert(ArchivedRequest.__table__), rows)
+            for r in batch:
+                db.session.delete(r)  # steps go with it; approver load counters follow
+            db.session.commit()
+        except (StaleDataError, IntegrityError):
+            # changed (or archived by another mover) since it was read; next run
+            db.session.rollback()
+            _record("conflicts")
+            continue
+        finally:
+            # drop the chunk from the identity map so memory stays flat
+            db.session.expunge_all()
+        held = time.monotonic() - started
+        moved += len(rows)
+        _record("archived", len(rows))
+        time.sleep(held * (1 - max_duty) / max_duty)
+    return moved
+
+
+# ----------------- Reads -----------------
+
+def load_archived(request_id: int) -> Optional[SimpleNamespace]:
+    """
+    Read-only stand-in for an archived Request (None if it isn't archived),
+    with its form template, requester and steps' approvers attached.
+    """
+    row = db.session.get(ArchivedRequest, request_id)
+    if row is None:
+        return None
+    _record("reads")
+    return stand_in(unpack(row.payload))
+
+
+def stand_in(data: Dict[str, Any]) -> SimpleNamespace:
+    """``load_archived``'s stand-in, built from an unpacked payload."""
+    approvers = {u.id: u for u in User.query.filter(User.id.in_({s["approver_id"] for s in data["steps"]}))}
+    steps = [SimpleNamespace(**dict(s, actioned_at=_dt(s["actioned_at"]),
+                                    claim_expires_at=_dt(s["claim_expires_at"]),
+                                    approver=approvers.get(s["approver_id"])))
+             for s in sorted(data["steps"], key=lambda s: s["sequence"])]
+    return SimpleNamespace(**dict(data, created_at=_dt(data["created_at"]),
+                                  updated_at=_dt(data["updated_at"]),
+                                  submitted_at=_dt(data["submitted_at"]),
+                                  form_template=db.session.get(FormTemplate, data["form_template_id"]),
+                                  requester=db.session.get(User, data["requester_id"]),
+                                  approval_steps=steps))
+
+
+def archived_version(request_id: int) -> Optional[int]:
+    return db.session.query(ArchivedRequest.version).filter(ArchivedRequest.request_id == request_id).scalar()
+
+
+def iter_archived(chunk_size: int = CHUNK_SIZE, where: Iterable = ()) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Unpacked archived requests (as in ``unpack``) in id-ordered chunks,
+    optionally only those matching ``where`` (criteria on ArchivedRequest).
+    """
+    last_id = 0
+    while True:
+        rows = db.session.execute(select(ArchivedRequest.request_id, ArchivedRequest.payload)
+                                  .where(ArchivedRequest.request_id > last_id, *where)
+                                  .order_by(ArchivedRequest.request_id).limit(chunk_size)).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [unpack(blob) for _, blob in rows]
+
+
+# ----------------- CLI -----------------
+
+@click.command("archive-requests")
+@click.option("--older-than-days", type=int, default=None,
+              help=f"Closed requests untouched for this long (default: ARCHIVE_AFTER_DAYS, {ARCHIVE_AFTER_DAYS}).")
+@click.option("--batch-size", type=int, default=BATCH_SIZE, show_default=True)
+@click.option("--max-duty", type=click.FloatRange(0.01, 1.0), default=MAX_DUTY, show_default=True,
+              help="Share of the time spent holding the write lock; the mover sleeps the rest.")
+@click.option("--limit", type=int, default=None, help="Stop after this many requests.")
+@with_appcontext
+def archive_requests_command(older_than_days, batch_size, max_duty, limit):
+    """Move old approved / rejected requests into the compressed archive table."""
+    if older_than_days is None:
+        older_than_days = current_app.config.get("ARCHIVE_AFTER_DAYS", ARCHIVE_AFTER_DAYS)
+    started = time.monotonic()
+    moved = archive_closed(older_than_days, batch_size, max_duty, limit)
+    click.echo(f"Archived {moved} requests in {time.monotonic() - started:.1f}s.")
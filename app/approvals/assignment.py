@@ -0,0 +1,103 @@
+# app/approvals/assignment.py
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from sqlalchemy import func
+
+from app.models import db, ApproverLoad, ApprovalStep
+
+STRATEGIES = ("least_loaded", "weighted_round_robin")
+DEFAULT_STRATEGY = "least_loaded"
+
+# pool key -> {user_id: current weight}; smooth weighted round-robin state
+_wrr_state: Dict[tuple, Dict[int, int]] = {}
+_wrr_lock = threading.Lock()
+
+
+def load_counters(user_ids: Iterable[int]) -> Dict[int, ApproverLoad]:
+    """ApproverLoad rows for these users, in one query (no autoflush)."""
+    ids = list(user_ids)
+    if not ids:
+        return {}
+    with db.session.no_autoflush:
+        rows = ApproverLoad.query.filter(ApproverLoad.user_id.in_(ids)).all()
+    return {l.user_id: l for l in rows}
+
+
+def available(candidates: List[int], loads: Dict[int, ApproverLoad], now: datetime = None) -> List[int]:
+    """Candidates who aren't out of office."""
+    now = now or datetime.utcnow()
+    return [uid for uid in candidates
+            if not (uid in loads and loads[uid].away_until and loads[uid].away_until > now)]
+
+
+def _least_loaded(candidates, n, loads, pending):
+    def key(uid):
+        load = loads.get(uid)
+        open_steps = (load.open_steps if load else 0) + pending.get(uid, 0)
+        weight = max(load.weight if load else 1, 1)
+        return (open_steps / weight, uid)
+    return sorted(candidates, key=key)[:n]
+
+
+def _weighted_round_robin(pool_key, candidates, n, loads):
+    weights = {uid: max(loads[uid].weight if uid in loads else 1, 1) for uid in candidates}
+    total = sum(weights.values())
+    chosen = []
+    with _wrr_lock:
+        current = _wrr_state.setdefault(pool_key, {})
+        for _ in range(min(n, len(candidates))):
+            for uid in candidates:
+                current[uid] = current.get(uid, 0) + weights[uid]
+            best = max((uid for uid in candidates if uid not in chosen), key=lambda uid: (current[uid], -uid))
+            current[best] -= total
+            chosen.append(best)
+    return chosen
+
+
+def assign(candidates: List[int], n: int = 1, strategy: str = DEFAULT_STRATEGY,
+           pool_key: tuple = (), pending: Dict[int, int] = None,
+           loads: Dict[int, ApproverLoad] = None) -> List[int]:
+    """
+    Pick up to ``n`` distinct approvers from ``candidates`` using the live
+    ApproverLoad counters, skipping anyone who is out of office. Submission,
+    resubmission and bulk paths all assign through here.
+
+    ``pending`` counts steps already handed out earlier in the same
+    transaction (not yet reflected in the counters), so several picks for one
+    submission still spread out; ``loads`` lets a caller that assigns several
+    stages prefetch the counters once. Returns [] if nobody is available.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown assignment strategy {strategy!r}")
+    if not candidates or n <= 0:
+        return []
+    if loads is None:
+        loads = load_counters(candidates)
+    pool = available(candidates, loads)
+    if not pool:
+        return []
+    pending = pending if pending is not None else {}
+    if strategy == "weighted_round_robin":
+        chosen = _weighted_round_robin(pool_key, pool, n, loads)
+    else:
+        chosen = _least_loaded(pool, n, loads, pending)
+    for uid in chosen:
+        pending[uid] = pending.get(uid, 0) + 1
+    return chosen
+
+
+def rebuild_load_counters() -> int:
+    """Recount open steps for every approver from approval_steps. Returns approvers touched."""
+    counts = dict(db.session.query(ApprovalStep.approver_id, func.count(ApprovalStep.id))
+                  .filter(ApprovalStep.status == "pending")
+                  .group_by(ApprovalStep.approver_id)
+                  .all())
+    loads = {l.user_id: l for l in ApproverLoad.query.all()}
+    for user_id, load in loads.items():
+        load.open_steps = counts.pop(user_id, 0)
+    for user_id, count in counts.items():
+        db.session.add(ApproverLoad(user_id=user_id, open_steps=count))
+    db.session.commit()
+    return len(loads) + len(counts)
@@ -0,0 +1,197 @@
+# app/approvals/drafts.py
+"""
+Draft autosave: JSON-patch deltas applied to a draft's form_data_json.
+
+The form page sends small RFC 6902 patches (add / replace / remove / test
+on ``/field`` or ``/field/<index>``) tagged with the draft version it last
+saw, debounced in the browser so a burst of typing is one patch. Each
+patch is applied and written straight away as an ordinary version-checked
+UPDATE (the version bump invalidates cached views as usual), so nothing
+acknowledged lives only in one process's memory and every worker sees
+the same draft.
+
+The reply carries the new version for the next patch. A full save, a
+submit or any other change to the draft moves the version on, and the
+next patch gets a conflict with the current data to start again from.
+"""
+import copy
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models import db, Request
+from app.approvals.history import changed_fields, record_event
+from app.utils.form_schema import get_schema
+
+MAX_OPS = 200
+MAX_TEXT = 20000
+
+_stats_lock = threading.Lock()
+AUTOSAVE_STATS = {
+    "patches": 0,    # PATCH requests applied
+    "ops": 0,        # operations in them, after coalescing
+    "coalesced": 0,  # operations dropped because a later one overwrote them
+    "writes": 0,     # UPDATEs written
+    "conflicts": 0,  # version mismatches sent back to the client
+}
+
+
+def _record(stat: str, n: int = 1) -> None:
+    with _stats_lock:
+        AUTOSAVE_STATS[stat] += n
+
+
+class PatchError(ValueError):
+    """The patch is malformed, names an unknown field, or a ``test`` failed."""
+
+
+class DraftConflict(Exception):
+    """The draft moved on (or stopped being a draft) since the client's version."""
+
+    def __init__(self, version: Optional[int], form_data: Optional[Dict[str, Any]]):
+        super().__init__("draft version conflict")
+        self.version = version
+        self.form_data = form_data
+
+
+# ----------------- JSON patch -----------------
+
+def _split(path: Any):
+    """'/field' -> (field, None); '/field/3' or '/field/-' -> (field, '3' / '-')."""
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise PatchError(f"bad path: {path!r}")
+    parts = [p.replace("~1", "/").replace("~0", "~") for p in path[1:].split("/")]
+    if len(parts) > 2 or not parts[0]:
+        raise PatchError(f"unsupported path: {path}")
+    return parts[0], parts[1] if len(parts) == 2 else None
+
+
+def coalesce(ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Drop operations whose result a later operation overwrites: anything on
+    ``/field`` or ``/field/...`` before a later whole-field add, replace or
+    remove. A ``test`` on a field keeps everything before it.
+    """
+    keep: List[Dict[str, Any]] = []
+    overwritten = set()
+    for op in reversed(ops):
+        field, index = _split(op.get("path"))
+        if op.get("op") == "test":
+            overwritten.discard(field)
+        elif field in overwritten:
+            continue
+        elif index is None:
+            overwritten.add(field)
+        keep.append(op)
+    keep.reverse()
+    return keep
+
+
+def _check_value(spec, value: Any, item: bool = False) -> Any:
+    if spec.kind == "multi" and not item:
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise PatchError(f"{spec.key}: expected a list of strings")
+        return list(value)
+    if not isinstance(value, str) and value is not None:
+        raise PatchError(f"{spec.key}: expected a string")
+    if value is not None and len(value) > MAX_TEXT:
+        raise PatchError(f"{spec.key}: value too long")
+    return value
+
+
+def apply_patch(data: Dict[str, Any], ops: List[Dict[str, Any]], schema) -> Dict[str, Any]:
+    """``data`` with ``ops`` applied (``data`` itself is left alone); raises PatchError."""
+    if not isinstance(ops, list) or len(ops) > MAX_OPS:
+        raise PatchError(f"patch must be a list of at most {MAX_OPS} operations")
+    out = copy.deepcopy(data)
+    for op in ops:
+        if not isinstance(op, dict):
+            raise PatchError("each operation must be an object")
+        kind = op.get("op")
+        field, index = _split(op.get("path"))
+        spec = schema.by_key.get(field)
+        if spec is None or spec.kind in ("file", "auto_date"):
+            raise PatchError(f"{field}: not an editable field")
+
+        if index is None:
+            if kind in ("add", "replace"):
+                out[field] = _check_value(spec, op.get("value"))
+            elif kind == "remove":
+                out.pop(field, None)
+            elif kind == "test":
+                if out.get(field) != op.get("value"):
+                    raise PatchError(f"test failed: {field}")
+            else:
+                raise PatchError(f"unsupported op: {kind}")
+            continue
+
+        # /field/<n> and /field/- address items of a multi-choice field
+        if spec.kind != "multi":
+            raise PatchError(f"{field}: not a list")
+        items = out.get(field)
+        if not isinstance(items, list):
+            items = out[field] = []
+        if index == "-" and kind == "add":
+            items.append(_check_value(spec, op.get("value"), item=True))
+            continue
+        if not index.isdigit() or int(index) > len(items) or (kind != "add" and int(index) == len(items)):
+            raise PatchError(f"{field}: bad index {index}")
+        i = int(index)
+        if kind == "add":
+            items.insert(i, _check_value(spec, op.get("value"), item=True))
+        elif kind == "replace":
+            items[i] = _check_value(spec, op.get("value"), item=True)
+        elif kind == "remove":
+            del items[i]
+        elif kind == "test":
+            if items[i] != op.get("value"):
+                raise PatchError(f"test failed: {field}/{i}")
+        else:
+            raise PatchError(f"unsupported op: {kind}")
+    return out
+
+
+# ----------------- Writes -----------------
+
+def _conflict(req: Optional[Request]) -> DraftConflict:
+    _record("conflicts")
+    if req is None or req.status != "draft":
+        return DraftConflict(None, None)
+    return DraftConflict(req.version, req.form_data_json)
+
+
+def patch_draft(request_id: int, owner_id: int, version: Any, ops: List[Dict[str, Any]]) -> int:
+    """
+    Apply ``ops`` to the draft as of ``version`` and commit; returns the
+    version the client should send next. Raises LookupError (not the
+    owner's request), PatchError or DraftConflict.
+    """
+    if not isinstance(ops, list) or not all(isinstance(op, dict) for op in ops):
+        raise PatchError("patch must be a list of operations")
+    req = db.session.get(Request, request_id)
+    if req is None or req.requester_id != owner_id:
+        raise LookupError(request_id)
+    if req.status != "draft" or req.version != version:
+        raise _conflict(req)
+
+    coalesced = coalesce(ops)
+    data = apply_patch(req.form_data_json or {}, coalesced, get_schema(req.form_template))
+    _record("patches")
+    _record("ops", len(coalesced))
+    _record("coalesced", len(ops) - len(coalesced))
+    if data == (req.form_data_json or {}):
+        return req.version  # nothing to write (e.g. only ``test`` ops)
+
+    fields = changed_fields(req.form_data_json, data)
+    req.form_data_json = data
+    if fields:
+        record_event(req, "edited", actor=req.requester, fields=fields, autosave=True)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        # a full save or another tab's patch got there first
+        db.session.rollback()
+        raise _conflict(db.session.get(Request, request_id))
+    _record("writes")
+    return req.version
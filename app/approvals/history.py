@@ -0,0 +1,263 @@
+# app/approvals/history.py
+"""
+Request history: the append-only event log and the timelines built from it.
+
+Routes call ``record_event`` next to the change it describes and before
+their commit, so the event and the change land (or roll back) together.
+Event rows are never updated or deleted; the session refuses to flush
+either.
+
+The detail page's timeline is folded from the events. Every SNAPSHOT_EVERY
+events, the writer folds the request's tail into its RequestTimeline row in
+the same transaction, so a read is one primary-key lookup plus at most that
+many events. ``flask --app run snapshot-timelines`` does the same in bulk,
+and ``flask --app run audit-events`` streams a date range of events (indexed
+on time) as JSON lines.
+"""
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, event, insert, or_
+from sqlalchemy.orm import Session, joinedload
+
+from app.models import db, ApprovalStep, Request, RequestEvent, RequestTimeline, User
+
+EVENT_KINDS = ("submitted", "approved", "returned", "rejected", "edited")
+SNAPSHOT_EVERY = 8
+CHUNK_SIZE = 1000
+
+
+@event.listens_for(Session, "before_flush")
+def _refuse_event_changes(session, flush_context, instances):
+    for obj in session.deleted:
+        if isinstance(obj, RequestEvent):
+            raise RuntimeError(f"request_events is append-only (delete of event {obj.id})")
+    for obj in session.dirty:
+        if isinstance(obj, RequestEvent) and session.is_modified(obj):
+            raise RuntimeError(f"request_events is append-only (update of event {obj.id})")
+
+
+def changed_fields(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> List[str]:
+    before, after = before or {}, after or {}
+    return sorted(k for k in set(before) | set(after) if before.get(k) != after.get(k))
+
+
+def record_event(req: Request, kind: str, actor: Optional[User] = None, step: Optional[ApprovalStep] = None,
+                 **data) -> RequestEvent:
+    """Add an event for ``req`` to the session; the caller commits it with the change it describes."""
+    if kind not in EVENT_KINDS:
+        raise ValueError(f"unknown event kind: {kind}")
+    if req.id is None:
+        db.session.flush()
+    ev = RequestEvent(
+        request_id=req.id,
+        kind=kind,
+        actor_id=actor.id if actor else None,
+        actor_name=actor.name if actor else None,
+        step_id=step.id if step else None,
+        sequence=step.sequence if step else None,
+        at=datetime.utcnow(),
+        data={k: v for k, v in data.items() if v is not None} or None,
+    )
+    db.session.add(ev)
+
+    snap = db.session.get(RequestTimeline, req.id)
+    if snap is None:
+        snap = RequestTimeline(request_id=req.id, last_event_id=0, tail_count=0, entries=[])
+        db.session.add(snap)
+    snap.tail_count += 1
+    if snap.tail_count >= SNAPSHOT_EVERY:
+        db.session.flush()  # gives the new event its id
+        _fold_tail(snap)
+    return ev
+
+
+# ----------------- Timelines -----------------
+
+def _entry(ev: RequestEvent) -> Dict[str, Any]:
+    return {
+        "at": ev.at.strftime("%Y-%m-%d %H:%M") if ev.at else "",
+        "event": ev.kind.upper(),
+        "by": ev.actor_name or "System",
+        "actor_id": ev.actor_id,
+        "step": ev.sequence,
+        "comments": (ev.data or {}).get("comments"),
+    }
+
+
+def fold(entries: List[Dict[str, Any]], events: List[RequestEvent]) -> List[Dict[str, Any]]:
+    """
+    ``entries`` followed by ``events`` as display entries. A run of edits by
+    the same person (autosave writes one every few seconds) is one entry
+    with the time of the last edit and a count.
+    """
+    out = list(entries)
+    for ev in events:
+        last = out[-1] if out else None
+        if ev.kind == "edited" and last and last["event"] == "EDITED" and last["actor_id"] == ev.actor_id:
+            out[-1] = dict(last, at=_entry(ev)["at"], count=last.get("count", 1) + 1)
+        else:
+            out.append(_entry(ev))
+    return out
+
+
+def _tail(request_id: int, after_id: int) -> List[RequestEvent]:
+    return (RequestEvent.query
+            .filter(RequestEvent.request_id == request_id, RequestEvent.id > after_id)
+            .order_by(RequestEvent.id)
+            .all())
+
+
+def _fold_tail(snap: RequestTimeline) -> None:
+    tail = _tail(snap.request_id, snap.last_event_id)
+    if tail:
+        snap.entries = fold(snap.entries or [], tail)
+        snap.last_event_id = tail[-1].id
+    snap.tail_count = 0
+
+
+def timeline(request_id: int) -> List[Dict[str, Any]]:
+    """The request's timeline: its snapshot plus the events after it."""
+    snap = db.session.get(RequestTimeline, request_id)
+    if snap is None:
+        return fold([], _tail(request_id, 0))
+    return fold(snap.entries or [], _tail(request_id, snap.last_event_id))
+
+
+def snapshot_timelines(chunk_size: int = CHUNK_SIZE) -> int:
+    """Fold every request's outstanding events into its snapshot. Returns snapshots written."""
+    behind = (db.session.query(RequestEvent.request_id)
+              .outerjoin(RequestTimeline, RequestTimeline.request_id == RequestEvent.request_id)
+              .filter(or_(RequestTimeline.request_id.is_(None),
+                          RequestEvent.id > RequestTimeline.last_event_id))
+              .distinct())
+    written = 0
+    last_id = 0
+    while True:
+        ids = [rid for (rid,) in behind.filter(RequestEvent.request_id > last_id)
+               .order_by(RequestEvent.request_id).limit(chunk_size)]
+        if not ids:
+            break
+        snaps = {s.request_id: s for s in RequestTimeline.query.filter(RequestTimeline.request_id.in_(ids))}
+        for rid in ids:
+            snap = snaps.get(rid)
+            if snap is None:
+                snap = RequestTimeline(request_id=rid, last_event_id=0, tail_count=0, entries=[])
+                db.session.add(snap)
+            _fold_tail(snap)
+        db.session.commit()
+        written += len(ids)
+        last_id = ids[-1]
+    return written
+
+
+# ----------------- Backfill -----------------
+
+def backfill_events(chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Reconstruct events from the request and step rows for requests that have
+    none (databases from before the log, bulk imports). Only what the rows
+    still show can be recovered. Returns events written.
+    """
+    has_events = db.session.query(RequestEvent.id).filter(RequestEvent.request_id == Request.id).exists()
+    written = 0
+    last_id = 0
+    while True:
+        batch = (Request.query
+                 .filter(Request.id > last_id, ~has_events)
+                 .options(joinedload(Request.requester),
+                          joinedload(Request.approval_steps).joinedload(ApprovalStep.approver))
+                 .order_by(Request.id)
+                 .limit(chunk_size)
+                 .all())
+        if not batch:
+            break
+        rows = []
+        for req in batch:
+            events = []
+            if req.submitted_at:
+                events.append({"kind": "submitted", "actor_id": req.requester_id,
+                               "actor_name": req.requester.name if req.requester else None,
+                               "step_id": None, "sequence": None, "at": req.submitted_at,
+                               "data": {"backfilled": True}})
+            for s in req.approval_steps:
+                if s.status in ("approved", "returned", "rejected") and s.actioned_at:
+                    events.append({"kind": s.status, "actor_id": s.approver_id,
+                                   "actor_name": s.approver.name if s.approver else None,
+                                   "step_id": s.id, "sequence": s.sequence, "at": s.actioned_at,
+                                   "data": {"backfilled": True, "comments": s.comments}})
+            rows.extend(dict(e, request_id=req.id) for e in sorted(events, key=lambda e: e["at"]))
+        if rows:
+            db.session.execute(insert(RequestEvent.__table__), rows)
+        db.session.commit()
+        written += len(rows)
+        last_id = batch[-1].id
+    return written
+
+
+# ----------------- Audits -----------------
+
+def iter_events(since: Optional[datetime] = None, until: Optional[datetime] = None, kind: Optional[str] = None,
+                actor_id: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Events in [since, until) in time order, optionally of one kind or by one person (keyset paging)."""
+    query = RequestEvent.query
+    if since:
+        query = query.filter(RequestEvent.at >= since)
+    if until:
+        query = query.filter(RequestEvent.at < until)
+    if kind:
+        query = query.filter(RequestEvent.kind == kind)
+    if actor_id is not None:
+        query = query.filter(RequestEvent.actor_id == actor_id)
+    last = None
+    while True:
+        page = query
+        if last is not None:
+            page = page.filter(or_(RequestEvent.at > last.at,
+                                   and_(RequestEvent.at == last.at, RequestEvent.id > last.id)))
+        batch = page.order_by(RequestEvent.at, RequestEvent.id).limit(chunk_size).all()
+        if not batch:
+            return
+        for ev in batch:
+            yield ev.as_dict()
+        last = batch[-1]
+        # drop the chunk from the identity map so memory stays flat
+        db.session.expunge_all()
+
+
+def _date(value: Optional[str]) -> Optional[datetime]:
+    return datetime.strptime(value, "%Y-%m-%d") if value else None
+
+
+@click.command("snapshot-timelines")
+@click.option("--chunk-size", type=int, default=CHUNK_SIZE, show_default=True)
+@with_appcontext
+def snapshot_timelines_command(chunk_size):
+    """Fold outstanding request events into the timeline snapshots (e.g. nightly, or after an import)."""
+    click.echo(f"Updated {snapshot_timelines(chunk_size)} timelines.")
+
+
+@click.command("audit-events")
+@click.argument("output", type=click.File("w", encoding="utf-8"), default="-")
+@click.option("--since", default=None, help="On or after YYYY-MM-DD.")
+@click.option("--until", default=None, help="On or before YYYY-MM-DD.")
+@click.option("--kind", type=click.Choice(EVENT_KINDS), default=None)
+@click.option("--actor", default=None, help="Only this user's actions (email).")
+@with_appcontext
+def audit_events_command(output, since, until, kind, actor):
+    """Write request events in a date range to OUTPUT as JSON lines, oldest first."""
+    actor_id = None
+    if actor:
+        user = User.query.filter(db.func.lower(User.email) == actor.lower()).first()
+        if user is None:
+            raise click.ClickException(f"No user with email {actor}.")
+        actor_id = user.id
+    until_dt = _date(until) + timedelta(days=1) if until else None
+    n = 0
+    for ev in iter_events(_date(since), until_dt, kind, actor_id):
+        output.write(json.dumps(ev) + "\n")
+        n += 1
+    click.echo(f"{n} events.", err=True)
@@ -0,0 +1,154 @@
+# app/approvals/idempotency.py
+"""
+Idempotent form POSTs.
+
+Forms carry a one-time ``idempotency_key`` (``{{ idempotency_field() }}``).
+The first POST with a key claims it in idempotency_keys before doing any
+work; when the view answers with a redirect, the redirect target and the
+messages it flashed are stored against the key. A repeat of that POST
+(double-click, browser retry) gets the stored redirect and flashes back
+without touching the database or the renderer again. If the first one is
+still running, the repeat waits up to IDEMPOTENCY_WAIT seconds for it.
+
+Anything other than a redirect (e.g. the form re-rendered with errors), or
+a view that calls ``allow_retry()`` (e.g. the renderer was busy), releases
+the key, so trying again works as before. POSTs without a key are passed
+through untouched.
+"""
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, flash, g, redirect, request, session, url_for
+from markupsafe import Markup
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, IdempotencyKey
+
+FIELD = "idempotency_key"
+TTL = timedelta(hours=1)
+WAIT = 5.0  # seconds a repeat waits for the original to finish
+POLL = 0.1
+
+_stats_lock = threading.Lock()
+IDEMPOTENCY_STATS = {
+    "first": 0,     # key claimed, view ran
+    "replayed": 0,  # repeat answered from the stored result
+    "in_flight": 0, # repeat gave up waiting for the original
+    "released": 0,  # not a redirect, or allow_retry(); key freed
+}
+
+
+def _record(stat: str) -> None:
+    with _stats_lock:
+        IDEMPOTENCY_STATS[stat] += 1
+
+
+def idempotency_field() -> Markup:
+    """Hidden input with a fresh key, for templates."""
+    return Markup(f'<input type="hidden" name="{FIELD}" value="{uuid.uuid4().hex}">')
+
+
+def allow_retry() -> None:
+    """Don't store this response; a repeat of the POST should run the view again."""
+    g.idempotency_retry = True
+
+
+def _owner() -> str:
+    user = session.get("user") or {}
+    return (user.get("preferred_username") or user.get("email") or "").lower()
+
+
+def _claim(key: str, owner: str, endpoint: str):
+    """The new pending row, or None if the key was already used."""
+    now = datetime.utcnow()
+    ttl = current_app.config.get("IDEMPOTENCY_TTL", TTL)
+    # clear out expired keys on the way (indexed on expires_at)
+    IdempotencyKey.query.filter(IdempotencyKey.expires_at < now).delete(synchronize_session=False)
+    row = IdempotencyKey(key=key, owner=owner, endpoint=endpoint, status="pending",
+                         created_at=now, expires_at=now + ttl)
+    db.session.add(row)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return row
+
+
+def _wait_for(key: str, owner: str, endpoint: str):
+    """The finished row for a repeated key, or None if it's still in flight (or not ours)."""
+    deadline = time.monotonic() + current_app.config.get("IDEMPOTENCY_WAIT", WAIT)
+    while True:
+        row = db.session.get(IdempotencyKey, key)
+        if row is None or row.owner != owner or row.endpoint != endpoint:
+            return None
+        if row.status == "done":
+            return row
+        if time.monotonic() >= deadline:
+            return None
+        db.session.rollback()  # end the read transaction so the next poll sees the commit
+        time.sleep(POLL)
+
+
+def _release(key: str) -> None:
+    db.session.rollback()
+    IdempotencyKey.query.filter_by(key=key).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def idempotent(fallback_endpoint: str):
+    """
+    Make a view's POSTs idempotent per form key. ``fallback_endpoint`` is
+    where a repeat lands if the original is still running when it gives up
+    waiting (with whichever of the view's URL arguments it takes).
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = request.form.get(FIELD) if request.method == "POST" else None
+            owner = _owner()
+            if not key or not owner:
+                return f(*args, **kwargs)
+            # the same form can Save Draft and then Submit; each is its own action
+            key = f"{key[:40]}:{request.form.get('action', '')}"[:64]
+
+            row = _claim(key, owner, request.endpoint)
+            if row is None:
+                done = _wait_for(key, owner, request.endpoint)
+                if done is None:
+                    _record("in_flight")
+                    flash("This was already submitted and is still being processed.", "info")
+                    rule = next(current_app.url_map.iter_rules(fallback_endpoint))
+                    return redirect(url_for(fallback_endpoint,
+                                            **{k: v for k, v in kwargs.items() if k in rule.arguments}))
+                _record("replayed")
+                for category, message in done.flashes or []:
+                    flash(message, category)
+                return redirect(done.location)
+
+            _record("first")
+            flashed = len(session.get("_flashes", []))
+            try:
+                response = f(*args, **kwargs)
+            except Exception:
+                _release(key)
+                raise
+            status = getattr(response, "status_code", None)
+            if status not in (301, 302, 303) or g.pop("idempotency_retry", False):
+                _record("released")
+                _release(key)
+                return response
+
+            db.session.rollback()  # the view has committed its own work
+            row = db.session.get(IdempotencyKey, key)
+            if row is not None:
+                row.status = "done"
+                row.location = response.location
+                row.flashes = [list(m) for m in session.get("_flashes", [])[flashed:]]
+                db.session.commit()
+            return response
+        return wrapper
+    return decorator
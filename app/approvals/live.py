@@ -0,0 +1,456 @@
+# app/approvals/live.py
+"""
+Live approver dashboard: work-queue changes pushed over server-sent events.
+
+Every commit that changes the work queue publishes what changed to BUS,
+an in-process event bus. Changes are noted in after_flush and published
+in after_commit, so a rolled-back approval never reaches anyone. Events:
+
+    pending   a step became actionable (a row for the dashboard)
+    claimed   an approver took the lease on a pending step
+    approved  a step was approved and left the queue
+    returned  a step was returned and left the queue
+    removed   a step left the queue for another reason (skipped, withdrawn)
+
+The stream is served by a small asyncio server on its own thread and port
+(LIVE_STREAM_PORT, default 5002), not by the WSGI server. An idle
+dashboard is then an open socket and a small queue on one event loop
+rather than a worker thread, so thousands of them cost next to nothing.
+It authenticates with the Flask session cookie and only serves active
+approvers and admins. Every event names the approver whose queue it
+touches: admins see them all, approvers (and admins on "My queue only")
+only those for their own steps. It keeps the last EVENT_BACKLOG events for
+clients that reconnect with Last-Event-ID, and tells clients that fell
+further behind to reload.
+
+The server speaks plain HTTP. Unless LIVE_STREAM_URL says where it is
+published (e.g. routed through the TLS front end), pages served over
+HTTPS get no stream rather than an address the browser would refuse.
+
+BUS is per process: with several app workers, a dashboard only hears
+about commits made by the worker whose stream it is connected to (the
+one that served the page), and the rest show up on the next reload.
+
+Nothing runs per connection while a stream is idle: an event is encoded
+once and written straight to every subscribed socket, and one timer sends
+the keep-alive comments for all of them.
+"""
+import asyncio
+import json
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from http.cookies import CookieError, SimpleCookie
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from flask import Flask, request
+from itsdangerous import BadSignature
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import db, ApprovalStep, User, WorkQueueItem
+
+log = logging.getLogger(__name__)
+
+STREAM_PATH = "/approvals/approver/stream"
+EVENT_BACKLOG = 1000   # events kept for Last-Event-ID replay
+CLIENT_BUFFER = 256 * 1024  # bytes unsent to one client before it is cut off as too slow
+HEARTBEAT = 15.0       # seconds between keep-alive comments on an idle stream
+HEAD_TIMEOUT = 10.0
+MAX_HEAD = 16 * 1024
+
+_stats_lock = threading.Lock()
+LIVE_STATS = {
+    "published": 0,  # events put on the bus
+    "delivered": 0,  # events queued to a connected client
+    "replayed": 0,   # events re-sent after a reconnect with Last-Event-ID
+    "reloads": 0,    # reconnects too far behind to replay
+    "slow": 0,       # clients cut off because their buffer filled up
+    "rejected": 0,   # connections refused (no session, bad request, LIVE_MAX_CLIENTS)
+}
+
+
+def _record(stat: str, n: int = 1) -> None:
+    with _stats_lock:
+        LIVE_STATS[stat] += n
+
+
+# ----------------- Event bus -----------------
+
+class EventBus:
+    """Numbered events, a replay buffer, and subscribers called on publish."""
+
+    def __init__(self, backlog: int = EVENT_BACKLOG):
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=backlog)
+        # ids carry on from the clock, so ids from before a restart read as a gap
+        self._next_id = int(time.time() * 1000)
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+
+    @property
+    def last_id(self) -> int:
+        return self._next_id - 1
+
+    def publish(self, kind: str, data: Dict[str, Any]) -> int:
+        with self._lock:
+            ev = {"id": self._next_id, "kind": kind, "data": data}
+            self._next_id += 1
+            self._events.append(ev)
+            subscribers = list(self._subscribers)
+        _record("published")
+        for fn in subscribers:
+            try:
+                fn(ev)
+            except Exception:
+                log.exception("live event subscriber failed")
+        return ev["id"]
+
+    def since(self, last_id: int) -> Optional[List[Dict[str, Any]]]:
+        """Events after ``last_id``, or None if some of them are no longer buffered."""
+        with self._lock:
+            if last_id >= self._next_id - 1:
+                return []
+            if not self._events or self._events[0]["id"] > last_id + 1:
+                return None
+            return [ev for ev in self._events if ev["id"] > last_id]
+
+    def subscribe(self, fn: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            self._subscribers.append(fn)
+
+    def unsubscribe(self, fn: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            if fn in self._subscribers:
+                self._subscribers.remove(fn)
+
+
+BUS = EventBus()
+
+_STAGED = "live_events"
+
+
+def _queued_row(item: WorkQueueItem) -> Dict[str, Any]:
+    return {
+        "request_id": item.request_id,
+        "step_id": item.step_id,
+        "approver_id": item.approver_id,
+        "student_name": item.student_name,
+        "form_name": item.form_name,
+        "step_number": item.sequence,
+        "updated_at": item.queued_at.strftime("%Y-%m-%d %H:%M") if item.queued_at else "",
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _stage_queue_events(session, flush_context):
+    """Note the work-queue changes in this flush; they go out if the transaction commits."""
+    staged = []
+    # removals first: a forwarded request leaves with its old step and comes back with the next
+    for obj in session.deleted:
+        if isinstance(obj, WorkQueueItem):
+            step = session.identity_map.get(session.identity_key(ApprovalStep, obj.step_id))
+            status = step.status if step is not None else None
+            staged.append((status if status in ("approved", "returned") else "removed",
+                           {"request_id": obj.request_id, "step_id": obj.step_id,
+                            "approver_id": obj.approver_id}))
+    for obj in session.dirty:
+        history = inspect(obj).attrs.approver_id.history if isinstance(obj, WorkQueueItem) else None
+        if history is not None and history.has_changes():
+            # reassigned: out of the old approver's queue, into the new one's
+            for old in history.deleted or ():
+                staged.append(("removed", {"request_id": obj.request_id, "step_id": obj.step_id,
+                                           "approver_id": old}))
+            staged.append(("pending", _queued_row(obj)))
+        elif isinstance(obj, ApprovalStep) and obj.claimed_by_id and obj.status == "pending" \
+                and inspect(obj).attrs.claim_expires_at.history.has_changes():
+            holder = session.identity_map.get(session.identity_key(User, obj.claimed_by_id))
+            staged.append(("claimed", {
+                "request_id": obj.request_id,
+                "step_id": obj.id,
+                "approver_id": obj.approver_id,
+                "by": holder.name if holder is not None else "",
+                "until": obj.claim_expires_at.isoformat() + "Z",
+            }))
+    for obj in session.new:
+        if isinstance(obj, WorkQueueItem):
+            staged.append(("pending", _queued_row(obj)))
+    if staged:
+        session.info.setdefault(_STAGED, []).extend(staged)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_queue_events(session):
+    for kind, data in session.info.pop(_STAGED, ()):
+        BUS.publish(kind, data)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_queue_events(session):
+    session.info.pop(_STAGED, None)
+
+
+# ----------------- SSE server -----------------
+
+def can_subscribe(user: Optional[User]) -> bool:
+    """Whether ``user`` may open the dashboard stream: active approvers and admins."""
+    return user is not None and user.status == "active" and (user.role or "").lower() in ("approver", "admin")
+
+
+class _Client:
+    __slots__ = ("approver_id", "writer")
+
+    def __init__(self, approver_id: Optional[int], writer: asyncio.StreamWriter):
+        self.approver_id = approver_id  # None: every queue (admins)
+        self.writer = writer
+
+    def wants(self, ev: Dict[str, Any]) -> bool:
+        return self.approver_id is None or ev["data"].get("approver_id") == self.approver_id
+
+
+def _frame(ev: Dict[str, Any]) -> bytes:
+    return f"id: {ev['id']}\nevent: {ev['kind']}\ndata: {json.dumps(ev['data'])}\n\n".encode()
+
+
+def _plain(status: str, body: str = "", extra: str = "") -> bytes:
+    return (f"HTTP/1.1 {status}\r\nContent-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Length: {len(body.encode())}\r\nConnection: close\r\n{extra}\r\n{body}").encode()
+
+
+class LiveStream:
+    """The event-stream listener: one asyncio loop on a daemon thread."""
+
+    def __init__(self, bus: EventBus = BUS):
+        self.bus = bus
+        self.app: Optional[Flask] = None
+        self.host = "0.0.0.0"
+        self.port: Optional[int] = None
+        self.max_clients = 10000
+        self.heartbeat = HEARTBEAT
+        self.bound_port: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._failed = False
+        self.warned_insecure = False
+
+    @property
+    def connections(self) -> int:
+        return len(self._clients)
+
+    def ensure_started(self) -> Optional[int]:
+        """Bind and start the listener on first use; the bound port, or None if off or unavailable."""
+        if self.bound_port is not None or self._failed or self.app is None or self.port is None:
+            return self.bound_port
+        with self._lock:
+            if self.bound_port is None and not self._failed:
+                try:
+                    sock = socket.create_server((self.host, self.port), backlog=1024)
+                except OSError as exc:
+                    self._failed = True
+                    log.warning("live dashboard stream disabled: cannot listen on %s:%s (%s)",
+                                self.host, self.port, exc)
+                    return None
+                self._loop = asyncio.new_event_loop()
+                started = threading.Event()
+                threading.Thread(target=self._run, args=(sock, started), name="live-stream", daemon=True).start()
+                started.wait()
+                self.bus.subscribe(self._on_event)
+                self.bound_port = sock.getsockname()[1]
+        return self.bound_port
+
+    def _run(self, sock: socket.socket, started: threading.Event) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(asyncio.start_server(self._handle, sock=sock, limit=MAX_HEAD))
+        self._loop.call_later(self.heartbeat, self._ping)
+        started.set()
+        self._loop.run_forever()
+
+    # -- fan-out (runs on the loop) -------------------------------------
+    def _on_event(self, ev: Dict[str, Any]) -> None:
+        self._loop.call_soon_threadsafe(self._fanout, ev)
+
+    def _fanout(self, ev: Dict[str, Any]) -> None:
+        frame = None
+        delivered = 0
+        for client in list(self._clients):
+            if client.wants(ev):
+                frame = frame or _frame(ev)
+                delivered += self._send(client, frame)
+        if delivered:
+            _record("delivered", delivered)
+
+    def _send(self, client: _Client, frame: bytes) -> bool:
+        transport = client.writer.transport
+        if transport.is_closing():
+            self._clients.discard(client)
+            return False
+        if transport.get_write_buffer_size() > CLIENT_BUFFER:
+            # it reconnects with Last-Event-ID and catches up from the backlog
+            _record("slow")
+            self._clients.discard(client)
+            transport.abort()
+            return False
+        transport.write(frame)
+        return True
+
+    def _ping(self) -> None:
+        # also how dead peers are noticed: the write fails and the socket closes
+        for client in list(self._clients):
+            self._send(client, b": ping\n\n")
+        self._loop.call_later(self.heartbeat, self._ping)
+
+    # -- one connection -------------------------------------------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = None
+        try:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEAD_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            response = await self._open(head, writer)
+            if not isinstance(response, _Client):
+                _record("rejected")
+                writer.write(response)
+                await writer.drain()
+                return
+            client = response
+            # events are written by _fanout; this only waits for the client to hang up
+            while await reader.read(4096):
+                pass
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if client is not None:
+                self._clients.discard(client)
+            writer.close()
+
+    async def _open(self, head: bytes, writer: asyncio.StreamWriter):
+        """Check the request and send the stream preamble; a _Client, or the error response bytes."""
+        try:
+            lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+        except ValueError:
+            return _plain("400 Bad Request")
+        url = urlsplit(target)
+        if url.path != STREAM_PATH:
+            return _plain("404 Not Found")
+        if method != "GET":
+            return _plain("405 Method Not Allowed", extra="Allow: GET\r\n")
+        if len(self._clients) >= self.max_clients:
+            return _plain("503 Service Unavailable", extra="Retry-After: 30\r\n")
+
+        email = self._session_user(headers.get("cookie", ""))
+        if not email:
+            return _plain("401 Unauthorized")
+        user = await asyncio.get_running_loop().run_in_executor(None, self._subscriber, email)
+        if user is None:
+            return _plain("403 Forbidden")
+        args = parse_qs(url.query)
+        user_id, is_admin = user
+        approver_id = None if is_admin and args.get("mine") != ["1"] else user_id
+
+        cors = ""
+        origin = headers.get("origin")
+        if origin and self._origin_allowed(origin, headers.get("host", "")):
+            cors = f"Access-Control-Allow-Origin: {origin}\r\nAccess-Control-Allow-Credentials: true\r\nVary: Origin\r\n"
+        writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                      f"X-Accel-Buffering: no\r\nConnection: close\r\n{cors}\r\n"
+                      f"retry: 3000\n\n").encode())
+
+        client = _Client(approver_id, writer)
+        last = headers.get("last-event-id") or (args.get("lastEventId") or [""])[0]
+        # register before reading the backlog so nothing published in between is lost;
+        # the client ignores ids it has already seen
+        self._clients.add(client)
+        if last.isdigit():
+            missed = self.bus.since(int(last))
+            if missed is None:
+                _record("reloads")
+                writer.write(b"event: reload\ndata: {}\n\n")
+            else:
+                replay = [_frame(ev) for ev in missed if client.wants(ev)]
+                _record("replayed", len(replay))
+                writer.writelines(replay)
+        await writer.drain()
+        return client
+
+    def _session_user(self, cookie_header: str) -> Optional[str]:
+        try:
+            cookies = SimpleCookie(cookie_header)
+        except CookieError:
+            return None
+        morsel = cookies.get(self.app.config["SESSION_COOKIE_NAME"])
+        serializer = self.app.session_interface.get_signing_serializer(self.app)
+        if morsel is None or serializer is None:
+            return None
+        try:
+            data = serializer.loads(morsel.value, max_age=int(self.app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return None
+        user = data.get("user") or {}
+        return (user.get("preferred_username") or user.get("email") or "").lower() or None
+
+    def _subscriber(self, email: str) -> Optional[Tuple[int, bool]]:
+        """(user id, is admin) for a user allowed on the stream, else None."""
+        with self.app.app_context():
+            try:
+                user = User.query.filter(db.func.lower(User.email) == email).first()
+                if not can_subscribe(user):
+                    return None
+                return user.id, user.role.lower() == "admin"
+            finally:
+                db.session.remove()
+
+    def _origin_allowed(self, origin: str, host: str) -> bool:
+        allowed = self.app.config.get("LIVE_STREAM_ORIGINS")
+        if allowed is not None:
+            return origin in allowed
+        # the dashboard page is normally the same host on the app's port
+        return urlsplit(origin).hostname == urlsplit(f"//{host}").hostname
+
+
+LIVE = LiveStream()
+
+
+def live_stream_url() -> Optional[str]:
+    """
+    Where the dashboard should connect (inside a request), starting the
+    listener if needed; None if there is no stream this page can use.
+    """
+    port = LIVE.ensure_started()
+    if port is None:
+        return None
+    if LIVE.app.config.get("LIVE_STREAM_URL"):
+        return LIVE.app.config["LIVE_STREAM_URL"]
+    if request.is_secure:
+        # the listener has no TLS, and an HTTPS page may not open an http:// stream
+        if not LIVE.warned_insecure:
+            LIVE.warned_insecure = True
+            log.warning("live dashboard stream off for HTTPS pages: set LIVE_STREAM_URL to its public URL")
+        return None
+    host = urlsplit(f"//{request.host}").hostname or "localhost"
+    if ":" in host:
+        host = f"[{host}]"
+    return f"http://{host}:{port}{STREAM_PATH}"
+
+
+def init_live_stream(app: Flask) -> None:
+    """
+    Configure the dashboard stream (LIVE_STREAM_PORT, LIVE_STREAM_HOST,
+    LIVE_STREAM_URL, LIVE_MAX_CLIENTS, LIVE_HEARTBEAT). It only starts listening when a
+    dashboard is first served, so CLI commands and the reloader's parent
+    process never bind the port. Off by default under TESTING.
+    """
+    LIVE.app = app
+    LIVE.port = app.config.get("LIVE_STREAM_PORT", None if app.testing else 5002)
+    LIVE.host = app.config.get("LIVE_STREAM_HOST", "0.0.0.0")
+    LIVE.max_clients = app.config.get("LIVE_MAX_CLIENTS", 10000)
+    LIVE.heartbeat = app.config.get("LIVE_HEARTBEAT", HEARTBEAT)
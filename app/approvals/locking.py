@@ -0,0 +1,69 @@
+# app/approvals/locking.py
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models import db, ApprovalStep, User
+
+# How long a claim protects a step from other approvers. Long enough to cover
+# a PDF render, short enough that an abandoned claim frees up quickly.
+CLAIM_LEASE = timedelta(minutes=2)
+
+_stats_lock = threading.Lock()
+CONTENTION_STATS = {
+    "claims": 0,            # successful claims
+    "claim_conflicts": 0,   # lost the race before rendering (cheap)
+    "commit_conflicts": 0,  # lost the race after rendering (render wasted)
+    "wasted_renders": 0,
+}
+
+
+class StepConflict(Exception):
+    """Another approver holds or has already actioned the step."""
+
+
+def record(stat: str, n: int = 1) -> None:
+    with _stats_lock:
+        CONTENTION_STATS[stat] = CONTENTION_STATS.get(stat, 0) + n
+
+
+def claim_holder(step: ApprovalStep, now: datetime = None):
+    """User id currently holding an unexpired claim on the step, or None."""
+    now = now or datetime.utcnow()
+    if step.claimed_by_id and step.claim_expires_at and step.claim_expires_at > now:
+        return step.claimed_by_id
+    return None
+
+
+def claim_step(step: ApprovalStep, user: User, lease: timedelta = CLAIM_LEASE) -> ApprovalStep:
+    """
+    Take (or renew) the lease on a pending step and commit it immediately.
+
+    The UPDATE is guarded by the step's version column, so two approvers
+    racing for the same step can't both win; the loser gets StepConflict
+    before doing any expensive work.
+    """
+    now = datetime.utcnow()
+    holder = claim_holder(step, now)
+    if step.status != "pending" or (holder and holder != user.id):
+        db.session.rollback()
+        record("claim_conflicts")
+        raise StepConflict()
+
+    step.claimed_by_id = user.id
+    step.claim_expires_at = now + lease
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        record("claim_conflicts")
+        raise StepConflict()
+    record("claims")
+    return step
+
+
+def release_claim(step: ApprovalStep) -> None:
+    """Clear the lease fields; caller commits."""
+    step.claimed_by_id = None
+    step.claim_expires_at = None
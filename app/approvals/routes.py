@@ -1,22 +1,42 @@
 # app/approvals/routes.py
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import (Blueprint, render_template, request, redirect, url_for, flash, current_app, send_from_directory, session, jsonify)
 from werkzeug.utils import secure_filename
-from app.models import db, User, Signature, Request, FormTemplate, ApprovalStep
-from app.utils.pdf_generator import generate_request_pdf
-from app.users.routes import require_login, current_db_user
+from sqlalchemy import func, select
+from app.models import db, User, Signature, Request, FormTemplate, ApprovalStep, WorkQueueItem, ArchivedRequest
+from app.approvals.work_queue import sync_request as sync_work_queue, queue_query, actionable_steps
+from app.approvals.routing import NoApprovers, build_steps, complete_step
+from app.approvals.locking import StepConflict, claim_step, claim_holder, release_claim, record, CONTENTION_STATS
+from app.approvals.idempotency import IDEMPOTENCY_STATS, allow_retry, idempotency_field, idempotent
+from app.approvals.drafts import AUTOSAVE_STATS, DraftConflict, PatchError, apply_patch, patch_draft
+from app.approvals.live import BUS, LIVE, LIVE_STATS, can_subscribe, live_stream_url
+from app.approvals.history import changed_fields, record_event, timeline
+from app.approvals.analytics import GROUPS as ANALYTICS_GROUPS, report as analytics_report
+from app.approvals.archive import ARCHIVE_STATS, archived_version, load_archived
+from app.utils.pdf_stamp import render_body_pdf, sign_request_pdf
+from app.utils.form_preview import preview_context
+from app.utils.render_governor import RenderBusy
+from app.utils.view_cache import VersionedCache
+from app.utils.form_schema import get_schema
+from app.utils.metrics import EXTERNAL_CALLS, register_collector, timed
+from app.users.routes import require_admin, require_login, current_db_user
 from datetime import datetime
 import json
 import requests
 
 
 approvals_bp = Blueprint("approvals_bp", __name__)
+# one-time key per rendered form, so a double-submit is answered once (see idempotency)
+approvals_bp.add_app_template_global(idempotency_field)
 
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
 ALLOWED_MIMETYPES = {"image/png", "image/jpeg"}
 MAX_BYTES = 2 * 1024 * 1024  # 2MB
 
+REQUEST_STATUSES = ("draft", "pending", "returned", "approved", "rejected")
+MY_REQUESTS_PER_PAGE = 25
+
 
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -132,7 +152,46 @@ def new_request():
     return render_template("approvals/new_request.html", templates=templates)
 
 
+def _posted_form(schema, previous=None):
+    """
+    The posted form as (data, errors). "Save draft" never fails validation:
+    fields that don't validate yet keep what was typed, and the checks only
+    reject the form when it is submitted.
+    """
+    raw = schema.parse(request.form, request.files, previous=previous)
+    data, errors = schema.validate(raw)
+    if request.form.get("action") == "draft":
+        return {**data, **{k: raw.get(k) for k in errors}}, {}
+    return data, errors
+
+
+def _reshow_form(form_template, form_data, messages, req=None, status=400):
+    """Re-show the form with what the user typed and ``messages`` above it."""
+    return render_template(
+        "form_fill.html",
+        form_template=form_template,
+        current_data=form_data,
+        current_date=datetime.utcnow().strftime("%Y-%m-%d"),
+        req=req,
+        errors=messages
+    ), status
+
+
+def _form_errors(form_template, form_data, errors, req=None):
+    """Re-show the form with what the user typed and a message per bad field."""
+    labels = get_schema(form_template).by_key
+    messages = [f"{labels[k].label if k in labels else k}: {msg}" for k, msg in errors.items()]
+    return _reshow_form(form_template, form_data, messages, req=req)
+
+
+def _render_body(req_obj: Request) -> None:
+    """Typeset a newly submitted request once; each approval stamps onto it."""
+    sig = Signature.query.filter_by(user_id=req_obj.requester_id).first()
+    render_body_pdf(req_obj, sig.image_path if sig else None)
+
+
 @approvals_bp.route("/submit/<form_code>", methods=["POST"])
+@idempotent("approvals_bp.list_my_requests")
 def submit_request(form_code):
     form_template = FormTemplate.query.filter_by(form_code=form_code).first_or_404()
 
@@ -153,9 +212,10 @@ def submit_request(form_code):
         db.session.add(user)
         db.session.commit()
     
-    form_data = {}
-    for key in request.form:
-        form_data[key] = request.form.getlist(key) if len(request.form.getlist(key)) > 1 else request.form.get(key)
+    schema = get_schema(form_template)
+    form_data, errors = _posted_form(schema)
+    if errors:
+        return _form_errors(form_template, form_data, errors)
 
     action = request.form.get("action")  
 
@@ -164,10 +224,24 @@ def submit_request(form_code):
         requester_id=user.id,
         form_data_json=form_data,
         status="draft" if action == "draft" else "pending",
+        submitted_at=None if action == "draft" else datetime.utcnow(),
     )
 
     db.session.add(new_request)
+    if new_request.status == "pending":
+        new_request.form_template = form_template
+        try:
+            build_steps(new_request)
+        except NoApprovers as e:
+            db.session.rollback()
+            return _reshow_form(form_template, form_data, [str(e)], status=503)
+        sync_work_queue(new_request)
+        record_event(new_request, "submitted", actor=user)
+    else:
+        record_event(new_request, "edited", actor=user, fields=changed_fields({}, form_data))
     db.session.commit()
+    if new_request.status == "pending":
+        _render_body(new_request)
 
     flash("Form saved as draft!" if action == "draft" else "Form submitted for approval!", "success")
     return redirect(url_for("approvals_bp.list_forms"))
@@ -183,44 +257,38 @@ def fetch_external_forms():
 
     api_url = "https://aurora.jguliz.com/approvals/get-forms"
 
-    resp = requests.get(api_url, timeout=5)
+    with timed(EXTERNAL_CALLS, target="get-forms"):
+        resp = requests.get(api_url, timeout=5)
     data = resp.json()
 
     if isinstance(data, list):
         return data
     return []
 @approvals_bp.route("/forms/<form_code>", methods=["GET", "POST"])
+@idempotent("approvals_bp.list_my_requests")
 def fill_form(form_code):
     form_template = FormTemplate.query.filter_by(form_code=form_code).first_or_404()
 
     user = session.get("user")
     if not user:
         flash("You must be logged in to submit a form.", "warning")
+        allow_retry()
         return redirect(url_for("auth.login"))
 
     
     db_user = User.query.filter_by(email=user["preferred_username"]).first()
     if not db_user:
         flash("User not found in database.", "danger")
+        allow_retry()
         return redirect(url_for("auth.login"))
 
     requester_id = db_user.id
 
     if request.method == "POST":
-        form_data = {}
-
-        for key, field_type in form_template.fields_json.items():
-            if isinstance(field_type, dict) and field_type.get("type") == "select":
-                form_data[key] = request.form.get(key)
-            elif isinstance(field_type, list):
-                form_data[key] = request.form.getlist(key)
-            elif field_type == "file":
-                file = request.files.get(key)
-                form_data[key] = file.filename if file else None
-            elif field_type == "auto_date":
-                form_data[key] = datetime.utcnow().strftime("%Y-%m-%d")
-            else:
-                form_data[key] = request.form.get(key)
+        schema = get_schema(form_template)
+        form_data, errors = _posted_form(schema)
+        if errors:
+            return _form_errors(form_template, form_data, errors)
 
         if request.form.get("action") == "draft":
             status = "draft"
@@ -230,6 +298,7 @@ def fill_form(form_code):
             sig = Signature.query.filter_by(user_id=requester_id).first()
             if not sig or not sig.image_path:
                 flash("Please upload your signature before submitting the form.", "warning")
+                allow_retry()
                 return redirect(url_for("approvals_bp.signature_upload_get"))
             
             status = "pending"
@@ -244,23 +313,23 @@ def fill_form(form_code):
         )
 
         db.session.add(new_request)
-        db.session.commit()
 
-        # Create approval step for demo (anyone can approve)
+        # Route to approvers per the form's route definition
         if status == "pending":
-            # Get first admin/approver user, or use current user as placeholder
-            approver = User.query.filter(User.role.in_(["admin", "approver"])).first()
-            if not approver:
-                approver = db_user
-            
-            approval_step = ApprovalStep(
-                request_id=new_request.id,
-                approver_id=approver.id,
-                sequence=1,
-                status="pending"
-            )
-            db.session.add(approval_step)
-            db.session.commit()
+            new_request.form_template = form_template
+            try:
+                build_steps(new_request)
+            except NoApprovers as e:
+                db.session.rollback()
+                return _reshow_form(form_template, form_data, [str(e)], status=503)
+            sync_work_queue(new_request)
+            record_event(new_request, "submitted", actor=db_user)
+        else:
+            record_event(new_request, "edited", actor=db_user, fields=changed_fields({}, form_data))
+
+        db.session.commit()
+        if status == "pending":
+            _render_body(new_request)
 
         flash(message, "success")
         return redirect(url_for("approvals_bp.list_my_requests"))
@@ -274,17 +343,20 @@ def fill_form(form_code):
 
 
 @approvals_bp.route("/request/<int:request_id>/edit", methods=["GET", "POST"])
+@idempotent("approvals_bp.list_my_requests")
 def edit_request(request_id):
     req = Request.query.get_or_404(request_id)
 
     user = session.get("user")
     if not user:
         flash("You must be logged in to edit requests.", "warning")
+        allow_retry()
         return redirect(url_for("auth.login"))
 
     db_user = User.query.filter_by(email=user["preferred_username"]).first()
     if not db_user:
         flash("User not found in database.", "danger")
+        allow_retry()
         return redirect(url_for("auth.login"))
 
     requester_id = db_user.id
@@ -292,62 +364,67 @@ def edit_request(request_id):
 
     if req.requester_id != requester_id:
         flash("You cannot edit someone else's request.", "warning")
+        allow_retry()
         return redirect(url_for("approvals_bp.list_my_requests"))
 
     if req.status != "draft":
         flash("Only drafts can be edited.", "warning")
+        allow_retry()
         return redirect(url_for("approvals_bp.list_my_requests"))
 
     form_template = req.form_template
 
     if request.method == "POST":
-        updated_data = {}
-
-        for key, field_type in form_template.fields_json.items():
-            if isinstance(field_type, dict) and field_type.get("type") == "select":
-                updated_data[key] = request.form.get(key)
-            elif isinstance(field_type, list):
-                updated_data[key] = request.form.getlist(key)
-            elif field_type == "file":
-                file = request.files.get(key)
-                updated_data[key] = file.filename if file else req.form_data_json.get(key)
-            elif field_type == "auto_date":
-                updated_data[key] = datetime.utcnow().strftime("%Y-%m-%d")
-            else:
-                updated_data[key] = request.form.get(key)
+        schema = get_schema(form_template)
+        updated_data, errors = _posted_form(schema, previous=req.form_data_json)
+        if errors:
+            return _form_errors(form_template, updated_data, errors, req=req)
 
-        req.form_data_json = updated_data
-
-        if request.form.get("action") == "draft":
-            req.status = "draft"
-            req.submitted_at = None
-            flash("Draft updated!", "success")
-        else:
+        submitting = request.form.get("action") != "draft"
+        if submitting:
             # Check if user has uploaded signature before submitting
             sig = Signature.query.filter_by(user_id=requester_id).first()
             if not sig or not sig.image_path:
                 flash("Please upload your signature before submitting the form.", "warning")
+                allow_retry()
                 return redirect(url_for("approvals_bp.signature_upload_get"))
-            
-            req.status = "pending"
-            req.submitted_at = datetime.utcnow()
-            
-            # Create approval step if resubmitting (e.g., after return)
-            if not req.approval_steps:
-                approver = User.query.filter(User.role.in_(["admin", "approver"])).first()
-                if not approver:
-                    approver = db_user
-                approval_step = ApprovalStep(
-                    request_id=req.id,
-                    approver_id=approver.id,
-                    sequence=1,
-                    status="pending"
-                )
-                db.session.add(approval_step)
-            
-            flash("Form submitted for approval!", "success")
 
-        db.session.commit()
+        try:
+            fields = changed_fields(req.form_data_json, updated_data)
+            req.form_data_json = updated_data
+
+            if not submitting:
+                req.status = "draft"
+                req.submitted_at = None
+            else:
+                req.status = "pending"
+                req.submitted_at = datetime.utcnow()
+
+                # Create approval steps if resubmitting (e.g., after return)
+                if not req.approval_steps:
+                    build_steps(req)
+
+            if fields:
+                record_event(req, "edited", actor=db_user, fields=fields)
+            if req.status == "pending":
+                record_event(req, "submitted", actor=db_user)
+            sync_work_queue(req)
+            db.session.commit()
+        except StaleDataError:
+            # the draft changed since it was loaded (an autosave landed in between):
+            # show what was typed against the current version instead of losing it
+            db.session.rollback()
+            allow_retry()
+            return _reshow_form(form_template, updated_data,
+                                ["This draft was changed while you were editing it. "
+                                 "Review the form below and save it again."], req=req, status=409)
+        except NoApprovers as e:
+            db.session.rollback()
+            return _reshow_form(form_template, updated_data, [str(e)], req=req, status=503)
+
+        flash("Form submitted for approval!" if submitting else "Draft updated!", "success")
+        if req.status == "pending":
+            _render_body(req)
         return redirect(url_for("approvals_bp.list_my_requests"))
 
     return render_template(
@@ -374,47 +451,98 @@ def list_my_requests():
 
     requester_id = db_user.id
 
-    requests = Request.query.filter_by(requester_id=requester_id).order_by(Request.created_at.desc()).all()
+    status_filter = (request.args.get("status") or "").lower()
+    page = request.args.get("page", 1, type=int)
+
+    # Summary projection: only the columns the list shows, form name via one join
+    # (no form_data_json blob, no per-row form_template lazy load)
+    summary_query = (select(Request.id,
+                            FormTemplate.name.label("form_name"),
+                            Request.status,
+                            Request.created_at,
+                            Request.updated_at,
+                            Request.submitted_at)
+                     .join(FormTemplate, Request.form_template_id == FormTemplate.id)
+                     .where(Request.requester_id == requester_id))
+    # closed requests moved to the archive (see approvals.archive) are listed with the rest
+    archived_query = (select(ArchivedRequest.request_id,
+                             FormTemplate.name,
+                             ArchivedRequest.status,
+                             ArchivedRequest.created_at,
+                             ArchivedRequest.updated_at,
+                             ArchivedRequest.submitted_at)
+                      .join(FormTemplate, ArchivedRequest.form_template_id == FormTemplate.id)
+                      .where(ArchivedRequest.requester_id == requester_id))
+    if status_filter in REQUEST_STATUSES:
+        summary_query = summary_query.where(Request.status == status_filter)
+        archived_query = archived_query.where(ArchivedRequest.status == status_filter)
+    else:
+        status_filter = ""
+
+    # Per-status totals for the filter tabs, one grouped query over both tables;
+    # they also give the list's total, so paging it needs no COUNT query
+    statuses = (select(Request.status).where(Request.requester_id == requester_id)
+                .union_all(select(ArchivedRequest.status).where(ArchivedRequest.requester_id == requester_id))
+                .subquery())
+    status_counts = dict(db.session.query(statuses.c.status, func.count())
+                         .group_by(statuses.c.status)
+                         .all())
+
+    listed = summary_query.union_all(archived_query).subquery()
+    pagination = (db.session.query(listed)
+                  .order_by(listed.c.created_at.desc(), listed.c.id.desc())
+                  .paginate(page=page, per_page=MY_REQUESTS_PER_PAGE, error_out=False, count=False))
+    pagination.total = status_counts.get(status_filter, 0) if status_filter else sum(status_counts.values())
 
-    return render_template("my_requests.html", requests=requests)
+    return render_template("my_requests.html",
+                           requests=pagination.items,
+                           pagination=pagination,
+                           status_filter=status_filter,
+                           status_counts=status_counts,
+                           total_count=sum(status_counts.values()))
 
 
 
 from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.exc import StaleDataError
 
-def _dto_row_for_approver(req_obj: Request, step: ApprovalStep):
+def _dto_row_for_queue_item(item: WorkQueueItem):
     return {
-        "id": req_obj.id,
-        "student_name": req_obj.requester.name if req_obj.requester else "—",
-        "form_name": req_obj.form_template.name if req_obj.form_template else "—",
-        "state": req_obj.status.upper(),
-        "step_number": step.sequence if step else None,
-        "step_status": step.status.upper() if step else None,
-        "updated_at": req_obj.updated_at.strftime("%Y-%m-%d %H:%M") if req_obj.updated_at else ""
+        "id": item.request_id,
+        "student_name": item.student_name,
+        "form_name": item.form_name,
+        "state": "PENDING",
+        "step_number": item.sequence,
+        "step_status": "PENDING",
+        "updated_at": item.queued_at.strftime("%Y-%m-%d %H:%M") if item.queued_at else ""
     }
 
 
+def _fmt_dt(dt):
+    return dt.strftime("%Y-%m-%d %H:%M") if dt else ""
+
+
+# form_template_id -> {field_key: display label}, built once per template
+_FIELD_LABELS = {}
+
+def _field_labels(form_template: FormTemplate):
+    labels = _FIELD_LABELS.get(form_template.id) if form_template else None
+    if labels is None:
+        keys = (form_template.fields_json or {}).keys() if form_template else ()
+        labels = {k: k.replace("_", " ").title() for k in keys}
+        if form_template:
+            _FIELD_LABELS[form_template.id] = labels
+    return labels
+
+
 def _detail_dto(req_obj: Request):
     # current step = first 'pending' else last step
     pending = next((s for s in req_obj.approval_steps if s.status == "pending"), None)
     last    = req_obj.approval_steps[-1] if req_obj.approval_steps else None
     current = pending or last
 
-    # history timeline
-    history = []
-    if req_obj.submitted_at:
-        history.append({
-            "at": req_obj.submitted_at.strftime("%Y-%m-%d %H:%M"),
-            "event": "SUBMITTED",
-            "by": req_obj.requester.name if req_obj.requester else "System"
-        })
-    for s in req_obj.approval_steps:
-        if s.status in ("approved", "rejected", "returned") and s.actioned_at:
-            history.append({
-                "at": s.actioned_at.strftime("%Y-%m-%d %H:%M"),
-                "event": s.status.upper(),
-                "by": s.approver.name if s.approver else "Approver"
-            })
+    # history timeline, from the event log (snapshot + tail; see approvals.history)
+    history = timeline(req_obj.id)
 
     # PDFs from signed_pdf_path on steps
     pdfs = []
@@ -432,34 +560,123 @@ def _detail_dto(req_obj: Request):
     fields = []
     data = req_obj.form_data_json or {}
     if isinstance(data, dict):
+        labels = _field_labels(req_obj.form_template)
         for k, v in data.items():
-            label = k.replace("_", " ").title()
+            label = labels.get(k) or k.replace("_", " ").title()
             fields.append({"label": label, "value": v})
 
-    # Check if requester has signature
-    requester_sig = Signature.query.filter_by(user_id=req_obj.requester_id).first() if req_obj.requester_id else None
-    
+    # names are filled in per view by _with_current (renames don't bump the version)
     return {
         "id": req_obj.id,
-        "form_name": req_obj.form_template.name if req_obj.form_template else "—",
-        "student": {
-            "name": req_obj.requester.name if req_obj.requester else "—",
-            "email": req_obj.requester.email if req_obj.requester else "—",
-            "has_signature": bool(requester_sig and requester_sig.image_path)
-        },
+        "version": req_obj.version,
+        "requester_id": req_obj.requester_id,
+        "form_template_id": req_obj.form_template_id,
         "state": req_obj.status.upper(),
         "current_step": {
             "number": current.sequence if current else None,
-            "assignee": current.approver.name if current and current.approver else None 
-},
-        "submitted_at": req_obj.submitted_at.strftime("%Y-%m-%d %H:%M") if req_obj.submitted_at else "",
-        "updated_at": req_obj.updated_at.strftime("%Y-%m-%d %H:%M") if req_obj.updated_at else "",
+            "approver_id": current.approver_id if current else None,
+        },
+        "submitted_at": _fmt_dt(req_obj.submitted_at),
+        "updated_at": _fmt_dt(req_obj.updated_at),
         "fields": fields,
         "history": history,
-        "pdfs": pdfs
+        "pdfs": pdfs,
+        # approvers holding a pending step, for the per-viewer "can act" check
+        "pending_approver_ids": [s.approver_id for s in req_obj.approval_steps if s.status == "pending"],
+        # everyone on the chain, for the preview link
+        "approver_ids": sorted({s.approver_id for s in req_obj.approval_steps}),
     }
 
+
+# request_id -> (version, detail view model)
+detail_cache = VersionedCache(maxsize=2048)
+
+register_collector("detail_cache_lookups_total", "Detail view cache lookups by result.", "counter",
+                   lambda: {(("result", "hit"),): detail_cache.hits, (("result", "miss"),): detail_cache.misses})
+register_collector("idempotent_posts_total", "Keyed form POSTs by outcome (see approvals.idempotency).", "counter",
+                   lambda: {(("outcome", k),): v for k, v in IDEMPOTENCY_STATS.items()})
+register_collector("request_archive_total", "Requests archived, archive batches rolled back, archive reads (see approvals.archive).",
+                   "counter", lambda: {(("event", k),): v for k, v in ARCHIVE_STATS.items()})
+register_collector("approval_contention_total", "Approval claim/commit races (see approvals.locking).", "counter",
+                   lambda: {(("event", k),): v for k, v in CONTENTION_STATS.items()})
+
+def _cached_detail(request_id: int):
+    """
+    Return the detail view model for a request, or None if it doesn't exist.
+
+    One light query fetches the request's version; the view model itself is
+    only rebuilt (with the full joined load) when the version has moved on
+    since it was cached. Names and the signature flag are looked up per view
+    (see _with_current).
+    """
+    version = db.session.query(Request.version).filter(Request.id == request_id).scalar()
+    if version is None:
+        return _archived_detail(request_id)
+
+    d = detail_cache.get(request_id, version)
+    if d is None:
+        req_obj = (Request.query
+                   .options(joinedload(Request.form_template),
+                            joinedload(Request.requester),
+                            joinedload(Request.approval_steps).joinedload(ApprovalStep.approver))
+                   .filter_by(id=request_id)
+                   .first())
+        if not req_obj:
+            return _archived_detail(request_id)
+        d = _detail_dto(req_obj)
+        detail_cache.put(request_id, d["version"], d)
+
+    return _with_current(d)
+
+
+def _with_current(d):
+    """
+    A copy of cached view model ``d`` with what can change without touching
+    the request: the form's and people's names (renaming doesn't bump
+    Request.version) and whether the requester has a signature. One query.
+    """
+    def name_of(model, column, id_):
+        return select(column).where(model.id == id_).scalar_subquery()
+
+    assignee_id = d["current_step"]["approver_id"]
+    has_signature = (select(Signature.id)
+                     .where(Signature.user_id == d["requester_id"],
+                            Signature.image_path.isnot(None),
+                            Signature.image_path != "")
+                     .exists())
+    form_name, name, email, assignee, signed = db.session.execute(select(
+        name_of(FormTemplate, FormTemplate.name, d["form_template_id"]),
+        name_of(User, User.name, d["requester_id"]),
+        name_of(User, User.email, d["requester_id"]),
+        name_of(User, User.name, assignee_id),
+        has_signature)).one()
+    # cached dicts are shared between requests; the copy gets the new values
+    return dict(d, form_name=form_name or "—",
+                student={"name": name or "—", "email": email or "—", "has_signature": bool(signed)},
+                current_step=dict(d["current_step"], assignee=assignee if assignee_id else None))
+
+
+def _archived_detail(request_id: int):
+    """Detail view model of a request moved to the archive (see approvals.archive), or None."""
+    version = archived_version(request_id)
+    if version is None:
+        return None
+    d = detail_cache.get(request_id, version)
+    if d is None:
+        req_obj = load_archived(request_id)
+        if req_obj is None:
+            return None
+        d = _detail_dto(req_obj)
+        detail_cache.put(request_id, d["version"], d)
+    return _with_current(d)
+
 # -------- Approver Dashboard--------
+# new work, claims and approvals are pushed to open dashboards (see approvals.live)
+
+register_collector("live_dashboard_events_total", "Dashboard stream activity (see approvals.live).", "counter",
+                   lambda: {(("event", k),): v for k, v in LIVE_STATS.items()})
+register_collector("live_dashboard_connections", "Open dashboard event streams.", "gauge",
+                   lambda: {(): LIVE.connections})
 
 @approvals_bp.get("/approver/dashboard")
 @require_login
@@ -471,29 +688,26 @@ def approver_dashboard():
 
     state = (request.args.get("state") or "").lower()
     q = (request.args.get("q") or "").strip().lower()
+    mine = request.args.get("mine") == "1"
+    # taken before the query: the stream replays anything committed after it
+    last_event_id = BUS.last_id
 
     # For DEMO: Show ALL pending requests, not just assigned to current user
-    requests_query = (Request.query
-                      .filter(Request.status == "pending")
-                      .options(joinedload(Request.form_template),
-                               joinedload(Request.requester),
-                               joinedload(Request.approval_steps))
-                      .order_by(Request.updated_at.desc()))
+    # (?mine=1 narrows to the signed-in approver's own queue)
+    items = queue_query(approver_id=me.id if mine else None, q=q).limit(200).all()
 
     rows = []
-    for req in requests_query.limit(200).all():
-        # Get the first pending step
-        pending_step = next((s for s in req.approval_steps if s.status == "pending"), None)
-        if not pending_step:
+    seen = set()
+    for item in items:
+        # one row per request even when several of its steps are actionable
+        if item.request_id in seen:
             continue
-            
-        if q and (q not in str(req.id).lower()
-                  and q not in (req.requester.name or "").lower()
-                  and q not in (req.form_template.name or "").lower()):
-            continue
-        rows.append(_dto_row_for_approver(req, pending_step))
+        seen.add(item.request_id)
+        rows.append(_dto_row_for_queue_item(item))
 
-    return render_template("approver_dashboard.html", requests=rows)
+    return render_template("approver_dashboard.html", requests=rows,
+                           live_url=live_stream_url() if can_subscribe(me) else None,
+                           last_event_id=last_event_id)
 
 @approvals_bp.get("/approver/requests/<int:request_id>")
 @require_login
@@ -503,115 +717,196 @@ def approver_request_detail(request_id: int):
         flash("You must be logged in.", "warning")
         return redirect(url_for("auth.login"))
 
-    req_obj = (Request.query
-               .options(joinedload(Request.form_template),
-                        joinedload(Request.requester),
-                        
-joinedload(Request.approval_steps).joinedload(ApprovalStep.approver))
-               .filter_by(id=request_id)
-               .first())
-    if not req_obj:
+    d = _cached_detail(request_id)
+    if not d:
         flash("Request not found.", "warning")
         return redirect(url_for("approvals_bp.approver_dashboard"))
 
     # For DEMO: Allow anyone to view (remove authorization check)
-    # In production, you'd check: assigned = any(s.approver_id == me.id for s in req_obj.approval_steps)
+    # In production, you'd check: assigned = me.id in d["pending_approver_ids"]
 
-    d = _detail_dto(req_obj)
     # determine if current user has a pending step
-    has_pending_for_me = any(s.approver_id == me.id and s.status == "pending" for s in req_obj.approval_steps)
-    return render_template("request_detail.html", d=d, view="approver", has_pending_for_me=has_pending_for_me)
+    has_pending_for_me = me.id in d["pending_approver_ids"]
+    can_preview = _can_preview(me, d["requester_id"], d["approver_ids"])
+    return render_template("request_detail.html", d=d, view="approver", has_pending_for_me=has_pending_for_me,
+                           can_preview=can_preview)
+
+def _load_for_action(request_id: int):
+    return (Request.query
+            .options(joinedload(Request.approval_steps),
+                     joinedload(Request.requester),
+                     joinedload(Request.form_template))
+            .filter_by(id=request_id)
+            .first())
+
+
+def _step_for_action(req_obj: Request, me: User):
+    """The actionable step this approver should act on: theirs if they have one."""
+    steps = actionable_steps(req_obj)
+    return next((s for s in steps if s.claimed_by_id == me.id), None) \
+        or next((s for s in steps if s.approver_id == me.id), None) \
+        or next(iter(steps), None)
+
+
+@approvals_bp.post("/approver/requests/<int:request_id>/claim")
+@require_login
+def approver_request_claim(request_id: int):
+    me = current_db_user()
+    if not me:
+        flash("You must be logged in.", "warning")
+        return redirect(url_for("auth.login"))
+
+    req_obj = _load_for_action(request_id)
+    if not req_obj:
+        flash("Request not found.", "warning")
+        return redirect(url_for("approvals_bp.approver_dashboard"))
+
+    step = _step_for_action(req_obj, me)
+    if not step:
+        flash("No pending step", "warning")
+        return redirect(url_for("approvals_bp.approver_dashboard"))
+
+    try:
+        claim_step(step, me)
+    except StepConflict:
+        flash("Another approver is already working on this request.", "warning")
+        return redirect(url_for("approvals_bp.approver_dashboard"))
+
+    flash("Request claimed — it's yours for the next few minutes.", "success")
+    return redirect(url_for("approvals_bp.approver_request_detail", request_id=request_id))
 
 @approvals_bp.post("/approver/requests/<int:request_id>/approve")
 @require_login
+@idempotent("approvals_bp.approver_request_detail")
 def approver_request_approve(request_id: int):
     me = current_db_user()
     if not me:
         flash("You must be logged in.", "warning")
+        allow_retry()
         return redirect(url_for("auth.login"))
 
-    req_obj = (Request.query
-               .options(joinedload(Request.approval_steps),
-                        joinedload(Request.requester),
-                        joinedload(Request.form_template))
-               .filter_by(id=request_id)
-               .first())
+    req_obj = _load_for_action(request_id)
     if not req_obj:
         flash("Request not found.", "warning")
+        allow_retry()
         return redirect(url_for("approvals_bp.approver_dashboard"))
 
     # For DEMO: Get any pending step and assign to current user
-    step = next((s for s in req_obj.approval_steps if s.status == "pending"), None)
+    step = _step_for_action(req_obj, me)
     if not step:
         flash("No pending step", "warning")
+        allow_retry()
         return redirect(url_for("approvals_bp.approver_dashboard"))
-    
-    # Assign this step to current approver if not already assigned
-    if step.approver_id != me.id:
-        step.approver_id = me.id
 
     # ensure signature exists
     sig = Signature.query.filter_by(user_id=me.id).first()
     if not sig or not sig.image_path:
         flash("Please upload a signature first", "warning")
+        allow_retry()
         return redirect(url_for("approvals_bp.signature_upload_get"))
 
-    # Collect signature paths: student signature first, then approvers
-    signature_paths = []
-    
-    # Add student/requester signature first
-    student_sig = Signature.query.filter_by(user_id=req_obj.requester_id).first()
-    if student_sig and student_sig.image_path:
-        signature_paths.append(student_sig.image_path)
-    
-    # Add approver signatures in sequence order
-    for s in sorted(req_obj.approval_steps, key=lambda x: x.sequence):
-        if s.status == "approved" or s.id == step.id:
-            approver_sig = Signature.query.filter_by(user_id=s.approver_id).first()
-            if approver_sig and approver_sig.image_path:
-                signature_paths.append(approver_sig.image_path)
-
-    # Generate PDF and store relative path
-    pdf_rel_path = generate_request_pdf(req_obj, signature_paths)
-    step.signed_pdf_path = pdf_rel_path
-
-    # Update step
+    # Take the step before the render so a losing approver bails out cheaply
+    try:
+        claim_step(step, me)
+    except StepConflict:
+        flash("Another approver is already working on this request.", "warning")
+        allow_retry()
+        return redirect(url_for("approvals_bp.approver_dashboard"))
+
+    # Assign this step to current approver if not already assigned
+    if step.approver_id != me.id:
+        step.approver_id = me.id
+
+    # Update step (the approval record page shows the date and comments)
     step.status = "approved"
     step.actioned_at = datetime.utcnow()
     step.comments = request.form.get("comments")
 
-    # If all steps approved, mark request approved
-    if all(s.status == "approved" for s in req_obj.approval_steps):
+    # Student signature, then every approval so far in sequence order
+    student_sig = Signature.query.filter_by(user_id=req_obj.requester_id).first()
+    approved = [s for s in sorted(req_obj.approval_steps, key=lambda x: x.sequence)
+                if s.status == "approved"]
+    sigs = dict(db.session.query(Signature.user_id, Signature.image_path)
+                .filter(Signature.user_id.in_({s.approver_id for s in approved})))
+    approvals = [(s, me if s.id == step.id else s.approver, sigs.get(s.approver_id)) for s in approved]
+
+    # Stamp this approval onto the signed PDF so far and store relative path
+    try:
+        step.signed_pdf_path = sign_request_pdf(req_obj, step, approvals,
+                                                student_sig.image_path if student_sig else None)
+    except RuntimeError as e:
+        db.session.rollback()
+        allow_retry()
+        if isinstance(e, RenderBusy):
+            # had to fall back to a full render and the render queue is full; the
+            # claim stays ours, so retrying in a moment picks up where this left off
+            flash("The PDF service is busy right now. Please try approving again in a moment.", "warning")
+        else:
+            # render killed (RenderKilled) or the LaTeX build failed: let go of the step
+            current_app.logger.warning("signed PDF for request %s not rendered: %s",
+                                       request_id, str(e).splitlines()[0] if str(e) else type(e).__name__)
+            release_claim(step)
+            try:
+                db.session.commit()
+            except StaleDataError:
+                db.session.rollback()
+            flash("The signed PDF could not be generated. Please try approving again.", "danger")
+        return redirect(url_for("approvals_bp.approver_request_detail", request_id=request_id))
+    release_claim(step)
+
+    # Skip any-of siblings; if every step is now done, mark request approved
+    fully_approved = complete_step(req_obj, step)
+    if fully_approved:
         req_obj.status = "approved"
+    record_event(req_obj, "approved", actor=me, step=step, comments=step.comments,
+                 signed_pdf=step.signed_pdf_path, final=fully_approved or None)
+
+    sync_work_queue(req_obj)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        # Someone else changed the step/request while we rendered
+        db.session.rollback()
+        record("commit_conflicts")
+        record("wasted_renders")
+        flash("This request changed while you were approving it. Please review it again.", "warning")
+        allow_retry()
+        return redirect(url_for("approvals_bp.approver_request_detail", request_id=request_id))
+
+    if fully_approved:
         flash("Request fully approved ✅", "success")
     else:
         flash("Approved and forwarded to next approver ➡️", "success")
-
-    db.session.commit()
     return redirect(url_for("approvals_bp.approver_dashboard"))
 
 @approvals_bp.post("/approver/requests/<int:request_id>/return")
 @require_login
+@idempotent("approvals_bp.approver_request_detail")
 def approver_request_return(request_id: int):
     me = current_db_user()
     if not me:
         flash("You must be logged in.", "warning")
+        allow_retry()
         return redirect(url_for("auth.login"))
 
-    req_obj = (Request.query
-               .options(joinedload(Request.approval_steps),
-                        joinedload(Request.requester),
-                        joinedload(Request.form_template))
-               .filter_by(id=request_id)
-               .first())
+    req_obj = _load_for_action(request_id)
     if not req_obj:
         flash("Request not found.", "warning")
+        allow_retry()
         return redirect(url_for("approvals_bp.approver_dashboard"))
 
     # For DEMO: Get any pending step
-    step = next((s for s in req_obj.approval_steps if s.status == "pending"), None)
+    step = _step_for_action(req_obj, me)
     if not step:
         flash("No pending step", "warning")
+        allow_retry()
+        return redirect(url_for("approvals_bp.approver_dashboard"))
+
+    holder = claim_holder(step)
+    if holder and holder != me.id:
+        record("claim_conflicts")
+        flash("Another approver is already working on this request.", "warning")
+        allow_retry()
         return redirect(url_for("approvals_bp.approver_dashboard"))
     
     # Assign to current user if needed
@@ -622,9 +917,14 @@ def approver_request_return(request_id: int):
     step.status = "returned"
     step.actioned_at = datetime.utcnow()
     step.comments = request.form.get("comments")
+    release_claim(step)
 
     # Update request
     req_obj.status = "returned"
+    # the reset below wipes the earlier approvals from the steps; the event keeps them
+    record_event(req_obj, "returned", actor=me, step=step, comments=step.comments,
+                 undone=[s.sequence for s in req_obj.approval_steps
+                         if s.id != step.id and s.status == "approved"] or None)
 
     # Reset all other steps
     for s in req_obj.approval_steps:
@@ -632,11 +932,75 @@ def approver_request_return(request_id: int):
             s.status = "pending"
             s.actioned_at = None
             s.signed_pdf_path = None
+            release_claim(s)
+
+    sync_work_queue(req_obj)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        record("commit_conflicts")
+        flash("This request changed while you were returning it. Please review it again.", "warning")
+        allow_retry()
+        return redirect(url_for("approvals_bp.approver_request_detail", request_id=request_id))
 
-    db.session.commit()
     flash("Request returned to student for revision 🔙", "success")
     return redirect(url_for("approvals_bp.approver_dashboard"))
 
+# -------- Draft Autosave --------
+# form_fill.html sends JSON-patch deltas as the user types (see approvals.drafts)
+
+register_collector("draft_autosave_total", "Draft autosave activity (see approvals.drafts).", "counter",
+                   lambda: {(("event", k),): v for k, v in AUTOSAVE_STATS.items()})
+
+
+@approvals_bp.post("/api/drafts")
+@require_login
+def create_draft():
+    """Start a draft on the first autosave of a new form: {"form_code", "patch"} -> {"id", "version", "edit_url"}."""
+    me = current_db_user()
+    if not me:
+        return jsonify({"error": "not logged in"}), 401
+
+    body = request.get_json(silent=True) or {}
+    form_template = FormTemplate.query.filter_by(form_code=body.get("form_code")).first()
+    if not form_template:
+        return jsonify({"error": "unknown form"}), 404
+    try:
+        form_data = apply_patch({}, body.get("patch") or [], get_schema(form_template))
+    except PatchError as e:
+        return jsonify({"error": str(e)}), 400
+
+    req_obj = Request(form_template_id=form_template.id, requester_id=me.id, form_data_json=form_data,
+                      status="draft")
+    db.session.add(req_obj)
+    record_event(req_obj, "edited", actor=me, fields=changed_fields({}, form_data), autosave=True)
+    db.session.commit()
+    return jsonify({"id": req_obj.id, "version": req_obj.version,
+                    "edit_url": url_for("approvals_bp.edit_request", request_id=req_obj.id)}), 201
+
+
+@approvals_bp.patch("/api/drafts/<int:request_id>")
+@require_login
+def autosave_draft(request_id: int):
+    """Apply {"version", "patch": [RFC 6902 ops]} to a draft -> {"version"}; 409 with the current data on conflict."""
+    me = current_db_user()
+    if not me:
+        return jsonify({"error": "not logged in"}), 401
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or "version" not in body:
+        return jsonify({"error": "version and patch required"}), 400
+    try:
+        version = patch_draft(request_id, me.id, body["version"], body.get("patch"))
+    except LookupError:
+        return jsonify({"error": "not found"}), 404
+    except PatchError as e:
+        return jsonify({"error": str(e)}), 400
+    except DraftConflict as e:
+        return jsonify({"error": "conflict", "version": e.version, "form_data": e.form_data}), 409
+    return jsonify({"version": version})
+
 # -------- Student Request Detail --------
 
 @approvals_bp.get("/student/requests/<int:request_id>")
@@ -647,23 +1011,133 @@ def student_request_detail(request_id: int):
         flash("You must be logged in.", "warning")
         return redirect(url_for("auth.login"))
 
-    req_obj = (Request.query
-               .options(joinedload(Request.form_template),
-                        joinedload(Request.requester),
-                        
-joinedload(Request.approval_steps).joinedload(ApprovalStep.approver))
-               .filter_by(id=request_id)
-               .first())
+    d = _cached_detail(request_id)
+    if not d:
+        flash("Request not found.", "warning")
+        return redirect(url_for("approvals_bp.list_my_requests"))
+
+    if d["requester_id"] != me.id and me.role != "admin":
+        flash("You are not authorized to view this request.", "warning")
+        return redirect(url_for("approvals_bp.list_my_requests"))
+
+    return render_template("request_detail.html", d=d, view="student", can_preview=True)
+
+
+# -------- HTML Preview --------
+# Renders the PDF's field mapping (forms_config.FORM_LAYOUTS) as a print-styled
+# page through Jinja; no pdflatex and no render workers involved.
+
+# request_id -> ((version, signature paths), preview HTML)
+preview_cache = VersionedCache(maxsize=512)
+
+register_collector("preview_cache_lookups_total", "Request preview cache lookups by result.", "counter",
+                   lambda: {(("result", "hit"),): preview_cache.hits, (("result", "miss"),): preview_cache.misses})
+
+
+def _can_preview(me: User, requester_id: int, approver_ids) -> bool:
+    return me.id == requester_id or me.role == "admin" or me.id in approver_ids
+
+
+def _signature_url(path: str) -> str:
+    return url_for("approvals_bp.serve_signature", filename=os.path.basename(path))
+
+
+def _preview_signatures(req_obj: Request):
+    """Student signature, then each approved step's approver in sequence order, as on the signed PDF."""
+    approved = [s for s in sorted(req_obj.approval_steps, key=lambda x: x.sequence) if s.status == "approved"]
+    sigs = dict(db.session.query(Signature.user_id, Signature.image_path)
+                .filter(Signature.user_id.in_({req_obj.requester_id} | {s.approver_id for s in approved})))
+    return [sigs.get(req_obj.requester_id)] + [sigs.get(s.approver_id) for s in approved]
+
+
+@approvals_bp.get("/requests/<int:request_id>/preview")
+@require_login
+def request_preview(request_id: int):
+    me = current_db_user()
+    if not me:
+        flash("You must be logged in.", "warning")
+        return redirect(url_for("auth.login"))
+
+    req_obj = _load_for_action(request_id) or load_archived(request_id)
     if not req_obj:
         flash("Request not found.", "warning")
         return redirect(url_for("approvals_bp.list_my_requests"))
 
-    if req_obj.requester_id != me.id and me.role != "admin":
+    if not _can_preview(me, req_obj.requester_id, {s.approver_id for s in req_obj.approval_steps}):
         flash("You are not authorized to view this request.", "warning")
         return redirect(url_for("approvals_bp.list_my_requests"))
 
-    d = _detail_dto(req_obj)
-    return render_template("request_detail.html", d=d, view="student")
+    # a re-uploaded signature doesn't bump the request's version, so it is part of the key
+    signatures = _preview_signatures(req_obj)
+    key = (req_obj.version, tuple(signatures))
+    html = preview_cache.get(request_id, key)
+    if html is None:
+        context = preview_context(req_obj.form_template, req_obj.form_data_json,
+                                  req_obj.requester.name if req_obj.requester else "Unknown",
+                                  _fmt_dt(req_obj.submitted_at) or "Not yet submitted",
+                                  signatures, _signature_url)
+        html = render_template("form_preview.html", **context)
+        preview_cache.put(request_id, key, html)
+    return html
+
+
+@approvals_bp.post("/forms/<form_code>/preview")
+@require_login
+def form_preview(form_code):
+    """Preview of the form as currently filled in on form_fill.html; nothing is saved."""
+    form_template = FormTemplate.query.filter_by(form_code=form_code).first_or_404()
+    me = current_db_user()
+    if not me:
+        flash("You must be logged in.", "warning")
+        return redirect(url_for("auth.login"))
+
+    schema = get_schema(form_template)
+    # shown as typed: validation errors are reported on submit, not here
+    form_data, _ = schema.validate(schema.parse(request.form))
+    sig = Signature.query.filter_by(user_id=me.id).first()
+    context = preview_context(form_template, form_data, me.name, "Not yet submitted",
+                              [sig.image_path if sig else None], _signature_url)
+    return render_template("form_preview.html", **context)
+
+# -------- Admin: Turnaround Analytics --------
+# answered from the rollup tables, never from requests/steps (see approvals.analytics)
+
+@approvals_bp.get("/admin/analytics")
+@require_login
+@require_admin
+def admin_analytics():
+    """
+    JSON report: ?by=form|approver|week|day|hour, optional since / until
+    (YYYY-MM-DD, until inclusive; the last year by default), form (form code),
+    approver (email) and p (percentiles, e.g. 50,90,99).
+    """
+    by = (request.args.get("by") or "form").lower()
+    if by not in ANALYTICS_GROUPS:
+        return jsonify({"error": f"by must be one of {', '.join(ANALYTICS_GROUPS)}"}), 400
+    try:
+        since = datetime.strptime(request.args["since"], "%Y-%m-%d") if request.args.get("since") else None
+        until = datetime.strptime(request.args["until"], "%Y-%m-%d") + timedelta(days=1) \
+            if request.args.get("until") else None
+        percentiles = [float(p) for p in (request.args.get("p") or "50,90,99").split(",")]
+    except ValueError:
+        return jsonify({"error": "since/until must be YYYY-MM-DD and p a list of numbers"}), 400
+    if not all(0 <= p <= 100 for p in percentiles):
+        return jsonify({"error": "percentiles must be between 0 and 100"}), 400
+
+    form_id = approver_id = None
+    if request.args.get("form"):
+        form = FormTemplate.query.filter_by(form_code=request.args["form"]).first()
+        if form is None:
+            return jsonify({"error": "unknown form"}), 404
+        form_id = form.id
+    if request.args.get("approver"):
+        approver = User.query.filter(func.lower(User.email) == request.args["approver"].lower()).first()
+        if approver is None:
+            return jsonify({"error": "unknown approver"}), 404
+        approver_id = approver.id
+
+    rows = analytics_report(by, since, until, form_id, approver_id, percentiles)
+    return jsonify({"by": by, "rows": rows})
 
 # For implementation
 
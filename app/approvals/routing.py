@@ -0,0 +1,132 @@
+# app/approvals/routing.py
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+
+from app.models import db, User, Request, ApprovalStep
+from app.approvals.assignment import assign, load_counters, DEFAULT_STRATEGY
+from app.utils.forms_config import FORM_ROUTES, DEFAULT_ROUTE
+
+STAGE_MODES = ("one", "all", "any")
+FALLBACK_POOL = {"roles": ["admin"]}
+
+
+class NoApprovers(Exception):
+    """A stage of the route has nobody to assign, not even an admin."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"No approvers are configured for the {stage} stage of this form.")
+        self.stage = stage
+
+
+def get_route(form_code: Optional[str]) -> List[dict]:
+    return FORM_ROUTES.get(form_code) or DEFAULT_ROUTE
+
+
+def _pool_key(stage: dict) -> tuple:
+    pool = stage.get("pool") or {}
+    return tuple(sorted((k, tuple(sorted(v))) for k, v in pool.items()))
+
+
+# (database url, pool key) -> (expires_at, user ids); membership changes rarely, submissions often
+_pool_cache: Dict[tuple, tuple] = {}
+POOL_CACHE_SECONDS = 30
+
+
+def _pool_user_ids(pool: dict) -> List[int]:
+    """Active users matching a stage's pool, in a stable order."""
+    roles = [r.lower() for r in pool.get("roles", [])]
+    emails = [e.lower() for e in pool.get("emails", [])]
+    if not roles and not emails:
+        return []
+    clauses = []
+    if roles:
+        clauses.append(User.role.in_(roles))
+    if emails:
+        clauses.append(func.lower(User.email).in_(emails))
+    rows = (db.session.query(User.id)
+            .filter(User.status == "active", db.or_(*clauses))
+            .order_by(User.id)
+            .all())
+    return [r[0] for r in rows]
+
+
+def build_steps(req: Request) -> List[ApprovalStep]:
+    """
+    Create every step of the request's route and attach them to ``req``.
+
+    Nothing is committed; the caller's commit writes the request and all its
+    steps in one transaction. Stages are numbered by ``sequence``; steps in the
+    same stage run in parallel. Approvers come from each stage's pool via the
+    assignment service (least-loaded by default, ``"strategy"`` per stage),
+    never the requester. If nobody in a stage's pool is available, the stage
+    goes to the admins; with no admin either, raises NoApprovers rather than
+    leave the request without an approver.
+    """
+    form_code = req.form_template.form_code if req.form_template else None
+    route = get_route(form_code)
+
+    now = time.monotonic()
+    pools = {}
+    for stage in route:
+        key = _pool_key(stage)
+        if key in pools:
+            continue
+        cache_key = (str(db.engine.url), key)
+        cached = _pool_cache.get(cache_key)
+        if cached is None or cached[0] < now:
+            cached = (now + POOL_CACHE_SECONDS, _pool_user_ids(stage.get("pool") or {}))
+            _pool_cache[cache_key] = cached
+        pools[key] = cached[1]
+
+    loads = load_counters({uid for ids in pools.values() for uid in ids})
+    # (set through the relationship before the first flush, the id isn't there yet)
+    requester_id = req.requester_id if req.requester_id is not None else getattr(req.requester, "id", None)
+    handed_out = {}
+    admins = None
+    steps = []
+    for sequence, stage in enumerate(route, start=1):
+        mode = stage.get("mode", "one")
+        if mode not in STAGE_MODES:
+            raise ValueError(f"Unknown stage mode {mode!r} in route for {form_code}")
+        key = _pool_key(stage)
+        candidates = [uid for uid in pools[key] if uid != requester_id]
+        if mode == "one":
+            wanted = 1
+        else:
+            wanted = stage.get("count") or len(candidates) or 1
+        approver_ids = assign(candidates, wanted,
+                              strategy=stage.get("strategy", DEFAULT_STRATEGY),
+                              pool_key=key, pending=handed_out, loads=loads)
+        if not approver_ids:
+            if admins is None:
+                admins = [uid for uid in _pool_user_ids(FALLBACK_POOL) if uid != requester_id]
+            approver_ids = assign(admins, wanted, pending=handed_out)
+        if not approver_ids:
+            raise NoApprovers(stage.get("name") or f"#{sequence}")
+        for approver_id in approver_ids:
+            step = ApprovalStep(
+                approver_id=approver_id,
+                sequence=sequence,
+                stage=stage.get("name"),
+                stage_mode=mode,
+                status="pending",
+            )
+            req.approval_steps.append(step)
+            steps.append(step)
+    return steps
+
+
+def complete_step(req: Request, step: ApprovalStep) -> bool:
+    """
+    Apply the routing consequences of ``step`` having just been approved.
+
+    For an any-of stage the sibling steps are skipped. Returns True once every
+    step of the request is approved or skipped.
+    """
+    if step.stage_mode == "any":
+        for s in req.approval_steps:
+            if s is not step and s.sequence == step.sequence and s.status == "pending":
+                s.status = "skipped"
+    return all(s.status in ("approved", "skipped") for s in req.approval_steps)
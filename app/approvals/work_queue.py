@@ -0,0 +1,110 @@
+# app/approvals/work_queue.py
+from datetime import datetime
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload
+
+from app.models import db, Request, ApprovalStep, WorkQueueItem
+
+# session.info flag: queue rows written while it is set are a rebuild, not new work
+REBUILDING = "work_queue_rebuild"
+
+
+def actionable_steps(req: Request):
+    """Pending steps that can be acted on now: those in the lowest pending sequence."""
+    if req.status != "pending":
+        return []
+    pending = [s for s in req.approval_steps if s.status == "pending"]
+    if not pending:
+        return []
+    current = min(s.sequence for s in pending)
+    return [s for s in pending if s.sequence == current]
+
+
+def _queue_item(req: Request, step: ApprovalStep, queued_at: datetime) -> WorkQueueItem:
+    return WorkQueueItem(
+        step=step,
+        request=req,
+        approver_id=step.approver_id,
+        form_template_id=req.form_template.id if req.form_template else req.form_template_id,
+        form_name=req.form_template.name if req.form_template else "—",
+        student_name=req.requester.name if req.requester else "—",
+        sequence=step.sequence,
+        submitted_at=req.submitted_at,
+        queued_at=queued_at,
+    )
+
+
+def sync_request(req: Request) -> None:
+    """
+    Bring the work_queue rows for one request in line with its steps.
+
+    Call before the route's commit so the queue changes land in the same
+    transaction as the request/step changes. Rows for steps that are still
+    actionable keep their original queued_at.
+    """
+    if inspect(req).pending:
+        existing = {}
+    else:
+        # (autoflushes, so steps added to an existing request get their ids)
+        existing = {q.step_id: q for q in WorkQueueItem.query.filter_by(request_id=req.id).all()}
+    wanted = actionable_steps(req)
+    wanted_ids = {s.id for s in wanted if s.id is not None}
+
+    for step_id, item in existing.items():
+        if step_id not in wanted_ids:
+            db.session.delete(item)
+
+    now = datetime.utcnow()
+    for step in wanted:
+        item = existing.get(step.id) if step.id is not None else None
+        if item is None:
+            db.session.add(_queue_item(req, step, now))
+        else:
+            item.approver_id = step.approver_id
+            item.submitted_at = req.submitted_at
+
+
+def queue_query(approver_id=None, q=None):
+    """Work queue rows, newest first, optionally for one approver and/or matching a search."""
+    query = WorkQueueItem.query
+    if approver_id is not None:
+        query = query.filter(WorkQueueItem.approver_id == approver_id)
+    if q:
+        like = f"%{q}%"
+        clauses = [WorkQueueItem.student_name.ilike(like), WorkQueueItem.form_name.ilike(like)]
+        if q.isdigit():
+            clauses.append(WorkQueueItem.request_id == int(q))
+        query = query.filter(db.or_(*clauses))
+    return query.order_by(WorkQueueItem.queued_at.desc(), WorkQueueItem.id.desc())
+
+
+def rebuild_work_queue(batch_size: int = 500) -> int:
+    """Repopulate the queue from scratch for every pending request. Returns rows written."""
+    db.session.info[REBUILDING] = True
+    try:
+        WorkQueueItem.query.delete(synchronize_session=False)
+        written = 0
+        last_id = 0
+        while True:
+            batch = (Request.query
+                     .filter(Request.status == "pending", Request.id > last_id)
+                     .options(joinedload(Request.approval_steps),
+                              joinedload(Request.requester),
+                              joinedload(Request.form_template))
+                     .order_by(Request.id)
+                     .limit(batch_size)
+                     .all())
+            if not batch:
+                break
+            for req in batch:
+                for step in actionable_steps(req):
+                    queued_at = req.updated_at or req.submitted_at or datetime.utcnow()
+                    db.session.add(_queue_item(req, step, queued_at))
+                    written += 1
+            db.session.commit()
+            last_id = batch[-1].id
+        db.session.commit()
+    finally:
+        db.session.info.pop(REBUILDING, None)
+    return written
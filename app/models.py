@@ -1,5 +1,7 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, insert, update
+from sqlalchemy.orm import Session
 
 db = SQLAlchemy()
 
@@ -19,7 +21,8 @@ class User(db.Model):
     # Relationships
     signatures = db.relationship('Signature', back_populates='user', cascade='all, delete-orphan')
     requests = db.relationship('Request', back_populates='requester', cascade='all, delete-orphan')
-    approval_steps = db.relationship('ApprovalStep', back_populates='approver', cascade='all, delete-orphan')
+    approval_steps = db.relationship('ApprovalStep', back_populates='approver', cascade='all, delete-orphan',
+                                     foreign_keys='ApprovalStep.approver_id')
 
     def as_dict(self):
         return {
@@ -59,6 +62,8 @@ class FormTemplate(db.Model):
     form_code = db.Column(db.String(50), unique=True, nullable=False)
     latex_template_path = db.Column(db.String(255), nullable=False)
     fields_json = db.Column(db.JSON, nullable=False)
+    # PDF backend: 'latex' (pdflatex templates) | 'python' (in-process, see pdf_layout)
+    renderer = db.Column(db.String(20), nullable=False, default="latex", server_default="latex")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     requests = db.relationship('Request', back_populates='form_template', cascade='all, delete-orphan')
@@ -70,12 +75,17 @@ class FormTemplate(db.Model):
             "form_code": self.form_code,
             "latex_template_path": self.latex_template_path,
             "fields_json": self.fields_json,
+            "renderer": self.renderer,
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
 
 
 class Request(db.Model):
     __tablename__ = "requests"
+    __table_args__ = (
+        # "My Requests" lists a user's requests newest first
+        db.Index("ix_requests_requester_created", "requester_id", "created_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     form_template_id = db.Column(db.Integer, db.ForeignKey('form_templates.id'), nullable=False)
@@ -85,6 +95,14 @@ class Request(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     submitted_at = db.Column(db.DateTime, nullable=True)
+    # Bumped whenever the request or one of its approval steps changes (see
+    # _bump_request_versions); cached views are keyed on it.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    # Every UPDATE is a compare-and-swap on version; a concurrent writer gets
+    # StaleDataError instead of silently overwriting. The value itself is
+    # managed by _bump_request_versions.
+    __mapper_args__ = {"version_id_col": version, "version_id_generator": False}
 
     form_template = db.relationship('FormTemplate', back_populates='requests')
     requester = db.relationship('User', back_populates='requests')
@@ -100,6 +118,7 @@ class Request(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
             "submitted_at": self.submitted_at.isoformat() if self.submitted_at else None,
+            "version": self.version,
         }
 
 
@@ -110,13 +129,23 @@ class ApprovalStep(db.Model):
     request_id = db.Column(db.Integer, db.ForeignKey('requests.id'), nullable=False)
     approver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     sequence = db.Column(db.Integer, nullable=False)
-    status = db.Column(db.Enum('pending', 'approved', 'rejected', 'returned', name='approval_step_status'), nullable=False, default='pending')
+    status = db.Column(db.Enum('pending', 'approved', 'rejected', 'returned', 'skipped', name='approval_step_status'), nullable=False, default='pending')
+    # Routing stage this step belongs to; steps sharing a sequence run in parallel
+    stage = db.Column(db.String(80), nullable=True)
+    stage_mode = db.Column(db.String(10), nullable=False, default="all", server_default="all")  # 'one' | 'all' | 'any'
     comments = db.Column(db.Text, nullable=True)
     signed_pdf_path = db.Column(db.String(255), nullable=True)
     actioned_at = db.Column(db.DateTime, nullable=True)
+    # Short lease taken by an approver before the (slow) PDF render starts
+    claimed_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    claim_expires_at = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
     request = db.relationship('Request', back_populates='approval_steps')
-    approver = db.relationship('User', back_populates='approval_steps')
+    approver = db.relationship('User', back_populates='approval_steps', foreign_keys=[approver_id])
+    claimed_by = db.relationship('User', foreign_keys=[claimed_by_id])
 
     def as_dict(self):
         return {
@@ -124,8 +153,312 @@ class ApprovalStep(db.Model):
             "request_id": self.request_id,
             "approver_id": self.approver_id,
             "sequence": self.sequence,
+            "stage": self.stage,
+            "stage_mode": self.stage_mode,
             "status": self.status,
             "comments": self.comments,
             "signed_pdf_path": self.signed_pdf_path,
             "actioned_at": self.actioned_at.isoformat() if self.actioned_at else None,
+            "claimed_by_id": self.claimed_by_id,
+            "claim_expires_at": self.claim_expires_at.isoformat() if self.claim_expires_at else None,
+            "version": self.version,
         }
+
+
+class WorkQueueItem(db.Model):
+    """
+    One row per actionable approval step, denormalized so the approver
+    dashboard can be served from a single indexed scan. Maintained by
+    app.approvals.work_queue.sync_request in the same transaction as the
+    route that changes the request.
+    """
+    __tablename__ = "work_queue"
+    __table_args__ = (
+        db.Index("ix_work_queue_approver_queued", "approver_id", "queued_at"),
+        db.Index("ix_work_queue_queued", "queued_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    step_id = db.Column(db.Integer, db.ForeignKey('approval_steps.id', ondelete='CASCADE'), unique=True, nullable=False)
+    request_id = db.Column(db.Integer, db.ForeignKey('requests.id', ondelete='CASCADE'), nullable=False, index=True)
+    approver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    form_template_id = db.Column(db.Integer, db.ForeignKey('form_templates.id'), nullable=False)
+    form_name = db.Column(db.String(200), nullable=False)
+    student_name = db.Column(db.String(120), nullable=False)
+    sequence = db.Column(db.Integer, nullable=False)
+    submitted_at = db.Column(db.DateTime, nullable=True)
+    queued_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    step = db.relationship('ApprovalStep')
+    request = db.relationship('Request')
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "step_id": self.step_id,
+            "request_id": self.request_id,
+            "approver_id": self.approver_id,
+            "form_template_id": self.form_template_id,
+            "form_name": self.form_name,
+            "student_name": self.student_name,
+            "sequence": self.sequence,
+            "submitted_at": self.submitted_at.isoformat() if self.submitted_at else None,
+            "queued_at": self.queued_at.isoformat() if self.queued_at else None,
+        }
+
+
+class ApproverLoad(db.Model):
+    """
+    Live count of pending steps per approver, plus assignment settings.
+    open_steps is kept current by _track_approver_load on every flush, so
+    assignment never has to count approval_steps.
+    """
+    __tablename__ = "approver_load"
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    open_steps = db.Column(db.Integer, nullable=False, default=0, server_default="0", index=True)
+    weight = db.Column(db.Integer, nullable=False, default=1, server_default="1")  # share of new work
+    away_until = db.Column(db.DateTime, nullable=True)  # out of office: skipped by assignment until then
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship('User')
+
+    def as_dict(self):
+        return {
+            "user_id": self.user_id,
+            "open_steps": self.open_steps,
+            "weight": self.weight,
+            "away_until": self.away_until.isoformat() if self.away_until else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class IdempotencyKey(db.Model):
+    """
+    Outcome of a form POST, keyed by the one-time token embedded in the form,
+    so a double-click or a retry replays the first result instead of writing
+    (and rendering) again. Rows are short-lived; see app.approvals.idempotency.
+    """
+    __tablename__ = "idempotency_keys"
+
+    key = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(180), nullable=False)  # signed-in user's email
+    endpoint = db.Column(db.String(80), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default="pending")  # 'pending' | 'done'
+    location = db.Column(db.String(255), nullable=True)  # where the first response redirected to
+    flashes = db.Column(db.JSON, nullable=True)  # [[category, message], ...] it flashed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class RequestEvent(db.Model):
+    """
+    Append-only log of what happened to a request: submitted, approved,
+    returned, edited. Written in the same transaction as the action and never
+    updated, so a return that resets the steps doesn't erase the approvals
+    before it. Written through app.approvals.history.record_event.
+    """
+    __tablename__ = "request_events"
+    __table_args__ = (
+        # one request's events in order (timeline tails)
+        db.Index("ix_request_events_request_id", "request_id", "id"),
+        # audits: everything in a date range, or one person's actions in it
+        db.Index("ix_request_events_at", "at", "id"),
+        db.Index("ix_request_events_actor_at", "actor_id", "at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('requests.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'submitted' | 'approved' | 'returned' | 'edited'
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    actor_name = db.Column(db.String(120), nullable=True)  # as it was at the time
+    step_id = db.Column(db.Integer, nullable=True)
+    sequence = db.Column(db.Integer, nullable=True)
+    at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    data = db.Column(db.JSON, nullable=True)  # comments, changed fields, signed PDF, ...
+
+    request = db.relationship('Request')
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "actor_id": self.actor_id,
+            "actor_name": self.actor_name,
+            "step_id": self.step_id,
+            "sequence": self.sequence,
+            "at": self.at.isoformat() if self.at else None,
+            "data": self.data,
+        }
+
+
+class RequestTimeline(db.Model):
+    """
+    Snapshot of a request's display timeline folded up to last_event_id.
+    A timeline read is this row plus the (short) tail of events after it;
+    tail_count says how long that tail is so writers know when to fold it in.
+    """
+    __tablename__ = "request_timelines"
+
+    request_id = db.Column(db.Integer, db.ForeignKey('requests.id', ondelete='CASCADE'), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    tail_count = db.Column(db.Integer, nullable=False, default=0)
+    entries = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ApprovalRollup(db.Model):
+    """
+    Approval counts and durations per hour, day, week or month, form and
+    approver. Each change lands in every grain, and in the total cells
+    (form_template_id and/or approver_id 0) as well as its own, so
+    a report reads the fewest, coarsest cells that answer it. Kept current on
+    every flush by app.approvals.analytics and rebuilt from the steps by
+    ``flask --app run rebuild-analytics``.
+    """
+    __tablename__ = "approval_rollups"
+    # clustered on the key: one form/approver combination's periods are one
+    # contiguous range, and a report's scan reads the cells themselves
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    grain = db.Column(db.String(5), primary_key=True)  # 'hour' | 'day' | 'week' | 'month'
+    form_template_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 = all forms
+    approver_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 = all approvers
+    period_start = db.Column(db.DateTime, primary_key=True)
+    queued = db.Column(db.Integer, nullable=False, default=0)    # steps that reached the approver's queue
+    dequeued = db.Column(db.Integer, nullable=False, default=0)  # steps that left it, for any reason
+    approved = db.Column(db.Integer, nullable=False, default=0)
+    returned = db.Column(db.Integer, nullable=False, default=0)
+    wait_seconds = db.Column(db.Float, nullable=False, default=0)  # queue-to-decision time of those
+    completed = db.Column(db.Integer, nullable=False, default=0)  # requests this step finally approved
+    turnaround_seconds = db.Column(db.Float, nullable=False, default=0)  # submit-to-approval time of those
+
+
+class ApprovalRollupBucket(db.Model):
+    """
+    Histogram of wait / turnaround times per rollup cell, so percentiles can
+    be summed over any range of cells. Bucket bounds are analytics.BOUNDS.
+    """
+    __tablename__ = "approval_rollup_buckets"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    grain = db.Column(db.String(5), primary_key=True)
+    form_template_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    approver_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    period_start = db.Column(db.DateTime, primary_key=True)
+    metric = db.Column(db.String(10), primary_key=True)  # 'wait' | 'turnaround'
+    bucket = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ArchivedRequest(db.Model):
+    """
+    A closed request moved out of requests / approval_steps by
+    app.approvals.archive: the columns My Requests lists, plus the request
+    and its steps as zlib-compressed JSON. Events and timeline snapshots stay
+    where they are, keyed by the same request id.
+    """
+    __tablename__ = "archived_requests"
+    __table_args__ = (
+        db.Index("ix_archived_requests_requester_created", "requester_id", "created_at"),
+    )
+
+    request_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    form_template_id = db.Column(db.Integer, db.ForeignKey('form_templates.id'), nullable=False)
+    requester_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # 'approved' | 'rejected'
+    created_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    submitted_at = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    payload = db.Column(db.LargeBinary, nullable=False)  # zlib(JSON): Request.as_dict() + "steps"
+
+
+# Step columns whose changes don't alter what the request looks like (claiming
+# a step must not collide with, or invalidate, the request itself)
+_STEP_BOOKKEEPING_ATTRS = {"claimed_by_id", "claim_expires_at", "claimed_by", "version"}
+
+
+def _step_content_modified(step):
+    state = inspect(step)
+    return any(attr.history.has_changes()
+               for attr in state.attrs
+               if attr.key not in _STEP_BOOKKEEPING_ATTRS)
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_request_versions(session, flush_context, instances):
+    """Increment Request.version once per flush for every request that changed,
+    either directly or through one of its approval steps."""
+    touched = {}
+    for obj in session.dirty:
+        if isinstance(obj, Request) and session.is_modified(obj):
+            touched[id(obj)] = obj
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, ApprovalStep):
+            continue
+        if obj in session.dirty and not _step_content_modified(obj):
+            continue
+        req = obj.request or (session.get(Request, obj.request_id) if obj.request_id else None)
+        if req is not None and req not in session.new and req not in session.deleted:
+            touched[id(req)] = req
+    for req in touched.values():
+        req.version = (req.version or 0) + 1
+
+
+def _pending_owner(step, current=True):
+    """(approver_id) holding this step as an open step, before or after the flush."""
+    state = inspect(step)
+    if current:
+        return step.approver_id if step.status == "pending" else None
+    status_hist = state.attrs.status.history
+    approver_hist = state.attrs.approver_id.history
+    old_status = (status_hist.deleted or status_hist.unchanged or [None])[0]
+    old_approver = (approver_hist.deleted or approver_hist.unchanged or [None])[0]
+    return old_approver if old_status == "pending" else None
+
+
+@event.listens_for(Session, "after_flush")
+def _track_approver_load(session, flush_context):
+    """Keep ApproverLoad.open_steps in step with pending ApprovalStep rows.
+
+    Runs in after_flush (attribute history is still intact) and applies the
+    deltas as SQL-side increments in the same transaction, so concurrent
+    writers don't lose counts and nothing has to be loaded."""
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, ApprovalStep):
+            owner = _pending_owner(obj)
+            if owner:
+                deltas[owner] = deltas.get(owner, 0) + 1
+    for obj in session.dirty:
+        if isinstance(obj, ApprovalStep):
+            before, after = _pending_owner(obj, current=False), _pending_owner(obj)
+            if before != after:
+                if before:
+                    deltas[before] = deltas.get(before, 0) - 1
+                if after:
+                    deltas[after] = deltas.get(after, 0) + 1
+    for obj in session.deleted:
+        if isinstance(obj, ApprovalStep):
+            owner = _pending_owner(obj, current=False)
+            if owner:
+                deltas[owner] = deltas.get(owner, 0) - 1
+
+    for user_id, delta in deltas.items():
+        if not delta:
+            continue
+        result = session.execute(
+            update(ApproverLoad.__table__)
+            .where(ApproverLoad.__table__.c.user_id == user_id)
+            .values(open_steps=ApproverLoad.__table__.c.open_steps + delta,
+                    updated_at=datetime.utcnow())
+        )
+        if result.rowcount == 0:
+            session.execute(
+                insert(ApproverLoad.__table__)
+                .values(user_id=user_id, open_steps=max(delta, 0), weight=1,
+                        updated_at=datetime.utcnow())
+            )
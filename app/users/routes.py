@@ -5,7 +5,13 @@ from flask import (
     redirect, url_for, flash
 )
 from sqlalchemy import func
-from app.models import db, User
+from sqlalchemy.exc import IntegrityError
+from app.models import db, User, ApproverLoad
+from datetime import datetime
+from itertools import islice
+import csv
+import io
+import json
 import os
 
 users_bp = Blueprint("users_bp", __name__)
@@ -197,7 +203,228 @@ def reactivate_user_api(user_id):
     db.session.commit()
     return jsonify(u.as_dict())
 
+# ----------------- Approver assignment settings -----------------
 
+@users_bp.get("/api/approver-load")
+@require_login
+@require_admin
+def list_approver_load_api():
+    loads = ApproverLoad.query.order_by(ApproverLoad.open_steps.desc()).all()
+    return jsonify([l.as_dict() for l in loads])
+
+@users_bp.put("/api/<int:user_id>/assignment")
+@require_login
+@require_admin
+def update_assignment_api(user_id):
+    """Set an approver's share of new work (weight) and/or out-of-office end (away_until)."""
+    u = User.query.get(user_id)
+    if not u:
+        return jsonify({"error": "not found"}), 404
+
+    data = request.get_json(silent=True) or {}
+    load = ApproverLoad.query.get(user_id)
+    if not load:
+        load = ApproverLoad(user_id=user_id, open_steps=0)
+        db.session.add(load)
+
+    if "weight" in data:
+        try:
+            weight = int(data["weight"])
+        except (TypeError, ValueError):
+            return jsonify({"error": "weight must be a positive integer"}), 400
+        if weight < 1:
+            return jsonify({"error": "weight must be a positive integer"}), 400
+        load.weight = weight
+    if "away_until" in data:
+        if data["away_until"]:
+            try:
+                load.away_until = datetime.fromisoformat(data["away_until"])
+            except (TypeError, ValueError):
+                return jsonify({"error": "away_until must be an ISO date/time"}), 400
+        else:
+            load.away_until = None
+
+    db.session.commit()
+    return jsonify(load.as_dict())
+
+# ----------------- Bulk JSON API -----------------
+
+BULK_CHUNK_SIZE = 500
+BULK_ROLES = ("admin", "approver", "basicuser")
+BULK_STATUSES = ("active", "deactivated")
+
+def _iter_bulk_rows():
+    """Yield row dicts from a JSON array, JSON lines or CSV request body.
+
+    JSONL and CSV bodies are read line by line from the request stream so a
+    large upload never has to be held in memory at once.
+    """
+    mimetype = (request.mimetype or "").lower()
+    if mimetype == "application/json":
+        data = request.get_json(silent=True)
+        rows = data.get("rows") if isinstance(data, dict) else data
+        for row in rows or []:
+            yield row if isinstance(row, dict) else {}
+        return
+
+    # utf-8-sig: spreadsheet exports (Excel) start with a byte-order mark
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline="")
+    if mimetype in ("text/csv", "application/csv"):
+        for row in csv.DictReader(lines):
+            yield {k.strip().lower(): v for k, v in row.items() if k}
+        return
+
+    # application/x-ndjson, application/jsonl, text/plain ...
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else {"_invalid": line}
+
+def _chunked(rows, size=BULK_CHUNK_SIZE):
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _existing_users_by_email(emails):
+    """One set-based lookup of users by lower-cased email."""
+    if not emails:
+        return {}
+    found = User.query.filter(func.lower(User.email).in_(list(emails))).all()
+    return {u.email.lower(): u for u in found}
+
+def _bulk_summary(results):
+    summary = {}
+    for r in results:
+        summary[r["result"]] = summary.get(r["result"], 0) + 1
+    return summary
+
+@users_bp.post("/api/bulk")
+@require_login
+@require_admin
+def bulk_create_users_api():
+    """Create many users from one JSON / JSONL / CSV upload.
+
+    Each row needs name and email; role and status are optional. Emails are
+    de-duplicated case-insensitively against the upload itself and against
+    the users table, and rows are committed in chunks of BULK_CHUNK_SIZE.
+    """
+    results = []
+    seen = set()
+    row_no = 0
+
+    for chunk in _chunked(_iter_bulk_rows()):
+        parsed = []
+        for row in chunk:
+            row_no += 1
+            email = (str(row.get("email") or "")).strip()
+            parsed.append((row_no, row, email))
+        existing = _existing_users_by_email({e.lower() for _, _, e in parsed if e})
+        created = []
+
+        for n, row, email in parsed:
+            name = (str(row.get("name") or "")).strip()
+            role = (str(row.get("role") or "basicuser")).strip().lower()
+            status = (str(row.get("status") or "active")).strip().lower()
+            key = email.lower()
+
+            if "_invalid" in row:
+                error = "invalid JSON"
+            elif not name or not email:
+                error = "name and email required"
+            elif role not in BULK_ROLES:
+                error = f"role must be one of {', '.join(BULK_ROLES)}"
+            elif status not in BULK_STATUSES:
+                error = "status must be 'active' or 'deactivated'"
+            elif key in seen:
+                error = "duplicate email in upload"
+            elif key in existing:
+                error = "email already exists"
+            else:
+                error = None
+
+            if error:
+                results.append({"row": n, "email": email, "result": "error", "error": error})
+                continue
+
+            seen.add(key)
+            db.session.add(User(name=name, email=email, role=role, status=status))
+            created.append({"row": n, "email": email, "result": "created"})
+            results.append(created[-1])
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # an email was added by someone else since the lookup; none of this
+            # chunk was written, so report its rows instead of failing the upload
+            db.session.rollback()
+            for r in created:
+                seen.discard(r["email"].lower())
+                r.update(result="error", error="not created: an email in this chunk was added concurrently")
+
+    return jsonify({"summary": _bulk_summary(results), "rows": results})
+
+@users_bp.post("/api/bulk/update")
+@require_login
+@require_admin
+def bulk_update_users_api():
+    """Change role and/or status for many users, matched by email.
+
+    Handy for deactivating a graduating class or promoting a cohort of
+    approvers in one upload instead of one PUT per user.
+    """
+    results = []
+    row_no = 0
+
+    for chunk in _chunked(_iter_bulk_rows()):
+        parsed = []
+        for row in chunk:
+            row_no += 1
+            email = (str(row.get("email") or "")).strip()
+            parsed.append((row_no, row, email))
+        existing = _existing_users_by_email({e.lower() for _, _, e in parsed if e})
+
+        for n, row, email in parsed:
+            role = (str(row.get("role") or "")).strip().lower()
+            status = (str(row.get("status") or "")).strip().lower()
+            u = existing.get(email.lower())
+
+            if "_invalid" in row:
+                error = "invalid JSON"
+            elif not email:
+                error = "email required"
+            elif not role and not status:
+                error = "role or status required"
+            elif role and role not in BULK_ROLES:
+                error = f"role must be one of {', '.join(BULK_ROLES)}"
+            elif status and status not in BULK_STATUSES:
+                error = "status must be 'active' or 'deactivated'"
+            elif not u:
+                error = "not found"
+            else:
+                error = None
+
+            if error:
+                results.append({"row": n, "email": email, "result": "error", "error": error})
+                continue
 
+            changed = False
+            if role and u.role != role:
+                u.role = role
+                changed = True
+            if status and u.status != status:
+                u.status = status
+                changed = True
+            results.append({"row": n, "email": email, "id": u.id,
+                            "result": "updated" if changed else "unchanged"})
 
+        db.session.commit()
 
+    return jsonify({"summary": _bulk_summary(results), "rows": results})
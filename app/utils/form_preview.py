@@ -0,0 +1,95 @@
+# app/utils/form_preview.py
+"""
+HTML preview of a form: the layout and PLAIN replacement values the
+in-process PDF renderer draws (see pdf_layout), flattened into dicts for
+the form_preview.html template.
+
+Nothing here runs pdflatex or writes files, so a preview is a builder
+call plus a Jinja render and can be served inline from a request.
+"""
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.utils.forms_config import DEFAULT_LAYOUT, FORM_LAYOUTS
+from app.utils.pdf_layout import STYLES, fill, layout_placeholders
+from app.utils.pdf_objects import FONTS
+from app.utils.pdf_replacements import MISSING, PLAIN, get_builder
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# style -> CSS declarations, from the PDF renderer's fonts and sizes
+PREVIEW_STYLES = {
+    name: (f"font-size: {size}pt; line-height: {leading}pt;"
+           + (" font-weight: bold;" if FONTS[font].endswith("Bold") else "")
+           + (" font-style: italic;" if FONTS[font].endswith("Oblique") else ""))
+    for name, (font, size, leading) in STYLES.items()
+}
+
+
+def _image(path: Optional[str], image_url: Callable[[str], str]) -> Optional[str]:
+    return image_url(path) if path else None
+
+
+def preview_blocks(layout: List[Tuple], values: Dict[str, Any],
+                   image_url: Callable[[str], str]) -> List[Dict[str, Any]]:
+    """
+    ``layout`` with every placeholder filled in, one dict per block (see
+    pdf_layout for the kinds). Image paths become ``image_url(path)``.
+    """
+    blocks = []
+    for block in layout:
+        kind, args = block[0], block[1:]
+        if kind in ("center", "text"):
+            blocks.append({"kind": kind, "text": fill(args[0], values),
+                           "style": args[1] if len(args) > 1 else "normal"})
+        elif kind in ("heading", "box"):
+            blocks.append({"kind": kind, "text": fill(args[0], values)})
+        elif kind == "space":
+            blocks.append({"kind": kind, "height": args[0]})
+        elif kind in ("fields", "columns"):
+            blocks.append({"kind": kind, "rows": [(label, fill(text, values)) for label, text in args[0]]})
+        elif kind == "list":
+            value = values.get(args[0])
+            if isinstance(value, (list, tuple)):
+                blocks.append({"kind": kind, "entries": [str(v) for v in value], "text": ""})
+            else:
+                blocks.append({"kind": kind, "entries": None, "text": "" if value is None else str(value)})
+        elif kind == "table":
+            if values.get(args[0]):
+                blocks.append({"kind": kind, **values[args[0]]})
+        elif kind == "summary":
+            rows = [(label, (", ".join(map(str, v)) or MISSING) if isinstance(v, (list, tuple)) else v)
+                    for label, v in values.get(args[0]) or []]
+            blocks.append({"kind": kind, "rows": rows})
+        elif kind == "signature":
+            blocks.append({"kind": kind, "url": _image(values.get(args[0]), image_url)})
+        elif kind == "approvals":
+            value = values.get(args[0])
+            if isinstance(value, str):
+                blocks.append({"kind": kind, "note": value, "urls": []})
+            else:
+                blocks.append({"kind": kind, "note": None, "urls": [image_url(p) for p in value or []]})
+        elif kind == "footer":
+            blocks.append({"kind": kind, "lines": list(args[0])})
+        else:
+            raise RuntimeError(f"Unknown layout block: {kind}")
+    return blocks
+
+
+def preview_context(form_template, form_data: Dict[str, Any], submitter_name: str, submitted_date: str,
+                    signature_paths: List[Optional[str]], image_url: Callable[[str], str]) -> Dict[str, Any]:
+    """
+    Template context for form_preview.html. ``signature_paths`` are the
+    student's then the approvers', as for generate_request_pdf; missing
+    files are left out the same way.
+    """
+    paths = [p for p in signature_paths
+             if p and os.path.exists(p if os.path.isabs(p) else os.path.join(REPO_ROOT, p))]
+    form_code = form_template.form_code
+    layout = FORM_LAYOUTS.get(form_code, DEFAULT_LAYOUT)
+    builder = get_builder(form_template, PLAIN)
+    values = builder(form_data or {}, submitter_name, submitted_date, paths, "",
+                     placeholders=layout_placeholders(layout))
+    title = form_template.name or form_code.replace("_", " ").title()
+    values["FORM_TITLE"] = title
+    return {"title": title, "blocks": preview_blocks(layout, values, image_url), "styles": PREVIEW_STYLES}
@@ -0,0 +1,182 @@
+# app/utils/form_schema.py
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y")
+
+
+def _scalar(value: Any) -> str:
+    """A single form value as text (first item if a list slipped through)."""
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else ""
+    return str(value)
+
+
+class FieldSpec:
+    """One compiled field of a FormTemplate.fields_json."""
+
+    __slots__ = ("key", "kind", "options", "option_set", "label")
+
+    def __init__(self, key: str, raw: Any):
+        self.key = key
+        self.label = key.replace("_", " ").title()
+        self.options: Tuple[str, ...] = ()
+        if isinstance(raw, dict) and raw.get("type") == "select":
+            self.kind = "select"
+            self.options = tuple(raw.get("options") or ())
+        elif isinstance(raw, list):
+            self.kind = "multi"
+            self.options = tuple(raw)
+        elif raw in ("text", "textarea", "email", "date", "auto_date", "file"):
+            self.kind = raw
+        else:
+            self.kind = "text"
+        self.option_set = frozenset(self.options)
+
+    # -- single value ---------------------------------------------------
+    def normalize(self, value: Any) -> Tuple[Any, Optional[str]]:
+        """Return (normalized value, error message or None)."""
+        kind = self.kind
+        if kind == "multi":
+            if value is None or value == "":
+                return [], None
+            values = [str(v).strip() for v in (value if isinstance(value, (list, tuple)) else [value])]
+            values = [v for v in values if v]
+            bad = [v for v in values if v not in self.option_set]
+            if bad:
+                return values, f"not a valid choice: {', '.join(bad)}"
+            return values, None
+
+        if value is None:
+            return None, None
+        value = _scalar(value).strip("\r\n " if kind == "textarea" else None)
+        if value == "":
+            return "", None
+
+        if kind == "email":
+            value = value.lower()
+            if not EMAIL_RE.match(value):
+                return value, "not a valid email address"
+        elif kind in ("date", "auto_date"):
+            for fmt in DATE_FORMATS:
+                try:
+                    return datetime.strptime(value, fmt).strftime("%Y-%m-%d"), None
+                except ValueError:
+                    continue
+            return value, "not a valid date (use YYYY-MM-DD)"
+        elif kind == "select":
+            if value not in self.option_set:
+                return value, "not a valid choice"
+        return value, None
+
+    # -- a whole column at once (batch mode) ----------------------------
+    def normalize_many(self, values: List[Any]) -> List[Tuple[Any, Optional[str]]]:
+        kind = self.kind
+        if kind in ("text", "textarea", "file"):
+            # nothing to check beyond trimming; skip the per-value dispatch
+            chars = "\r\n " if kind == "textarea" else None
+            return [(None if v is None else _scalar(v).strip(chars), None) for v in values]
+        if kind == "email":
+            match = EMAIL_RE.match
+            out = []
+            for v in values:
+                if v is None:
+                    out.append((None, None))
+                    continue
+                v = _scalar(v).strip().lower()
+                out.append((v, None if (v == "" or match(v)) else "not a valid email address"))
+            return out
+        if kind == "select":
+            opts = self.option_set
+            out = []
+            for v in values:
+                if v is None:
+                    out.append((None, None))
+                    continue
+                v = _scalar(v).strip()
+                out.append((v, None if (v == "" or v in opts) else "not a valid choice"))
+            return out
+        # dates and multi-selects repeat a lot across a batch; normalize each
+        # distinct value once
+        seen: Dict[Any, Tuple[Any, Optional[str]]] = {}
+        out = []
+        for v in values:
+            k = tuple(v) if isinstance(v, list) else v
+            r = seen.get(k)
+            if r is None:
+                r = seen[k] = self.normalize(v)
+            out.append(r if kind != "multi" else (list(r[0]), r[1]))
+        return out
+
+
+class CompiledSchema:
+    """Parser + validator/normalizer built once from a template's fields_json."""
+
+    def __init__(self, fields_json: Dict[str, Any]):
+        self.fields: List[FieldSpec] = [FieldSpec(k, v) for k, v in (fields_json or {}).items()]
+        self.by_key = {f.key: f for f in self.fields}
+
+    def parse(self, form, files=None, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Pull this schema's fields out of a request.form / request.files pair."""
+        previous = previous or {}
+        data: Dict[str, Any] = {}
+        for f in self.fields:
+            if f.kind == "multi":
+                data[f.key] = form.getlist(f.key)
+            elif f.kind == "file":
+                file = files.get(f.key) if files is not None else None
+                data[f.key] = file.filename if file else previous.get(f.key)
+            elif f.kind == "auto_date":
+                data[f.key] = datetime.utcnow().strftime("%Y-%m-%d")
+            else:
+                data[f.key] = form.get(f.key)
+        return data
+
+    def validate(self, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """Return (normalized data, {field: error}). Unknown keys are dropped."""
+        clean: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        for f in self.fields:
+            value, error = f.normalize(data.get(f.key))
+            clean[f.key] = value
+            if error:
+                errors[f.key] = error
+        return clean, errors
+
+    def validate_many(self, rows: Iterable[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, str]]]:
+        """
+        Batch form of ``validate`` for bulk imports: works column by column so
+        each field's checks run in one tight loop over all rows.
+        """
+        rows = [r if isinstance(r, dict) else {} for r in rows]
+        keys = [f.key for f in self.fields]
+        columns = [f.normalize_many([r.get(f.key) for r in rows]) for f in self.fields]
+
+        cleans = [dict(zip(keys, values))
+                  for values in zip(*[[v for v, _ in col] for col in columns])] if columns else [{} for _ in rows]
+        errors: List[Dict[str, str]] = [{} for _ in rows]
+        for key, col in zip(keys, columns):
+            for i, (_, error) in enumerate(col):
+                if error:
+                    errors[i][key] = error
+        return list(zip(cleans, errors))
+
+
+# (template id, fields_json fingerprint) -> CompiledSchema
+_schemas: Dict[Tuple[Any, str], CompiledSchema] = {}
+_schemas_lock = threading.Lock()
+
+
+def get_schema(form_template) -> CompiledSchema:
+    """Compiled schema for a FormTemplate, built on first use and reused after."""
+    fields_json = form_template.fields_json or {}
+    key = (form_template.id, repr(fields_json))
+    schema = _schemas.get(key)
+    if schema is None:
+        schema = CompiledSchema(fields_json)
+        with _schemas_lock:
+            _schemas[key] = schema
+    return schema
@@ -3,6 +3,8 @@ FORM_TEMPLATES = [
         "name": "FERPA Authorization Form",
         "form_code": "ferpa_auth",
         "latex_template_path": "latex/ferpa_template.tex",
+        # fixed layout: drawn in-process (FORM_LAYOUTS below) instead of with pdflatex
+        "renderer": "python",
         "fields_json": {
             "student_name": "text",
             "peoplesoft_id": "text",
@@ -59,4 +61,172 @@ FORM_TEMPLATES = [
         "date": "auto_date"
     }
 }
-]
\ No newline at end of file
+]
+
+# Approval routes per form_code. A route is an ordered list of stages; each
+# stage is one of
+#   "one" - a single step assigned to one approver from the pool
+#   "all" - parallel steps (``count`` approvers, default the whole pool), all must approve
+#   "any" - parallel steps (``count`` approvers), the first approval completes the stage
+# ``pool`` picks candidate approvers by role and/or email; within a pool the
+# optional ``strategy`` ("least_loaded" default, or "weighted_round_robin")
+# decides who gets the step (see app.approvals.assignment).
+DEFAULT_ROUTE = [
+    {"name": "approver", "mode": "one", "pool": {"roles": ["admin", "approver"]}},
+]
+
+FORM_ROUTES = {
+    "ferpa_auth": [
+        {"name": "registrar", "mode": "one", "pool": {"roles": ["admin", "approver"]}},
+    ],
+    "general_petition": [
+        {"name": "advisor", "mode": "one", "pool": {"roles": ["approver", "admin"]}},
+        {"name": "department", "mode": "any", "count": 2, "pool": {"roles": ["approver", "admin"]}},
+        {"name": "registrar", "mode": "one", "pool": {"roles": ["admin"]}},
+    ],
+}
+
+# How form values fill the LaTeX templates. Every field in fields_json fills
+# {{FIELD_KEY}} (upper-cased) by its kind: text/select/email/date inline,
+# textarea keeping line breaks, multi-choice as an itemize list. Empty values
+# become "N/A" ("None selected" for multi-choice, the submission date for
+# dates). {{FORM_DATA}} lists every field; {{SUBMITTED_DATE}},
+# {{STUDENT_SIGNATURE}} and {{APPROVER_SIGNATURES}} are always available. A form only needs an entry here for exceptions:
+#   "fields": {key: {"default": ..., "format": ...}}
+#       default - "$submitter" / "$submitted_date" or literal text
+#       format  - "inline" | "text" | "list" | "inline_list" (comma-joined)
+#   "tables": {PLACEHOLDER: {"title": ..., "rows": [[label, field], ...]}}
+#       a titled two-column table of the fields that have a value (empty
+#       when none do)
+FORM_RENDER_SPECS = {
+    "ferpa_auth": {
+        "fields": {
+            "student_name": {"default": "$submitter"},
+            "campus": {"format": "inline_list"},
+        },
+    },
+    "general_petition": {
+        "fields": {
+            "student_name": {"default": "$submitter"},
+        },
+        "tables": {
+            "CHANGE_DETAILS": {
+                "title": "Change Details",
+                "rows": [["From:", "from_value"], ["To:", "to_value"],
+                         ["Additional Details:", "additional_details"]],
+            },
+        },
+    },
+}
+
+# Page layouts for the in-process PDF renderer (FormTemplate.renderer =
+# "python"), mirroring latex_templates/<form_code>_template.tex. The block
+# kinds are listed in app.utils.pdf_layout; a form without an entry gets
+# DEFAULT_LAYOUT, every field as "Label: value".
+DEFAULT_LAYOUT = [
+    ("center", "{{FORM_TITLE}}", "title"),
+    ("space", 12),
+    ("summary", "FORM_DATA"),
+    ("space", 12),
+    ("text", "Student Signature:", "bold"),
+    ("signature", "STUDENT_SIGNATURE"),
+    ("fields", [("Date Submitted:", "{{SUBMITTED_DATE}}")]),
+    ("heading", "Approver Signature"),
+    ("approvals", "APPROVER_SIGNATURES"),
+]
+
+FORM_LAYOUTS = {
+    "ferpa_auth": [
+        ("center", "UNIVERSITY of HOUSTON", "title"),
+        ("space", 4),
+        ("center", "Form No. OGC-SF-2006-02", "bold"),
+        ("space", 4),
+        ("center", "Note: Modification of this Form requires approval of OGC", "italic"),
+        ("space", 6),
+        ("center", "AUTHORIZATION TO RELEASE EDUCATIONAL RECORDS", "subtitle"),
+        ("center", "Family Educational Rights and Privacy Act of 1974 as Amended (FERPA)", "bold"),
+        ("space", 8),
+        ("text", "I {{STUDENT_NAME}} hereby voluntarily authorize officials in the University of Houston - "
+                 "{{CAMPUS}} identified below to disclose personally identifiable information from my "
+                 "educational records. (Please check the box or boxes that apply):"),
+        ("space", 6),
+        ("list", "AUTHORIZED_OFFICES"),
+        ("space", 6),
+        ("text", "Specifically, I authorize disclosure of the following information or category of information:"),
+        ("space", 4),
+        ("list", "INFO_TYPES"),
+        ("space", 8),
+        ("text", "This information may be released to: {{RELEASE_TO}}"),
+        ("space", 6),
+        ("text", "for the purpose of informing:"),
+        ("space", 4),
+        ("list", "PURPOSE_OF_DISCLOSURE"),
+        ("space", 8),
+        ("text", "Please provide a password to obtain information via the phone: {{PHONE_PASSWORD}}"),
+        ("text", "(The password should not contain more than ten (10) letters. You must provide the password to "
+                 "the individuals or agencies listed above. The University will not release information to the "
+                 "caller if the caller does not have the password. A new form must be completed to change your "
+                 "password.)", "italic"),
+        ("space", 8),
+        ("text", "This is to attest that I am the student signing this form. I understand the information may be "
+                 "released orally or in the form of copies of written records, as preferred by the requester. "
+                 "This authorization will remain in effect from the date it is executed until revoked by me, in "
+                 "writing, and delivered to the Department(s) identified above."),
+        ("space", 8),
+        ("columns", [("PeopleSoft I.D. Number:", "{{PEOPLESOFT_ID}}"), ("Date:", "{{DATE}}")]),
+        ("space", 8),
+        ("text", "Student Name [please print]:", "bold"),
+        ("text", "{{STUDENT_NAME}}"),
+        ("space", 8),
+        ("text", "Student Signature:", "bold"),
+        ("signature", "STUDENT_SIGNATURE"),
+        ("fields", [("Date Submitted:", "{{SUBMITTED_DATE}}")]),
+        ("heading", "Approver Signature"),
+        ("text", "Official approval by authorized university personnel."),
+        ("space", 8),
+        ("approvals", "APPROVER_SIGNATURES"),
+        ("footer", [
+            ("Please Retain a Copy for your Records", "normal"),
+            ("Document may be Submitted to Registrar's Office", "normal"),
+            ("FERPA Authorization Form - OGC-SF-2006-02 - Revised 01.15.2025", "bold"),
+            ("Page 1 of 1", "normal"),
+        ]),
+    ],
+    "general_petition": [
+        ("center", "UNIVERSITY OF HOUSTON", "title"),
+        ("center", "Registration and Academic Records", "bold"),
+        ("space", 4),
+        ("center", "GENERAL PETITION", "subtitle"),
+        ("center", "(Use this form to petition for registration/academic record actions)"),
+        ("space", 6),
+        ("heading", "Student Information"),
+        ("fields", [
+            ("Name:", "{{STUDENT_NAME}}"),
+            ("Student ID:", "{{STUDENT_ID}}"),
+            ("Phone:", "{{PHONE_NUMBER}}"),
+            ("Email:", "{{EMAIL}}"),
+            ("Mailing Address:", "{{MAILING_ADDRESS}}"),
+            ("City / State / ZIP:", "{{CITY}}, {{STATE}} {{ZIP}}"),
+        ]),
+        ("space", 8),
+        ("heading", "Petition Details"),
+        ("fields", [("Petition Reason:", "{{PETITION_REASON_NUMBER}}"), ("Date:", "{{DATE}}")]),
+        ("space", 8),
+        ("table", "CHANGE_DETAILS"),
+        ("space", 8),
+        ("heading", "Explanation of Request"),
+        ("box", "{{EXPLANATION_OF_REQUEST}}"),
+        ("space", 12),
+        ("text", "Student Signature:", "bold"),
+        ("signature", "STUDENT_SIGNATURE"),
+        ("fields", [("Date Submitted:", "{{SUBMITTED_DATE}}")]),
+        ("space", 6),
+        ("heading", "Approver Signature"),
+        ("text", "Official approval by authorized university personnel."),
+        ("space", 8),
+        ("approvals", "APPROVER_SIGNATURES"),
+        ("footer", [
+            ("Notes: Attach supporting documents where required. Retain a copy for your records.", "small"),
+        ]),
+    ],
+}
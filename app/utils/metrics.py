@@ -0,0 +1,217 @@
+# app/utils/metrics.py
+"""
+In-process instrumentation exposed in Prometheus text format on /metrics.
+
+Collected per HTTP request: latency by endpoint, SQL query count and time
+(SQLAlchemy cursor events), and template render time (Flask's template
+signals). PDF renders and outbound calls are timed where they happen with
+``timed``. With ``QUERY_COUNT_HEADER`` (on by default in debug)
+every response carries ``X-Query-Count`` / ``X-Query-Time-Ms`` so an N+1
+shows up in the browser's network tab straight away.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from flask import (Flask, Response, before_render_template, current_app, g, has_request_context,
+                   request, template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RENDER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _fmt_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(labels)} {_fmt_num(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, row in sorted(self._values.items()):
+                running = 0
+                for le, n in zip(self.buckets, row):
+                    running += n
+                    bound = 'le="%s"' % _fmt_num(le)
+                    lines.append(f"{self.name}_bucket{_fmt_labels(labels, bound)} {running}")
+                running += row[len(self.buckets)]
+                bound = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(labels, bound)} {running}")
+                lines.append(f"{self.name}_sum{_fmt_labels(labels)} {_fmt_num(round(row[-1], 6))}")
+                lines.append(f"{self.name}_count{_fmt_labels(labels)} {running}")
+        return lines
+
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Request latency by endpoint.")
+HTTP_QUERIES = Histogram("http_request_db_queries", "SQL statements issued per request.", QUERY_BUCKETS)
+HTTP_DB_TIME = Histogram("http_request_db_seconds", "Time spent in SQL per request.")
+TEMPLATE_TIME = Histogram("template_render_seconds", "Jinja render time by template.")
+PDF_RENDER = Histogram("pdf_render_seconds", "PDF render time by form_code and backend.", RENDER_BUCKETS)
+EXTERNAL_CALLS = Histogram("external_call_seconds", "Outbound HTTP calls by target.")
+DB_QUERIES = Counter("db_queries_total", "SQL statements issued (including outside requests).")
+DB_TIME = Counter("db_query_seconds_total", "Time spent in SQL (including outside requests).")
+
+METRICS = [HTTP_LATENCY, HTTP_QUERIES, HTTP_DB_TIME, TEMPLATE_TIME, PDF_RENDER, EXTERNAL_CALLS, DB_QUERIES, DB_TIME]
+
+# name -> (help, callable returning {labels-dict-as-tuple: value}); read at scrape time
+_collectors: Dict[str, Tuple[str, str, Callable[[], Dict[Labels, float]]]] = {}
+
+
+def register_collector(name: str, help: str, kind: str, fn: Callable[[], Dict[Labels, float]]) -> None:
+    """Expose values owned elsewhere (e.g. cache hit counts) without copying them."""
+    _collectors[name] = (help, kind, fn)
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    for name, (help, kind, fn) in sorted(_collectors.items()):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, v in sorted(fn().items()):
+            lines.append(f"{name}{_fmt_labels(labels)} {_fmt_num(v)}")
+    return "\n".join(lines) + "\n"
+
+
+# ----------------- SQL -----------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    DB_QUERIES.inc()
+    DB_TIME.inc(elapsed)
+    if has_request_context() and "query_count" in g:
+        g.query_count += 1
+        g.query_time += elapsed
+
+
+_sql_hooked = False
+
+
+def _hook_sql() -> None:
+    global _sql_hooked
+    if not _sql_hooked:
+        # every engine, so apps built by tests/benchmarks are covered too
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _sql_hooked = True
+
+
+# ----------------- Flask -----------------
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.query_count = 0
+    g.query_time = 0.0
+
+
+def _finish_request(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or "unmatched"
+    if endpoint == "metrics":
+        return response
+    HTTP_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint,
+                         method=request.method, status=str(response.status_code))
+    HTTP_QUERIES.observe(g.query_count, endpoint=endpoint)
+    HTTP_DB_TIME.observe(g.query_time, endpoint=endpoint)
+    if current_app.config.get("QUERY_COUNT_HEADER", current_app.debug):
+        response.headers["X-Query-Count"] = str(g.query_count)
+        response.headers["X-Query-Time-Ms"] = f"{g.query_time * 1000:.1f}"
+    return response
+
+
+def _before_template(sender, template, context, **extra):
+    if has_request_context():
+        g.setdefault("template_started", []).append(time.perf_counter())
+
+
+def _after_template(sender, template, context, **extra):
+    if has_request_context() and g.get("template_started"):
+        TEMPLATE_TIME.observe(time.perf_counter() - g.template_started.pop(), template=template.name or "?")
+
+
+def init_metrics(app: Flask) -> None:
+    """Install the hooks and the /metrics endpoint on ``app``."""
+    _hook_sql()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_template, app)
+    template_rendered.connect(_after_template, app)
+
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics)
@@ -0,0 +1,315 @@
+# app/utils/pdf_archive.py
+"""
+Semester PDF archive: collect the signed PDF of every request matching a
+form / status / date range, archived ones included, into one ZIP (or
+merged PDFs of up to PART_SIZE requests each), rendering any that are
+missing on a process pool.
+
+    flask --app run archive-pdfs ferpa_fall2024.zip --form-code ferpa_auth \
+        --since 2024-08-19 --until 2024-12-31 --workers 4
+
+Progress is checkpointed to ``<output>.progress.json`` as requests reach
+the disk; re-running the same command after an interruption skips requests
+already in the archive.
+"""
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import click
+from flask.cli import with_appcontext
+from pypdf import PdfWriter
+
+from app.approvals.archive import iter_archived, stand_in
+from app.models import db, Signature, Request, FormTemplate, ApprovalStep, ArchivedRequest
+from app.utils.pdf_generator import generate_request_pdf
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+CHUNK_SIZE = 200
+SAVE_EVERY = 50   # zip entries between checkpoints
+PART_SIZE = 200   # requests per merged PDF
+
+
+def _abs(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(REPO_ROOT, path)
+
+
+def matching_requests(form_code: Optional[str] = None, status: Optional[str] = "approved",
+                      since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """Requests of ``form_code`` in ``status`` submitted in [since, until)."""
+    # requests that never went through submit (older drafts) have no submitted_at
+    when = db.func.coalesce(Request.submitted_at, Request.created_at)
+    query = Request.query
+    if form_code:
+        query = query.join(FormTemplate).filter(FormTemplate.form_code == form_code)
+    if status:
+        query = query.filter(Request.status == status)
+    if since:
+        query = query.filter(when >= since)
+    if until:
+        query = query.filter(when < until)
+    return query
+
+
+def matching_archived(form_code: Optional[str] = None, status: Optional[str] = "approved",
+                      since: Optional[datetime] = None, until: Optional[datetime] = None) -> list:
+    """``matching_requests``'s criteria for requests moved to the archive (see approvals.archive)."""
+    when = db.func.coalesce(ArchivedRequest.submitted_at, ArchivedRequest.created_at)
+    where = []
+    if form_code:
+        where.append(ArchivedRequest.form_template_id.in_(
+            db.select(FormTemplate.id).where(FormTemplate.form_code == form_code)))
+    if status:
+        where.append(ArchivedRequest.status == status)
+    if since:
+        where.append(when >= since)
+    if until:
+        where.append(when < until)
+    return where
+
+
+def iter_batches(query, chunk_size: int = CHUNK_SIZE, archived: Optional[list] = None) -> Iterator[List[Request]]:
+    """
+    Yield ``query`` results in id-ordered chunks (keyset paging), then, given
+    ``archived`` criteria, stand-ins for the archived requests matching them.
+    """
+    last_id = 0
+    while True:
+        batch = query.filter(Request.id > last_id).order_by(Request.id).limit(chunk_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        yield batch
+    if archived is not None:
+        for chunk in iter_archived(chunk_size, archived):
+            yield [stand_in(data) for data in chunk]
+
+
+def existing_pdf(req: Request) -> Optional[str]:
+    """Latest signed PDF on disk for this request, if any."""
+    for s in sorted(req.approval_steps, key=lambda x: (x.sequence, x.actioned_at or datetime.min), reverse=True):
+        if s.signed_pdf_path and os.path.exists(_abs(s.signed_pdf_path)):
+            return s.signed_pdf_path
+    return None
+
+
+def render_job(req: Request) -> Tuple[SimpleNamespace, List[str]]:
+    """
+    Picklable stand-in for ``req`` plus its signature paths (requester first,
+    then approved steps in sequence order), as the approve view collects them.
+    """
+    user_ids = [req.requester_id] + [s.approver_id for s in sorted(req.approval_steps, key=lambda x: x.sequence)
+                                     if s.status == "approved"]
+    sigs = dict(db.session.query(Signature.user_id, Signature.image_path)
+                .filter(Signature.user_id.in_(set(user_ids))))
+    signature_paths = [sigs[uid] for uid in user_ids if sigs.get(uid)]
+    snapshot = SimpleNamespace(
+        id=req.id,
+        form_template=SimpleNamespace(form_code=req.form_template.form_code,
+                                      fields_json=req.form_template.fields_json,
+                                      name=req.form_template.name,
+                                      renderer=req.form_template.renderer),
+        form_data_json=req.form_data_json,
+        requester=SimpleNamespace(name=req.requester.name if req.requester else "Unknown"),
+        submitted_at=req.submitted_at,
+    )
+    return snapshot, signature_paths
+
+
+def _render(snapshot: SimpleNamespace, signature_paths: List[str]) -> Tuple[int, Optional[str], Optional[str]]:
+    """Worker: (request id, pdf path, error)."""
+    try:
+        return snapshot.id, generate_request_pdf(snapshot, signature_paths), None
+    except Exception as e:  # keep going; the failure is reported at the end
+        return snapshot.id, None, str(e).splitlines()[0] if str(e) else type(e).__name__
+
+
+def _record_pdf(request_id: int, pdf_path: str) -> None:
+    """
+    Store a regenerated PDF on the request's last approved step, if it has
+    none (archived requests have no step rows and are left as they are).
+    """
+    step = (ApprovalStep.query
+            .filter_by(request_id=request_id, status="approved")
+            .order_by(ApprovalStep.sequence.desc(), ApprovalStep.id.desc())
+            .first())
+    if step and not step.signed_pdf_path:
+        step.signed_pdf_path = pdf_path
+
+
+class Checkpoint:
+    """Request ids already written to the archive, persisted next to it."""
+
+    def __init__(self, output: str):
+        self.path = f"{output}.progress.json"
+        self.done: Dict[str, str] = {}
+        self.failed: Dict[str, str] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.done = state.get("done", {})
+
+    def save(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"done": self.done, "failed": self.failed}, f)
+        os.replace(tmp, self.path)
+
+    def finish(self) -> None:
+        if not self.failed and os.path.exists(self.path):
+            os.remove(self.path)
+        else:
+            self.save()
+
+
+def iter_archive_pdfs(batches: Iterator[List[Request]], checkpoint: Checkpoint,
+                      workers: int = 1) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (request id, pdf path) for every request not yet in the checkpoint,
+    rendering missing PDFs a batch at a time on ``workers`` processes.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for batch in batches:
+            chunk = [req for req in batch if str(req.id) not in checkpoint.done]
+
+            jobs = []
+            for req in chunk:
+                path = existing_pdf(req)
+                if path:
+                    yield req.id, path
+                else:
+                    jobs.append(render_job(req))
+
+            if pool:
+                results = (f.result() for f in as_completed([pool.submit(_render, *job) for job in jobs]))
+            else:
+                results = (_render(*job) for job in jobs)
+            for request_id, path, error in results:
+                if error:
+                    checkpoint.failed[str(request_id)] = error
+                    continue
+                _record_pdf(request_id, path)
+                yield request_id, path
+            db.session.commit()
+            # nothing from this chunk is needed again
+            db.session.expunge_all()
+    finally:
+        if pool:
+            pool.shutdown()
+
+
+def write_zip(output: str, pdfs: Iterator[Tuple[int, str]], checkpoint: Checkpoint, on_item=None) -> int:
+    """
+    Append PDFs to ``output`` one file at a time (never buffered whole). The
+    archive is closed, which writes its directory, every SAVE_EVERY files,
+    and only then are those marked done.
+    """
+    written = 0
+    while True:
+        chunk = list(islice(pdfs, SAVE_EVERY))
+        if not chunk:
+            return written
+        with zipfile.ZipFile(output, "a" if os.path.exists(output) else "w", zipfile.ZIP_DEFLATED) as zf:
+            names = set(zf.namelist())
+            for request_id, path in chunk:
+                arcname = os.path.basename(path)
+                if arcname not in names:
+                    zf.write(_abs(path), arcname)
+                    names.add(arcname)
+                if on_item:
+                    on_item()
+        checkpoint.done.update((str(request_id), os.path.basename(path)) for request_id, path in chunk)
+        checkpoint.save()
+        written += len(chunk)
+
+
+def part_path(output: str, part: int) -> str:
+    """``output`` for the first part of a merged archive, then ``<stem>-2.pdf``, ``<stem>-3.pdf``, ..."""
+    if part == 1:
+        return output
+    stem, ext = os.path.splitext(output)
+    return f"{stem}-{part}{ext}"
+
+
+def write_merged(output: str, pdfs: Iterator[Tuple[int, str]], checkpoint: Checkpoint, on_item=None,
+                 part_size: int = PART_SIZE) -> int:
+    """
+    Concatenate PDFs into ``output`` and, past ``part_size`` requests, into
+    further parts (see ``part_path``), so only one part is held in memory.
+    A part is written to a temp file and moved into place before its
+    requests are marked done; an interrupted run redoes the part it was on.
+    """
+    part = len(set(checkpoint.done.values())) + 1
+    written = 0
+    while True:
+        chunk = list(islice(pdfs, part_size))
+        if not chunk:
+            return written
+        writer = PdfWriter()
+        for _, path in chunk:
+            writer.append(_abs(path))
+            if on_item:
+                on_item()
+        name = part_path(output, part)
+        tmp = name + ".tmp"
+        with open(tmp, "wb") as f:
+            writer.write(f)
+        writer.close()
+        os.replace(tmp, name)
+        checkpoint.done.update((str(request_id), os.path.basename(name)) for request_id, _ in chunk)
+        checkpoint.save()
+        written += len(chunk)
+        part += 1
+
+
+def _date(value: Optional[str]) -> Optional[datetime]:
+    return datetime.strptime(value, "%Y-%m-%d") if value else None
+
+
+@click.command("archive-pdfs")
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.option("--form-code", default=None, help="Only this form (e.g. ferpa_auth).")
+@click.option("--status", default="approved", show_default=True,
+              type=click.Choice(["draft", "pending", "returned", "approved", "rejected"]))
+@click.option("--since", default=None, help="Submitted on or after YYYY-MM-DD.")
+@click.option("--until", default=None, help="Submitted on or before YYYY-MM-DD.")
+@click.option("--workers", type=int, default=1, show_default=True, help="Processes used to render missing PDFs.")
+@click.option("--part-size", type=int, default=PART_SIZE, show_default=True,
+              help="Requests per file of a merged .pdf archive (OUTPUT, then OUTPUT-2.pdf, ...).")
+@with_appcontext
+def archive_pdfs_command(output, form_code, status, since, until, workers, part_size):
+    """Bundle the signed PDFs of matching requests into OUTPUT (.zip or .pdf)."""
+    until_dt = _date(until) + timedelta(days=1) if until else None
+    query = matching_requests(form_code, status, _date(since), until_dt)
+    archived = matching_archived(form_code, status, _date(since), until_dt)
+    total = query.count() + db.session.query(ArchivedRequest).filter(*archived).count()
+
+    checkpoint = Checkpoint(output)
+    if checkpoint.done:
+        click.echo(f"Resuming: {len(checkpoint.done)} of {total} already archived.")
+    if output.lower().endswith(".pdf"):
+        writer = partial(write_merged, part_size=part_size)
+    else:
+        writer = write_zip
+
+    with click.progressbar(length=max(total - len(checkpoint.done), 0), label="Archiving") as bar:
+        pdfs = iter_archive_pdfs(iter_batches(query, archived=archived), checkpoint, workers=workers)
+        try:
+            written = writer(output, pdfs, checkpoint, on_item=lambda: bar.update(1))
+        finally:
+            # writers only mark requests done once they are on disk
+            checkpoint.save()
+    checkpoint.finish()
+
+    click.echo(f"Wrote {written} PDFs to {output}.")
+    for request_id, error in checkpoint.failed.items():
+        click.echo(f"  request {request_id}: {error}", err=True)
+    if checkpoint.failed:
+        raise SystemExit(1)
@@ -1,88 +1,181 @@
 # app/utils/pdf_generator.py
 import json
 import os
-import subprocess
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, NamedTuple, Optional
 
 from app.models import Request  # type: ignore
+from app.utils.forms_config import DEFAULT_LAYOUT, FORM_LAYOUTS
+from app.utils.metrics import PDF_RENDER, timed
+from app.utils.pdf_layout import layout_placeholders, render_layout
+from app.utils.pdf_replacements import PLAIN, get_builder, template_placeholders
+from app.utils.render_governor import GOVERNOR, run_limited
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
 
 
 def _ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def _latex_escape(s: str) -> str:
-    # Minimal LaTeX escaping
-    replacements = {
-        "\\": r"\textbackslash{}",
-        "{": r"\{",
-        "}": r"\}",
-        "#": r"\#",
-        "$": r"\$",
-        "%": r"\%",
-        "&": r"\&",
-        "_": r"\_",
-        "~": r"\textasciitilde{}",
-        "^": r"\textasciicircum{}",
-    }
-    out = []
-    for ch in s:
-        out.append(replacements.get(ch, ch))
-    return "".join(out)
-
-
-def _render_list_items(items: List[str]) -> str:
-    """Render a list of items as LaTeX itemize."""
-    if not items:
-        return "None selected"
-    lines = ["\\begin{itemize}"]
-    for item in items:
-        lines.append(f"  \\item {_latex_escape(str(item))}")
-    lines.append("\\end{itemize}")
-    return "\n".join(lines)
-
-
-def _render_signature_image(sig_path: str, latex_dir: str) -> str:
-    """Render a signature image for LaTeX."""
-    if not sig_path or not os.path.exists(sig_path):
-        return "\\textit{[No signature]}" 
-    rel_path = os.path.relpath(sig_path, latex_dir)
-    return f"\\includegraphics[width=0.3\\textwidth]{{{_latex_escape(rel_path)}}}"
-
-
-def generate_request_pdf(request: Request, signature_paths: List[str]) -> str:
+def _fill_template(template_content: str, replacements: Dict[str, str]) -> str:
+    """Substitute each {{PLACEHOLDER}} in the template with its value."""
+    output_content = template_content
+    for placeholder, value in replacements.items():
+        output_content = output_content.replace(f"{{{{{placeholder}}}}}", value)
+    return output_content
+
+
+# Keep pdflatex's output to a classic xref table so approvals can append
+# incremental updates to it (see pdf_stamp)
+PDF_PREAMBLE = "\\ifdefined\\pdfobjcompresslevel\\pdfobjcompresslevel=0\\fi\n"
+
+
+class RenderJob(NamedTuple):
+    """Everything a renderer needs to draw one request."""
+    form_template: Any
+    form_code: str
+    form_data: Dict[str, Any]
+    submitter_name: str
+    submitted_date: str
+    signature_paths: List[str]  # absolute; student first, then approvers
+    body_only: bool
+    output_dir: str
+    base_name: str
+
+    @property
+    def pdf_path(self) -> str:
+        return os.path.join(self.output_dir, f"{self.base_name}.pdf")
+
+
+class LatexRenderer:
+    """Fills latex_templates/<form_code>_template.tex and builds it with pdflatex via make."""
+
+    name = "latex"
+
+    def __init__(self, latex_dir: str):
+        self.latex_dir = latex_dir
+
+    def render(self, job: RenderJob) -> None:
+        template_path = os.path.join(self.latex_dir, f"{job.form_code}_template.tex")
+        output_tex_path = os.path.join(job.output_dir, f"{job.base_name}.tex")
+
+        # Check if template exists
+        if not os.path.exists(template_path):
+            raise RuntimeError(f"Template not found: {template_path}")
+
+        # Read template
+        with open(template_path, "r", encoding="utf-8") as f:
+            template_content = f.read()
+
+        # Build replacements dictionary from the form's fields (see forms_config.FORM_RENDER_SPECS)
+        builder = get_builder(job.form_template)
+        replacements = builder(job.form_data, job.submitter_name, job.submitted_date, job.signature_paths,
+                               job.output_dir, placeholders=template_placeholders(template_content),
+                               body_only=job.body_only)
+
+        # Replace placeholders in template
+        output_content = PDF_PREAMBLE + _fill_template(template_content, replacements)
+
+        # Write output .tex file
+        with open(output_tex_path, "w", encoding="utf-8") as f:
+            f.write(output_content)
+
+        # Write Makefile in output directory
+        makefile_path = os.path.join(job.output_dir, "Makefile")
+        if not os.path.exists(makefile_path):
+            makefile_contents = (
+                "PDFLATEX=pdflatex\n"
+                ".SUFFIXES: .tex .pdf\n"
+                "%.pdf: %.tex\n\t$(PDFLATEX) -interaction=nonstopmode -halt-on-error $< > build.log 2>&1\n"
+                "\nclean:\n\trm -f *.aux *.log *.out *.toc build.log\n"
+            )
+            with open(makefile_path, "w", encoding="utf-8") as mf:
+                mf.write(makefile_contents)
+
+        # Run make to build PDF in output directory, killed (and its partial
+        # output removed) if it runs over RENDER_TIMEOUT
+        partial = [os.path.join(job.output_dir, f"{job.base_name}.{ext}") for ext in ("pdf", "aux", "log", "out")]
+        result = run_limited(["make", "-C", job.output_dir, f"{job.base_name}.pdf"], cleanup=partial)
+
+        if result.returncode != 0 or not os.path.exists(job.pdf_path):
+            # don't leave a half-written PDF behind for the next caller to pick up
+            if os.path.exists(job.pdf_path):
+                os.remove(job.pdf_path)
+            stderr = result.stderr or ""
+            stdout = result.stdout or ""
+            build_log = os.path.join(job.output_dir, "build.log")
+            log_content = ""
+            if os.path.exists(build_log):
+                try:
+                    with open(build_log, "r", encoding="utf-8", errors="ignore") as lf:
+                        log_content = lf.read()
+                except Exception:
+                    pass
+            raise RuntimeError(
+                "LaTeX compilation failed.\n"
+                f"stdout:\n{stdout}\n"
+                f"stderr:\n{stderr}\n"
+                f"build.log:\n{log_content}\n"
+            )
+
+
+class PythonRenderer:
+    """Draws forms_config.FORM_LAYOUTS[<form_code>] in-process (see pdf_layout); no pdflatex."""
+
+    name = "python"
+
+    def render(self, job: RenderJob) -> None:
+        layout = FORM_LAYOUTS.get(job.form_code, DEFAULT_LAYOUT)
+        builder = get_builder(job.form_template, PLAIN)
+        values = builder(job.form_data, job.submitter_name, job.submitted_date, job.signature_paths,
+                         job.output_dir, placeholders=layout_placeholders(layout), body_only=job.body_only)
+        values["FORM_TITLE"] = getattr(job.form_template, "name", None) or job.form_code.replace("_", " ").title()
+        render_layout(job.pdf_path, layout, values)
+
+
+# FormTemplate.renderer -> backend; both take the same RenderJob
+RENDERERS = {r.name: r for r in (LatexRenderer(os.path.join(REPO_ROOT, "latex_templates")), PythonRenderer())}
+DEFAULT_RENDERER = "latex"
+
+
+def get_renderer(name: Optional[str] = None):
+    """The backend called ``name`` (LaTeX when not set)."""
+    renderer = RENDERERS.get(name or DEFAULT_RENDERER)
+    if renderer is None:
+        raise RuntimeError(f"Unknown PDF renderer: {name}")
+    return renderer
+
+
+def generate_request_pdf(request: Request, signature_paths: List[str],
+                         base_name: Optional[str] = None, body_only: bool = False,
+                         renderer: Optional[str] = None) -> str:
     """
-    Generate a PDF for a Request using custom LaTeX templates.
+    Generate a PDF for a Request with its form's renderer: the LaTeX
+    templates, or the in-process layouts (FormTemplate.renderer).
+
+    ``base_name`` overrides the output file name (without extension).
+    With ``body_only`` the approver section only points at the approval
+    record page that ``pdf_stamp`` appends later. ``renderer`` overrides
+    the form's backend.
+
+    Renders go through render_governor.GOVERNOR: RenderBusy when too many
+    are queued, RenderKilled when pdflatex runs over its time limit.
 
     Returns relative path to the generated PDF.
-    Raises RuntimeError if LaTeX compilation fails.
+    Raises RuntimeError if rendering (e.g. LaTeX compilation) fails.
     """
-    # Determine repo root and directories
-    utils_dir = os.path.dirname(__file__)
-    repo_root = os.path.abspath(os.path.join(utils_dir, os.pardir, os.pardir))
-    latex_dir = os.path.join(repo_root, "latex_templates")  # Templates only
-    output_dir = os.path.join(repo_root, "generated_pdfs")  # Generated files
+    # Determine directories
+    latex_dir = os.path.join(REPO_ROOT, "latex_templates")  # Templates only
+    output_dir = os.path.join(REPO_ROOT, "generated_pdfs")  # Generated files
     _ensure_dir(latex_dir)
     _ensure_dir(output_dir)
 
     # Get form code and request ID
-    form_code = getattr(getattr(request, "form_template", None), "form_code", "form")
+    form_template = getattr(request, "form_template", None)
+    form_code = getattr(form_template, "form_code", "form")
     req_id = getattr(request, "id", "unknown")
-    base_name = f"{form_code}_{req_id}"
-    
-    # File paths: template in latex_dir, output in output_dir
-    template_path = os.path.join(latex_dir, f"{form_code}_template.tex")
-    output_tex_path = os.path.join(output_dir, f"{base_name}.tex")
-    pdf_path = os.path.join(output_dir, f"{base_name}.pdf")
-
-    # Check if template exists
-    if not os.path.exists(template_path):
-        raise RuntimeError(f"Template not found: {template_path}")
-
-    # Read template
-    with open(template_path, "r", encoding="utf-8") as f:
-        template_content = f.read()
+    base_name = base_name or f"{form_code}_{req_id}"
 
     # Resolve form data
     form_data_raw = getattr(request, "form_data_json", None) or getattr(request, "form_data", {})
@@ -94,7 +187,8 @@ def generate_request_pdf(request: Request, signature_paths: List[str]) -> str:
         form_data = {}
 
     # Get submitter info
-    submitter_name = _latex_escape(getattr(getattr(request, "requester", None), "name", "Unknown"))
+    # escaped by the replacement builders along with the form values
+    submitter_name = getattr(getattr(request, "requester", None), "name", "Unknown")
     submitted_at = getattr(request, "submitted_at", None)
     submitted_date = submitted_at.strftime("%Y-%m-%d %H:%M") if isinstance(submitted_at, datetime) and submitted_at else datetime.utcnow().strftime("%Y-%m-%d %H:%M")
 
@@ -103,177 +197,16 @@ def generate_request_pdf(request: Request, signature_paths: List[str]) -> str:
     for p in signature_paths or []:
         if not p:
             continue
-        abs_p = p if os.path.isabs(p) else os.path.join(repo_root, p)
+        abs_p = p if os.path.isabs(p) else os.path.join(REPO_ROOT, p)
         if os.path.exists(abs_p):
             abs_signature_paths.append(abs_p)
 
-    # Build replacements dictionary based on form type
-    replacements = {}
-    
-    if form_code == "ferpa_auth":
-        replacements = _build_ferpa_replacements(form_data, submitter_name, submitted_date, abs_signature_paths, output_dir)
-    elif form_code == "general_petition":
-        replacements = _build_petition_replacements(form_data, submitter_name, submitted_date, abs_signature_paths, output_dir)
-    else:
-        # Fallback for unknown forms
-        replacements = {"FORM_DATA": str(form_data)}
-
-    # Replace placeholders in template
-    output_content = template_content
-    for placeholder, value in replacements.items():
-        output_content = output_content.replace(f"{{{{{placeholder}}}}}", value)
-
-    # Write output .tex file
-    with open(output_tex_path, "w", encoding="utf-8") as f:
-        f.write(output_content)
-
-    # Write Makefile in output directory
-    makefile_path = os.path.join(output_dir, "Makefile")
-    if not os.path.exists(makefile_path):
-        makefile_contents = (
-            "PDFLATEX=pdflatex\n"
-            ".SUFFIXES: .tex .pdf\n"
-            "%.pdf: %.tex\n\t$(PDFLATEX) -interaction=nonstopmode -halt-on-error $< > build.log 2>&1\n"
-            "\nclean:\n\trm -f *.aux *.log *.out *.toc build.log\n"
-        )
-        with open(makefile_path, "w", encoding="utf-8") as mf:
-            mf.write(makefile_contents)
-
-    # Run make to build PDF in output directory
-    result = subprocess.run([
-        "make", "-C", output_dir, f"{base_name}.pdf"
-    ], capture_output=True, text=True)
-
-    if result.returncode != 0 or not os.path.exists(pdf_path):
-        stderr = result.stderr or ""
-        stdout = result.stdout or ""
-        build_log = os.path.join(output_dir, "build.log")
-        log_content = ""
-        if os.path.exists(build_log):
-            try:
-                with open(build_log, "r", encoding="utf-8", errors="ignore") as lf:
-                    log_content = lf.read()
-            except Exception:
-                pass
-        raise RuntimeError(
-            "LaTeX compilation failed.\n"
-            f"stdout:\n{stdout}\n"
-            f"stderr:\n{stderr}\n"
-            f"build.log:\n{log_content}\n"
-        )
+    backend = get_renderer(renderer or getattr(form_template, "renderer", None))
+    job = RenderJob(form_template, form_code, form_data, submitter_name, submitted_date,
+                    abs_signature_paths, body_only, output_dir, base_name)
+    # waits for a render slot first; RenderBusy (a RuntimeError) if none comes free
+    with GOVERNOR.slot(backend.name), timed(PDF_RENDER, form_code=form_code, backend=backend.name):
+        backend.render(job)
 
     # Return project-root-relative path
-    return os.path.relpath(pdf_path, repo_root)
-
-
-def _build_ferpa_replacements(form_data: Dict[str, Any], submitter_name: str, 
-                               submitted_date: str, signature_paths: List[str], 
-                               latex_dir: str) -> Dict[str, str]:
-    """Build replacement dictionary for FERPA form."""
-    replacements = {
-        "STUDENT_NAME": _latex_escape(form_data.get("student_name", submitter_name)),
-        "PEOPLESOFT_ID": _latex_escape(str(form_data.get("peoplesoft_id", "N/A"))),
-        "DATE": _latex_escape(str(form_data.get("date", submitted_date))),
-        "CAMPUS": _latex_escape(str(form_data.get("campus", "N/A"))),
-        "RELEASE_TO": _latex_escape(str(form_data.get("release_to", "N/A"))),
-        "PHONE_PASSWORD": _latex_escape(str(form_data.get("phone_password", "N/A"))),
-        "SUBMITTED_DATE": _latex_escape(submitted_date),
-    }
-    
-    # Handle list fields
-    auth_offices = form_data.get("authorized_offices", [])
-    if isinstance(auth_offices, list):
-        replacements["AUTHORIZED_OFFICES"] = _render_list_items(auth_offices)
-    else:
-        replacements["AUTHORIZED_OFFICES"] = _latex_escape(str(auth_offices))
-    
-    info_types = form_data.get("info_types", [])
-    if isinstance(info_types, list):
-        replacements["INFO_TYPES"] = _render_list_items(info_types)
-    else:
-        replacements["INFO_TYPES"] = _latex_escape(str(info_types))
-    
-    purpose = form_data.get("purpose_of_disclosure", [])
-    if isinstance(purpose, list):
-        replacements["PURPOSE_OF_DISCLOSURE"] = _render_list_items(purpose)
-    else:
-        replacements["PURPOSE_OF_DISCLOSURE"] = _latex_escape(str(purpose))
-    
-    # Student signature (first in list)
-    if signature_paths:
-        replacements["STUDENT_SIGNATURE"] = _render_signature_image(signature_paths[0], latex_dir)
-    else:
-        replacements["STUDENT_SIGNATURE"] = "\\textit{[No signature]}"
-    
-    # Approver signatures - simplified for single approver
-    if len(signature_paths) > 1:
-        # Just show the first approver signature (simplified for demo)
-        sig_img = _render_signature_image(signature_paths[1], latex_dir)
-        replacements["APPROVER_SIGNATURES"] = (
-            f"\\noindent\\textbf{{Approved by:}}\\\\[6pt]\n"
-            f"{sig_img}\\\\[6pt]\n"
-            f"\\textbf{{Status:}} Approved\n"
-        )
-    else:
-        replacements["APPROVER_SIGNATURES"] = "\\textit{Pending approval}"
-    
-    return replacements
-
-
-def _build_petition_replacements(form_data: Dict[str, Any], submitter_name: str,
-                                  submitted_date: str, signature_paths: List[str],
-                                  latex_dir: str) -> Dict[str, str]:
-    """Build replacement dictionary for General Petition form."""
-    replacements = {
-        "STUDENT_NAME": _latex_escape(form_data.get("student_name", submitter_name)),
-        "STUDENT_ID": _latex_escape(str(form_data.get("student_id", "N/A"))),
-        "PHONE_NUMBER": _latex_escape(str(form_data.get("phone_number", "N/A"))),
-        "EMAIL": _latex_escape(str(form_data.get("email", "N/A"))),
-        "MAILING_ADDRESS": _latex_escape(str(form_data.get("mailing_address", "N/A"))),
-        "CITY": _latex_escape(str(form_data.get("city", "N/A"))),
-        "STATE": _latex_escape(str(form_data.get("state", "N/A"))),
-        "ZIP": _latex_escape(str(form_data.get("zip", "N/A"))),
-        "PETITION_REASON_NUMBER": _latex_escape(str(form_data.get("petition_reason_number", "N/A"))),
-        "DATE": _latex_escape(str(form_data.get("date", submitted_date))),
-        "EXPLANATION_OF_REQUEST": _latex_escape(str(form_data.get("explanation_of_request", "N/A"))),
-        "SUBMITTED_DATE": _latex_escape(submitted_date),
-    }
-    
-    # Change details (from/to fields)
-    from_val = form_data.get("from_value", "")
-    to_val = form_data.get("to_value", "")
-    additional = form_data.get("additional_details", "")
-    
-    if from_val or to_val or additional:
-        change_details = "\\noindent\\textbf{\\large Change Details}\\\\[0.2cm]\n"
-        change_details += "\\begin{tabularx}{\\textwidth}{|l|X|}\n\\hline\n"
-        if from_val:
-            change_details += f"\\textbf{{From:}} & {_latex_escape(str(from_val))} \\\\\n\\hline\n"
-        if to_val:
-            change_details += f"\\textbf{{To:}} & {_latex_escape(str(to_val))} \\\\\n\\hline\n"
-        if additional:
-            change_details += f"\\textbf{{Additional Details:}} & {_latex_escape(str(additional))} \\\\\n\\hline\n"
-        change_details += "\\end{tabularx}"
-        replacements["CHANGE_DETAILS"] = change_details
-    else:
-        replacements["CHANGE_DETAILS"] = ""
-    
-    # Student signature
-    if signature_paths:
-        replacements["STUDENT_SIGNATURE"] = _render_signature_image(signature_paths[0], latex_dir)
-    else:
-        replacements["STUDENT_SIGNATURE"] = "\\textit{[No signature]}"
-    
-    # Approver signatures - simplified for single approver
-    if len(signature_paths) > 1:
-        # Just show the first approver signature (simplified for demo)
-        sig_img = _render_signature_image(signature_paths[1], latex_dir)
-        replacements["APPROVER_SIGNATURES"] = (
-            f"\\noindent\\textbf{{Approved by:}}\\\\[6pt]\n"
-            f"{sig_img}\\\\[6pt]\n"
-            f"\\textbf{{Status:}} Approved\n"
-        )
-    else:
-        replacements["APPROVER_SIGNATURES"] = "\\textit{Pending approval}"
-    
-    return replacements
+    return os.path.relpath(job.pdf_path, REPO_ROOT)
@@ -0,0 +1,293 @@
+# app/utils/pdf_layout.py
+"""
+In-process PDF renderer: draws a form from a short block list (see
+forms_config.FORM_LAYOUTS) with the standard Helvetica fonts, no pdflatex.
+
+Values come from the same replacement builder as the LaTeX templates, with
+PLAIN markup, so defaults, formats and tables follow FORM_RENDER_SPECS in
+both backends. Text is word-wrapped with the font metrics and flows onto a
+new page when one fills up; the footer sits at the bottom of the last page,
+like the templates' \\vfill.
+
+Blocks are tuples, first item the kind:
+  ("center", text, style)         centred line(s)
+  ("text", text[, style])         wrapped paragraph
+  ("heading", text)               section heading
+  ("space", points)
+  ("fields", [(label, text), ...]) bold labels with values beside them
+  ("columns", [(label, text), ...]) labels side by side, values below
+  ("list", PLACEHOLDER)           bullet list (a single value prints as text)
+  ("table", PLACEHOLDER)          a FORM_RENDER_SPECS table, skipped when empty
+  ("box", text)                   framed paragraph
+  ("summary", PLACEHOLDER)        label: value for every field ({{FORM_DATA}})
+  ("signature", PLACEHOLDER)      the student's signature image
+  ("approvals", PLACEHOLDER)      approver signatures, or where to find them
+  ("footer", [(text, style), ...]) pinned to the bottom of the last page
+Texts may contain {{PLACEHOLDER}}s.
+"""
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.pdf_objects import (FONTS, MARGIN, PAGE_SIZE, PdfError, PdfWriter, font_object, font_resources,
+                                   pdf_text, text_width, wrap_text)
+from app.utils.pdf_replacements import MISSING, PLACEHOLDER_RE
+
+# style -> (font, size, line height)
+STYLES = {
+    "title": ("F2", 16, 20),
+    "subtitle": ("F2", 13, 17),
+    "heading": ("F2", 12, 16),
+    "bold": ("F2", 10, 12.5),
+    "italic": ("F3", 10, 12.5),
+    "normal": ("F1", 10, 12.5),
+    "small": ("F1", 8.5, 10.5),
+}
+SIGNATURE_WIDTH = 0.3 * (PAGE_SIZE[0] - 2 * MARGIN)  # as \includegraphics[width=0.3\textwidth]
+SIGNATURE_MAX_HEIGHT = 40
+
+
+def _inline(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(map(str, value))
+    return str(value)
+
+
+def fill(text: str, values: Dict[str, Any]) -> str:
+    return PLACEHOLDER_RE.sub(lambda m: _inline(values.get(m.group(1), "")), text)
+
+
+# blocks whose argument is a placeholder name rather than text
+_VALUE_BLOCKS = {"list", "table", "summary", "signature", "approvals"}
+
+
+def layout_placeholders(layout: List[Tuple]) -> frozenset:
+    """Every placeholder a layout shows, to build only those values."""
+    names = set()
+    for kind, *args in layout:
+        if kind in _VALUE_BLOCKS:
+            names.add(args[0])
+            continue
+        for part in args:
+            texts = [part] if isinstance(part, str) else [t for row in part for t in row] if isinstance(part, list) else []
+            for text in texts:
+                names.update(PLACEHOLDER_RE.findall(text))
+    return frozenset(names)
+
+
+class _Canvas:
+    """Content streams for the pages of one document, top to bottom."""
+
+    def __init__(self, writer: PdfWriter):
+        self.writer = writer
+        self.pages: List[List[str]] = []
+        self.images: Dict[str, Tuple[int, int, int]] = {}
+        self.left = MARGIN
+        self.width = PAGE_SIZE[0] - 2 * MARGIN
+        self.new_page()
+
+    def new_page(self) -> None:
+        self.ops: List[str] = []
+        self.pages.append(self.ops)
+        self.y = PAGE_SIZE[1] - MARGIN
+
+    def need(self, height: float) -> None:
+        if self.y - height < MARGIN:
+            self.new_page()
+
+    def put_text(self, ops: List[str], x: float, top: float, s: str, style: str = "normal") -> None:
+        """A line whose top is at ``top`` (on the page ``ops`` belongs to)."""
+        font, size, leading = STYLES[style]
+        ops.append(f"BT /{font} {size} Tf {x:.2f} {top - leading + (leading - size) / 2:.2f} Td ({pdf_text(s)}) Tj ET")
+
+    def text(self, x: float, s: str, style: str = "normal") -> None:
+        """One line at the cursor; moves the cursor down one line."""
+        leading = STYLES[style][2]
+        self.need(leading)
+        if s:
+            self.put_text(self.ops, x, self.y, s, style)
+        self.y -= leading
+
+    def lines(self, text: str, style: str = "normal", x: Optional[float] = None,
+              width: Optional[float] = None, center: bool = False) -> None:
+        font, size, _ = STYLES[style]
+        x = self.left if x is None else x
+        width = self.width if width is None else width
+        for line in wrap_text(text, width, font, size):
+            dx = (width - text_width(line, font, size)) / 2 if center else 0
+            self.text(x + dx, line, style)
+
+    def rule(self, x1: float, x2: float, y: float, gray: float = 0) -> None:
+        self.ops.append(f"{gray} G 0.4 w {x1:.2f} {y:.2f} m {x2:.2f} {y:.2f} l S")
+
+    def image(self, path: str) -> None:
+        """A signature image at the left margin, or a note when there is none."""
+        if not path or not os.path.exists(path):
+            self.text(self.left, "[No signature]", "italic")
+            return
+        if path not in self.images:
+            try:
+                self.images[path] = self.writer.add_image(path)
+            except (PdfError, OSError, zlib.error) as e:
+                raise RuntimeError(f"Signature image not supported: {os.path.basename(path)} ({e})")
+        num, w, h = self.images[path]
+        scale = min(SIGNATURE_WIDTH / w, SIGNATURE_MAX_HEIGHT / h)
+        self.need(h * scale + 4)
+        self.y -= h * scale + 4
+        self.ops.append(f"q {w * scale:.2f} 0 0 {h * scale:.2f} {self.left:.2f} {self.y + 2:.2f} cm /Im{num} Do Q")
+
+
+# ----------------- Blocks -----------------
+
+def _fields(c: _Canvas, rows: List[Tuple[str, str]], values: Dict[str, Any]) -> None:
+    font, size, _ = STYLES["bold"]
+    label_w = max(text_width(label, font, size) for label, _ in rows) + 8
+    for label, text in rows:
+        # the label sits on the value's first line
+        c.need(STYLES["normal"][2])
+        c.put_text(c.ops, c.left, c.y, label, "bold")
+        c.lines(fill(text, values), x=c.left + label_w, width=c.width - label_w)
+
+
+def _columns(c: _Canvas, cols: List[Tuple[str, str]], values: Dict[str, Any]) -> None:
+    col_w = c.width / len(cols)
+    leading = STYLES["normal"][2]
+    c.need(2 * leading)
+    for i, (label, text) in enumerate(cols):
+        c.put_text(c.ops, c.left + i * col_w, c.y, label, "bold")
+        c.put_text(c.ops, c.left + i * col_w, c.y - leading, fill(text, values))
+    c.y -= 2 * leading
+
+
+def _list(c: _Canvas, value: Any) -> None:
+    if not isinstance(value, (list, tuple)):
+        c.lines(_inline(value))
+        return
+    for item in value:
+        c.need(STYLES["normal"][2])
+        c.put_text(c.ops, c.left + 6, c.y, "\u2022")
+        c.lines(str(item), x=c.left + 18, width=c.width - 18)
+
+
+def _table(c: _Canvas, value: Any) -> None:
+    if not value:
+        return
+    c.lines(value["title"], "heading")
+    c.y -= 4
+    label_w = max(text_width(label, *STYLES["bold"][:2]) for label, _ in value["rows"]) + 12
+    right = c.left + c.width
+    c.rule(c.left, right, c.y)
+    for label, text in value["rows"]:
+        # rows don't split across pages; a new page starts with the row's top rule
+        height = STYLES["normal"][2] * len(wrap_text(text, c.width - label_w - 6, *STYLES["normal"][:2])) + 6
+        if c.y - height < MARGIN:
+            c.new_page()
+            c.rule(c.left, right, c.y)
+        top = c.y
+        c.put_text(c.ops, c.left + 4, top - 3, label, "bold")
+        c.y -= 3
+        c.lines(text, x=c.left + label_w, width=c.width - label_w - 6)
+        c.y -= 3
+        c.ops.append(f"0 G 0.4 w {c.left:.2f} {top:.2f} m {c.left:.2f} {c.y:.2f} l "
+                     f"{c.left + label_w - 4:.2f} {top:.2f} m {c.left + label_w - 4:.2f} {c.y:.2f} l "
+                     f"{right:.2f} {top:.2f} m {right:.2f} {c.y:.2f} l S")
+        c.rule(c.left, right, c.y)
+
+
+def _box(c: _Canvas, text: str) -> None:
+    c.need(STYLES["normal"][2] + 12)
+    first, top = len(c.pages) - 1, c.y
+    c.y -= 6
+    c.lines(text or " ", x=c.left + 6, width=c.width - 12)
+    c.y -= 6
+    # one frame per page the text ran over
+    for i in range(first, len(c.pages)):
+        y1 = top if i == first else PAGE_SIZE[1] - MARGIN
+        y0 = c.y if i == len(c.pages) - 1 else MARGIN
+        c.pages[i].append(f"0 G 0.4 w {c.left:.2f} {y0:.2f} {c.width:.2f} {y1 - y0:.2f} re S")
+
+
+def _summary(c: _Canvas, rows: Any) -> None:
+    for label, value in rows or []:
+        if isinstance(value, (list, tuple)):
+            value = ", ".join(map(str, value)) or MISSING
+        c.lines(f"{label}: {value}")
+
+
+def _approvals(c: _Canvas, value: Any) -> None:
+    if isinstance(value, str):
+        c.lines(value, "italic")
+    elif not value:
+        c.lines("Pending approval", "italic")
+    else:
+        c.text(c.left, "Approved by:", "bold")
+        for path in value:
+            c.image(path)
+            c.y -= 6
+        c.text(c.left, "Status: Approved", "bold")
+
+
+def _footer(c: _Canvas, lines: List[Tuple[str, str]]) -> None:
+    height = sum(STYLES[style][2] * len(wrap_text(text, c.width, STYLES[style][0], STYLES[style][1]))
+                 for text, style in lines)
+    c.need(height + 8)
+    c.y = MARGIN + height
+    for text, style in lines:
+        c.lines(text, style)
+
+
+def render_layout(path: str, layout: List[Tuple], values: Dict[str, Any]) -> None:
+    """Draw ``layout`` filled with ``values`` (a PLAIN replacement builder's output) to ``path``."""
+    writer = PdfWriter()
+    catalog, pages_num = writer.reserve(), writer.reserve()
+    fonts = {name: writer.add(font_object(name)) for name in FONTS}
+    c = _Canvas(writer)
+
+    for block in layout:
+        kind, args = block[0], block[1:]
+        if kind == "center":
+            c.lines(fill(args[0], values), args[1] if len(args) > 1 else "normal", center=True)
+        elif kind == "text":
+            c.lines(fill(args[0], values), args[1] if len(args) > 1 else "normal")
+        elif kind == "heading":
+            c.y -= 8
+            c.lines(fill(args[0], values), "heading")
+            c.y -= 2
+        elif kind == "space":
+            c.y -= args[0]
+        elif kind == "fields":
+            _fields(c, args[0], values)
+        elif kind == "columns":
+            _columns(c, args[0], values)
+        elif kind == "list":
+            _list(c, values.get(args[0]))
+        elif kind == "table":
+            _table(c, values.get(args[0]))
+        elif kind == "box":
+            _box(c, fill(args[0], values))
+        elif kind == "summary":
+            _summary(c, values.get(args[0]))
+        elif kind == "signature":
+            c.image(values.get(args[0]))
+        elif kind == "approvals":
+            _approvals(c, values.get(args[0]))
+        elif kind == "footer":
+            _footer(c, args[0])
+        else:
+            raise RuntimeError(f"Unknown layout block: {kind}")
+
+    xobjects = " ".join(f"/Im{num} {num} 0 R" for num, _, _ in c.images.values())
+    resources = (f"<< /Font << {font_resources(fonts)} >> /XObject << {xobjects} >> "
+                 f"/ProcSet [/PDF /Text /ImageB /ImageC /ImageI] >>")
+    kids = []
+    for ops in c.pages:
+        content = writer.add_stream("/Filter /FlateDecode", zlib.compress("\n".join(ops).encode("latin-1")))
+        kids.append(writer.add((
+            f"<< /Type /Page /Parent {pages_num} 0 R /MediaBox [0 0 {PAGE_SIZE[0]} {PAGE_SIZE[1]}] "
+            f"/Resources {resources} /Contents {content} 0 R >>").encode("latin-1")))
+    writer.put(pages_num, (f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] "
+                           f"/Count {len(kids)} >>").encode("latin-1"))
+    writer.put(catalog, f"<< /Type /Catalog /Pages {pages_num} 0 R >>".encode("latin-1"))
+    writer.write(path, catalog)
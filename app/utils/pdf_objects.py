@@ -0,0 +1,274 @@
+# app/utils/pdf_objects.py
+"""
+Low-level PDF pieces shared by the in-process renderer (pdf_layout) and the
+approval stamper (pdf_stamp): the standard Helvetica fonts and their
+metrics, text strings, PNG/JPEG image XObjects, and a writer for a new file
+with a classic xref table.
+
+Only the 14 standard fonts are used, so nothing is embedded; text is
+WinAnsi (cp1252) encoded.
+"""
+import os
+import struct
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+PAGE_SIZE = (612, 792)  # US Letter, as the LaTeX templates use
+MARGIN = 72
+
+# Resource name -> base font. Oblique shares Helvetica's metrics.
+FONTS = {"F1": "Helvetica", "F2": "Helvetica-Bold", "F3": "Helvetica-Oblique"}
+
+# Advance widths (1/1000 em) of the printable ASCII range, from the AFM files
+_HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELVETICA_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+_WIDTHS = {
+    "F1": {chr(32 + i): w for i, w in enumerate(_HELVETICA)},
+    "F2": {chr(32 + i): w for i, w in enumerate(_HELVETICA_BOLD)},
+}
+_WIDTHS["F3"] = _WIDTHS["F1"]
+_DEFAULT_WIDTH = 556  # accented letters and the like
+
+# Characters outside WinAnsi that show up in form text
+_FALLBACKS = str.maketrans({
+    "\u2192": "->", "\u2190": "<-", "\u2194": "<->", "\u21d2": "=>",
+    "\u2264": "<=", "\u2265": ">=", "\u2260": "!=", "\u2212": "-",
+})
+
+
+class PdfError(Exception):
+    """Input the PDF code can't handle (unsupported image, PDF structure, ...)."""
+
+
+def font_resources(fonts: Dict[str, int]) -> str:
+    return " ".join(f"/{name} {num} 0 R" for name, num in fonts.items())
+
+
+def font_object(name: str) -> bytes:
+    return (f"<< /Type /Font /Subtype /Type1 /BaseFont /{FONTS[name]} "
+            f"/Encoding /WinAnsiEncoding >>").encode("latin-1")
+
+
+# ----------------- Text -----------------
+
+def pdf_text(s: str) -> str:
+    """A PDF literal string body in WinAnsi (unknown characters become '?')."""
+    raw = s.translate(_FALLBACKS).encode("cp1252", errors="replace").decode("latin-1")
+    return raw.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").replace("\r", "").replace("\n", " ")
+
+
+def text_width(s: str, font: str, size: float) -> float:
+    widths = _WIDTHS[font]
+    return sum(widths.get(ch, _DEFAULT_WIDTH) for ch in s.translate(_FALLBACKS)) * size / 1000
+
+
+def wrap_text(text: str, width: float, font: str = "F1", size: float = 10) -> List[str]:
+    """Greedy word wrap to ``width`` points; explicit newlines start a new line."""
+    lines: List[str] = []
+    space = text_width(" ", font, size)
+    for para in str(text).replace("\r\n", "\n").split("\n"):
+        line, line_w = "", 0.0
+        for word in para.split():
+            w = text_width(word, font, size)
+            while w > width and len(word) > 1:
+                # a word longer than the line (a URL, say) is broken where it overflows
+                cut = len(word) - 1
+                while cut > 1 and text_width(word[:cut], font, size) > width:
+                    cut -= 1
+                if line:
+                    lines.append(line)
+                    line, line_w = "", 0.0
+                lines.append(word[:cut])
+                word = word[cut:]
+                w = text_width(word, font, size)
+            if line and line_w + space + w > width:
+                lines.append(line)
+                line, line_w = word, w
+            else:
+                line, line_w = (f"{line} {word}", line_w + space + w) if line else (word, w)
+        lines.append(line)
+    return lines
+
+
+# ----------------- Images -----------------
+
+def _png_chunks(data: bytes):
+    pos = 8
+    while pos < len(data):
+        length, tag = struct.unpack(">I4s", data[pos:pos + 8])
+        yield tag, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+def _unfilter(raw: bytes, width: int, height: int, bpp: int) -> bytearray:
+    """Undo PNG scanline filters (8-bit samples)."""
+    stride = width * bpp
+    out = bytearray(stride * height)
+    prev = bytearray(stride)
+    pos = 0
+    for y in range(height):
+        ftype = raw[pos]
+        line = bytearray(raw[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        if ftype == 1:
+            for i in range(bpp, stride):
+                line[i] = (line[i] + line[i - bpp]) & 0xFF
+        elif ftype == 2:
+            for i in range(stride):
+                line[i] = (line[i] + prev[i]) & 0xFF
+        elif ftype == 3:
+            for i in range(stride):
+                left = line[i - bpp] if i >= bpp else 0
+                line[i] = (line[i] + ((left + prev[i]) >> 1)) & 0xFF
+        elif ftype == 4:
+            for i in range(stride):
+                a = line[i - bpp] if i >= bpp else 0
+                b = prev[i]
+                c = prev[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                line[i] = (line[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+        out[y * stride:(y + 1) * stride] = line
+        prev = line
+    return out
+
+
+def _png_image(data: bytes) -> Tuple[str, bytes, Optional[Tuple[str, bytes]], int, int]:
+    ihdr = plte = None
+    idat = []
+    for tag, body in _png_chunks(data):
+        if tag == b"IHDR":
+            ihdr = struct.unpack(">IIBBBBB", body)
+        elif tag == b"PLTE":
+            plte = body
+        elif tag == b"IDAT":
+            idat.append(body)
+    if ihdr is None:
+        raise PdfError("bad PNG")
+    width, height, depth, ctype, _, _, interlace = ihdr
+    if interlace:
+        raise PdfError("interlaced PNG")
+    stream = b"".join(idat)
+
+    if ctype in (0, 2, 3):
+        # no alpha: the PNG's own zlib stream + predictor works as is
+        colors = {0: 1, 2: 3, 3: 1}[ctype]
+        if ctype == 3:
+            if plte is None:
+                raise PdfError("PNG palette missing")
+            space = f"[/Indexed /DeviceRGB {len(plte) // 3 - 1} <{plte.hex()}>]"
+        else:
+            space = "/DeviceGray" if ctype == 0 else "/DeviceRGB"
+        entries = (f"/ColorSpace {space} /BitsPerComponent {depth} /Filter /FlateDecode "
+                   f"/DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent {depth} /Columns {width} >>")
+        return entries, stream, None, width, height
+
+    if depth != 8:
+        raise PdfError("16-bit PNG with alpha")
+    # gray+alpha or RGBA: split the alpha channel into a soft mask
+    channels = 2 if ctype == 4 else 4
+    pixels = _unfilter(zlib.decompress(stream), width, height, channels)
+    alpha = pixels[channels - 1::channels]
+    color = bytearray(len(alpha) * (channels - 1))
+    for c in range(channels - 1):
+        color[c::channels - 1] = pixels[c::channels]
+    space = "/DeviceGray" if ctype == 4 else "/DeviceRGB"
+    entries = f"/ColorSpace {space} /BitsPerComponent 8 /Filter /FlateDecode"
+    smask = ("/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode", zlib.compress(bytes(alpha)))
+    return entries, zlib.compress(bytes(color)), smask, width, height
+
+
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_image(data: bytes) -> Tuple[str, bytes, None, int, int]:
+    pos = 2
+    while pos < len(data) - 9:
+        if data[pos] != 0xFF:
+            raise PdfError("bad JPEG")
+        marker = data[pos + 1]
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            comps = data[pos + 9]
+            space = {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK /Decode [1 0 1 0 1 0 1 0]"}.get(comps)
+            if space is None:
+                raise PdfError("unsupported JPEG colour space")
+            return f"/ColorSpace {space} /BitsPerComponent 8 /Filter /DCTDecode", data, None, width, height
+        pos += 2 + length
+    raise PdfError("JPEG without a frame header")
+
+
+def load_image(path: str):
+    """(dict entries, stream, optional soft mask, width, height) for a PNG or JPEG file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return _png_image(data)
+    if data.startswith(b"\xff\xd8"):
+        return _jpeg_image(data)
+    raise PdfError(f"unsupported image: {os.path.basename(path)}")
+
+
+# ----------------- Writing -----------------
+
+class PdfWriter:
+    """Objects of a new PDF, numbered as they are added; ``write`` lays out the file."""
+
+    def __init__(self):
+        self.objects: List[Optional[bytes]] = []
+
+    def reserve(self) -> int:
+        self.objects.append(None)
+        return len(self.objects)
+
+    def put(self, num: int, body: bytes) -> int:
+        self.objects[num - 1] = body
+        return num
+
+    def add(self, body: bytes) -> int:
+        return self.put(self.reserve(), body)
+
+    def add_stream(self, entries: str, stream: bytes) -> int:
+        head = f"<< {entries} /Length {len(stream)} >>\nstream\n".encode("latin-1")
+        return self.add(head + stream + b"\nendstream")
+
+    def add_image(self, path: str) -> Tuple[int, int, int]:
+        """(object number, width, height) of an image XObject for ``path``."""
+        entries, stream, smask, w, h = load_image(path)
+        extra = ""
+        if smask:
+            mask = self.add_stream(f"/Type /XObject /Subtype /Image /Width {w} /Height {h} {smask[0]}", smask[1])
+            extra = f" /SMask {mask} 0 R"
+        num = self.add_stream(f"/Type /XObject /Subtype /Image /Width {w} /Height {h} {entries}{extra}", stream)
+        return num, w, h
+
+    def write(self, path: str, root: int) -> None:
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for num, body in enumerate(self.objects, 1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+        xref_at = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.objects) + 1)
+        out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+        out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(self.objects) + 1, root, xref_at)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(out)
+        os.replace(tmp, path)
@@ -0,0 +1,270 @@
+# app/utils/pdf_replacements.py
+"""
+Placeholder values for the LaTeX templates (and, with the PLAIN markup, for
+the in-process renderer), compiled from each form's fields_json plus its
+(optional) entry in forms_config.FORM_RENDER_SPECS.
+
+A compiled builder is a flat list of (placeholder, getter) pairs, so filling
+a form is one pass over precomputed closures with no per-field branching on
+kinds or specs. Builders are cached per (form_code, fields_json) like the
+form schemas, and every form - shipped or new - goes through the same code.
+"""
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app.utils.form_schema import FieldSpec
+from app.utils.forms_config import FORM_RENDER_SPECS, FORM_TEMPLATES
+from app.utils.latex import escape, escape_inline, render_list
+
+MISSING = "N/A"
+NONE_SELECTED = "None selected"
+NO_SIGNATURE = "\\textit{[No signature]}"
+APPROVAL_RECORD_TEXT = "Approver signatures are recorded on the Approval Record page at the end of this document."
+APPROVAL_RECORD_NOTE = f"\\textit{{{APPROVAL_RECORD_TEXT}}}"
+
+# (form_data, context) -> value; context holds submitter / submitted_date
+Getter = Callable[[Dict[str, Any], Dict[str, str]], Any]
+
+PLACEHOLDER_RE = re.compile(r"\{\{([A-Z0-9_]+)\}\}")
+
+
+def template_placeholders(template_content: str) -> frozenset:
+    return frozenset(PLACEHOLDER_RE.findall(template_content))
+
+
+def _render_signature_image(sig_path: str, latex_dir: str) -> str:
+    """Render a signature image for LaTeX."""
+    if not sig_path or not os.path.exists(sig_path):
+        return NO_SIGNATURE
+    # file names are not text: graphicx takes "_" as is, "\_" would break the lookup
+    rel_path = os.path.relpath(sig_path, latex_dir).replace(os.sep, "/")
+    return f"\\includegraphics[width=0.3\\textwidth]{{{rel_path}}}"
+
+
+def _empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == ()
+
+
+class Markup(NamedTuple):
+    """
+    How values are written out: LaTeX source for the pdflatex templates, or
+    plain Python values for the in-process renderer (see pdf_layout). The
+    defaults, formats and tables of FORM_RENDER_SPECS apply to both.
+    """
+    name: str
+    inline: Callable[[Any], Any]
+    text: Callable[[Any], Any]
+    items: Callable[[List[Any]], Any]
+    # (title, row labels) -> (row values, None where empty) -> table
+    table: Callable[[str, List[str]], Callable[[List[Any]], Any]]
+    # field labels -> field values -> summary of the whole form
+    summary: Callable[[List[str]], Callable[[List[Any]], Any]]
+    # (signature paths, latex dir, body only) -> STUDENT_/APPROVER_SIGNATURES
+    signatures: Callable[[List[str], str, bool], Dict[str, Any]]
+
+
+def _latex_table(title: str, labels: List[str]) -> Callable[[List[Any]], str]:
+    header = (f"\\noindent\\textbf{{\\large {escape_inline(title)}}}\\\\[0.2cm]\n"
+              "\\begin{tabularx}{\\textwidth}{|l|X|}\n\\hline\n")
+    prefixes = [f"\\textbf{{{escape_inline(label)}}} & " for label in labels]
+
+    def render(values: List[Any]) -> str:
+        body = [f"{prefix}{value} \\\\\n\\hline\n" for prefix, value in zip(prefixes, values) if value is not None]
+        if not body:
+            return ""
+        return header + "".join(body) + "\\end{tabularx}"
+    return render
+
+
+def _latex_summary(labels: List[str]) -> Callable[[List[Any]], str]:
+    prefixes = [f"  \\item[{escape_inline(label)}:] " for label in labels]
+
+    def render(values: List[Any]) -> str:
+        if not prefixes:
+            return ""
+        lines = [prefix + value for prefix, value in zip(prefixes, values)]
+        return "\\begin{description}\n" + "\n".join(lines) + "\n\\end{description}"
+    return render
+
+
+def _plain_inline(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        value = ", ".join(map(str, value))
+    return " ".join(str(value).split())
+
+
+def _plain_text(value: Any) -> str:
+    return "\n".join(line.rstrip() for line in str(value).replace("\r\n", "\n").split("\n"))
+
+
+def _plain_table(title: str, labels: List[str]) -> Callable[[List[Any]], Any]:
+    def render(values: List[Any]) -> Any:
+        rows = [(label, value) for label, value in zip(labels, values) if value is not None]
+        return {"title": title, "rows": rows} if rows else None
+    return render
+
+
+def _plain_summary(labels: List[str]) -> Callable[[List[Any]], Any]:
+    return lambda values: list(zip(labels, values))
+
+
+def _plain_signatures(signature_paths: List[str], latex_dir: str, body_only: bool) -> Dict[str, Any]:
+    student = signature_paths[0] if signature_paths else None
+    # paths of the approvers' signatures, or the note pointing at the approval record page
+    return {"STUDENT_SIGNATURE": student,
+            "APPROVER_SIGNATURES": APPROVAL_RECORD_TEXT if body_only else list(signature_paths[1:])}
+
+
+LATEX = Markup("latex", escape_inline, escape, render_list, _latex_table, _latex_summary,
+               lambda paths, latex_dir, body_only: _signature_replacements(paths, latex_dir, body_only))
+PLAIN = Markup("plain", _plain_inline, _plain_text, lambda items: [_plain_inline(v) for v in items],
+               _plain_table, _plain_summary, _plain_signatures)
+
+
+def _formatter(fmt: str, markup: Markup) -> Callable[[Any], Any]:
+    if fmt == "text":
+        return markup.text
+    if fmt == "list":
+        # a lone value in a list field still renders as a one-item list
+        items = markup.items
+        return lambda v: items(v if isinstance(v, (list, tuple)) else [v])
+    if fmt == "inline_list":
+        inline = markup.inline
+        return lambda v: inline(", ".join(map(str, v)) if isinstance(v, (list, tuple)) else v)
+    return markup.inline
+
+
+_FORMAT_BY_KIND = {"textarea": "text", "multi": "list"}
+
+
+def _default_getter(default: Optional[str], kind: str, markup: Markup) -> Callable[[Dict[str, str]], Any]:
+    if default is None:
+        default = {"date": "$submitted_date", "auto_date": "$submitted_date", "multi": NONE_SELECTED}.get(kind, MISSING)
+    inline = markup.inline
+    if default.startswith("$"):
+        name = default[1:]
+        return lambda ctx: inline(ctx[name])
+    text = inline(default)
+    return lambda ctx: text
+
+
+def _field_getter(field: FieldSpec, spec: Dict[str, Any], markup: Markup) -> Getter:
+    key = field.key
+    fmt = _formatter(spec.get("format") or _FORMAT_BY_KIND.get(field.kind, "inline"), markup)
+    fallback = _default_getter(spec.get("default"), field.kind, markup)
+
+    def get(form_data: Dict[str, Any], ctx: Dict[str, str]) -> Any:
+        value = form_data.get(key)
+        return fallback(ctx) if _empty(value) else fmt(value)
+    return get
+
+
+def _table_getter(title: str, rows: List[Tuple[str, FieldSpec]], markup: Markup) -> Getter:
+    render = markup.table(title, [label for label, _ in rows])
+    cells = [(field.key, markup.text if field.kind == "textarea" else markup.inline) for _, field in rows]
+
+    def get(form_data: Dict[str, Any], ctx: Dict[str, str]) -> Any:
+        return render([None if _empty(form_data.get(key)) else fmt(form_data[key]) for key, fmt in cells])
+    return get
+
+
+def _summary_getter(fields: List[FieldSpec], markup: Markup) -> Getter:
+    """Every field as a description list, for templates that just want {{FORM_DATA}}."""
+    fields = [f for f in fields if f.kind != "file"]
+    render = markup.summary([f.label for f in fields])
+    formats = [(f.key, _formatter(_FORMAT_BY_KIND.get(f.kind, "inline"), markup)) for f in fields]
+    missing = markup.inline(MISSING)
+
+    def get(form_data: Dict[str, Any], ctx: Dict[str, str]) -> Any:
+        return render([missing if _empty(form_data.get(key)) else fmt(form_data[key]) for key, fmt in formats])
+    return get
+
+
+class ReplacementBuilder:
+    """Compiled placeholder -> value mapping for one form."""
+
+    def __init__(self, form_code: str, fields_json: Dict[str, Any], spec: Optional[Dict[str, Any]] = None,
+                 markup: Markup = None):
+        spec = spec if spec is not None else FORM_RENDER_SPECS.get(form_code, {})
+        markup = markup or LATEX
+        field_specs = spec.get("fields", {})
+        fields = [FieldSpec(k, v) for k, v in (fields_json or {}).items()]
+        by_key = {f.key: f for f in fields}
+
+        self.form_code = form_code
+        self.markup = markup
+        self.getters: List[Tuple[str, Getter]] = [
+            (f.key.upper(), _field_getter(f, field_specs.get(f.key, {}), markup)) for f in fields
+        ]
+        for placeholder, table in spec.get("tables", {}).items():
+            rows = [(label, by_key.get(key) or FieldSpec(key, "text")) for label, key in table["rows"]]
+            self.getters.append((placeholder, _table_getter(table.get("title", ""), rows, markup)))
+        self.getters.append(("FORM_DATA", _summary_getter(fields, markup)))
+        # template placeholders -> only the getters that template uses
+        self._subsets: Dict[frozenset, List[Tuple[str, Getter]]] = {}
+
+    def _getters_for(self, placeholders: Optional[frozenset]) -> List[Tuple[str, Getter]]:
+        if placeholders is None:
+            return self.getters
+        subset = self._subsets.get(placeholders)
+        if subset is None:
+            subset = self._subsets[placeholders] = [(p, g) for p, g in self.getters if p in placeholders]
+        return subset
+
+    def __call__(self, form_data: Dict[str, Any], submitter_name: str, submitted_date: str,
+                 signature_paths: List[str], latex_dir: str,
+                 placeholders: Optional[frozenset] = None, body_only: bool = False) -> Dict[str, Any]:
+        """
+        Values for every placeholder, or only for ``placeholders`` (see
+        template_placeholders) so a template skips the ones it never shows.
+        ``body_only`` leaves approver signatures to the approval record page.
+        """
+        ctx = {"submitter": submitter_name or "Unknown", "submitted_date": submitted_date}
+        form_data = form_data or {}
+        replacements = {placeholder: get(form_data, ctx) for placeholder, get in self._getters_for(placeholders)}
+        replacements["SUBMITTED_DATE"] = self.markup.inline(submitted_date)
+        replacements.update(self.markup.signatures(signature_paths, latex_dir, body_only))
+        return replacements
+
+
+def _signature_replacements(signature_paths: List[str], latex_dir: str,
+                            body_only: bool = False) -> Dict[str, str]:
+    # Student signature (first in list)
+    student = _render_signature_image(signature_paths[0], latex_dir) if signature_paths else NO_SIGNATURE
+
+    if body_only:
+        # approvals are stamped onto the PDF afterwards (see pdf_stamp)
+        approvers = APPROVAL_RECORD_NOTE
+    elif len(signature_paths) > 1:
+        # Every approver in the chain, in sequence order
+        blocks = [f"{_render_signature_image(p, latex_dir)}\\\\[6pt]\n" for p in signature_paths[1:]]
+        approvers = (
+            f"\\noindent\\textbf{{Approved by:}}\\\\[6pt]\n"
+            + "".join(blocks)
+            + "\\textbf{Status:} Approved\n"
+        )
+    else:
+        approvers = "\\textit{Pending approval}"
+    return {"STUDENT_SIGNATURE": student, "APPROVER_SIGNATURES": approvers}
+
+
+_CONFIG_FIELDS = {f["form_code"]: f["fields_json"] for f in FORM_TEMPLATES}
+
+# (form_code, fields_json fingerprint, markup) -> ReplacementBuilder
+_builders: Dict[Tuple[str, str, str], ReplacementBuilder] = {}
+_builders_lock = threading.Lock()
+
+
+def get_builder(form_template, markup: Markup = LATEX) -> ReplacementBuilder:
+    """Compiled builder for a FormTemplate (or anything with form_code / fields_json)."""
+    form_code = getattr(form_template, "form_code", None) or "form"
+    fields_json = getattr(form_template, "fields_json", None) or _CONFIG_FIELDS.get(form_code, {})
+    key = (form_code, repr(fields_json), markup.name)
+    builder = _builders.get(key)
+    if builder is None:
+        builder = ReplacementBuilder(form_code, fields_json, markup=markup)
+        with _builders_lock:
+            _builders[key] = builder
+    return builder
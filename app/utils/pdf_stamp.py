@@ -0,0 +1,395 @@
+# app/utils/pdf_stamp.py
+"""
+Approval signatures as incremental PDF updates.
+
+The request body is typeset once, at submission (``render_body_pdf``). Each
+approval then copies the latest signed PDF and appends an incremental update
+(new objects + xref section + trailer with /Prev, as PDF readers expect from
+an edited file) that adds or replaces the "Approval Record" pages listing
+every approver in the chain with their signature, ROWS_PER_PAGE to a page. Earlier revisions stay intact
+inside the file, and no pdflatex run is needed at approval time.
+
+Only what our renderers write is handled: a classic xref table (the
+generated .tex sets \\pdfobjcompresslevel=0; pdf_layout writes one anyway)
+and PNG/JPEG signatures (see pdf_objects). Anything else raises PdfError
+and ``sign_request_pdf`` falls back to a full render.
+"""
+import logging
+import os
+import re
+import zlib
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.utils import pdf_generator
+from app.utils.pdf_objects import (MARGIN, PAGE_SIZE, PdfError, font_object, load_image, pdf_text,
+                                   wrap_text)
+
+log = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+OUTPUT_DIR = "generated_pdfs"
+ROWS_PER_PAGE = 8  # approval record rows before continuing on a new page
+
+
+class StampError(PdfError):
+    """The PDF can't be updated incrementally."""
+
+
+class ApprovalEntry(NamedTuple):
+    key: int                  # step id; names the signature image on the page
+    heading: str              # e.g. "Step 2 - department"
+    name: str
+    date: str
+    comments: str
+    signature_path: Optional[str]
+
+
+# ----------------- Reading -----------------
+
+_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)\s+%%EOF", re.S)
+_XREF_ENTRY_RE = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+_REF_RE = rb"/%s\s+(\d+)\s+(\d+)\s+R"
+
+
+def _dict_at(data: bytes, start: int) -> Tuple[bytes, int]:
+    """The balanced << ... >> starting at ``start``, and the offset after it."""
+    if data[start:start + 2] != b"<<":
+        raise StampError("expected a dictionary")
+    depth, i = 0, start
+    while i < len(data):
+        two = data[i:i + 2]
+        if two == b"<<":
+            depth += 1
+            i += 2
+        elif two == b">>":
+            depth -= 1
+            i += 2
+            if depth == 0:
+                return data[start:i], i
+        elif data[i:i + 1] == b"(":
+            # skip literal strings, which may contain unbalanced brackets
+            i = data.index(b")", i) + 1
+        else:
+            i += 1
+    raise StampError("unterminated dictionary")
+
+
+def _ref(dict_text: bytes, key: str) -> Optional[int]:
+    m = re.search(_REF_RE % key.encode(), dict_text)
+    return int(m.group(1)) if m else None
+
+
+class PdfFile:
+    """Just enough of a PDF reader to append an update to what pdflatex writes."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        m = None
+        for m in _STARTXREF_RE.finditer(data):
+            pass
+        if m is None:
+            raise StampError("no startxref")
+        self.startxref = int(m.group(1))
+        self.offsets: Dict[int, int] = {}
+        self.trailer = b""
+        offset, seen = self.startxref, set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            trailer = self._read_xref(offset)
+            self.trailer = self.trailer or trailer
+            prev = re.search(rb"/Prev\s+(\d+)", trailer)
+            offset = int(prev.group(1)) if prev else None
+        if b"/Encrypt" in self.trailer:
+            raise StampError("encrypted PDF")
+        size = re.search(rb"/Size\s+(\d+)", self.trailer)
+        self.size = int(size.group(1)) if size else max(self.offsets, default=0) + 1
+        self.root = _ref(self.trailer, "Root")
+        if self.root is None:
+            raise StampError("no /Root")
+
+    def _read_xref(self, offset: int) -> bytes:
+        if self.data[offset:offset + 4] != b"xref":
+            # PDF 1.5 cross-reference stream: not written with \pdfobjcompresslevel=0
+            raise StampError("cross-reference streams are not supported")
+        pos = offset + 4
+        trailer_at = self.data.index(b"trailer", pos)
+        section = self.data[pos:trailer_at]
+        for sub in re.finditer(rb"(\d+)\s+(\d+)\s*[\r\n]+((?:\d{10} \d{5} [nf]\s*)*)", section):
+            first = int(sub.group(1))
+            for i, entry in enumerate(_XREF_ENTRY_RE.finditer(sub.group(3))):
+                num = first + i
+                # newest section wins; we read newest first
+                if entry.group(3) == b"n" and num not in self.offsets:
+                    self.offsets[num] = int(entry.group(1))
+        start = self.data.index(b"<<", trailer_at)
+        return _dict_at(self.data, start)[0]
+
+    def object_dict(self, num: int) -> bytes:
+        offset = self.offsets.get(num)
+        if offset is None:
+            raise StampError(f"object {num} not found")
+        m = re.compile(rb"%d\s+\d+\s+obj\s*" % num).match(self.data, offset)
+        if not m:
+            raise StampError(f"object {num} not at its xref offset")
+        return _dict_at(self.data, m.end())[0]
+
+
+# ----------------- Writing -----------------
+
+def _page_content(title: str, subtitle: str, entries: List[ApprovalEntry],
+                  images: Dict[int, Tuple[int, int]]) -> bytes:
+    width, height = PAGE_SIZE
+    top = height - MARGIN
+    ops = [
+        f"BT /F2 16 Tf {MARGIN} {top} Td ({pdf_text(title)}) Tj ET",
+        f"BT /F1 10 Tf {MARGIN} {top - 18} Td ({pdf_text(subtitle)}) Tj ET",
+        f"0.6 G 0.5 w {MARGIN} {top - 28} m {width - MARGIN} {top - 28} l S",
+    ]
+    # rows share the space below the heading, down to ROWS_PER_PAGE of them;
+    # append_approval_page continues longer chains on another page
+    row_h = min(100, (top - 40 - MARGIN) / max(len(entries), 1))
+    y = top - 40
+    for e in entries:
+        base = y - row_h + 12
+        if e.key in images:
+            iw, ih = images[e.key]
+            scale = min(160 / iw, (row_h - 30) / ih)
+            ops.append(f"q {iw * scale:.2f} 0 0 {ih * scale:.2f} {MARGIN} {base + 8:.2f} cm /S{e.key} Do Q")
+        else:
+            ops.append(f"BT /F1 10 Tf {MARGIN} {base + 20:.2f} Td ([No signature]) Tj ET")
+        x = MARGIN + 180
+        ops.append(f"BT /F2 11 Tf {x} {y - 14:.2f} Td ({pdf_text(e.heading)}) Tj ET")
+        ops.append(f"BT /F1 10 Tf {x} {y - 28:.2f} Td (Approved by {pdf_text(e.name)}) Tj ET")
+        ops.append(f"BT /F1 10 Tf {x} {y - 41:.2f} Td ({pdf_text(e.date)}) Tj ET")
+        line_y = y - 54
+        for line in wrap_text(e.comments or "", PAGE_SIZE[0] - MARGIN - x, "F1", 9)[: max(int((row_h - 60) // 12), 0)]:
+            ops.append(f"BT /F1 9 Tf {x} {line_y:.2f} Td ({pdf_text(line)}) Tj ET")
+            line_y -= 12
+        ops.append(f"0.85 G 0.5 w {MARGIN} {y - row_h:.2f} m {width - MARGIN} {y - row_h:.2f} l S")
+        y -= row_h
+    return zlib.compress("\n".join(ops).encode("latin-1"))
+
+
+class _Update:
+    """Collects objects for one incremental update."""
+
+    def __init__(self, pdf: PdfFile):
+        self.pdf = pdf
+        self.next_num = pdf.size
+        self.objects: Dict[int, bytes] = {}
+
+    def new_num(self) -> int:
+        num = self.next_num
+        self.next_num += 1
+        return num
+
+    def put(self, num: int, body: bytes) -> int:
+        self.objects[num] = body
+        return num
+
+    def add(self, body: bytes) -> int:
+        return self.put(self.new_num(), body)
+
+    def add_stream(self, entries: str, stream: bytes) -> int:
+        head = f"<< {entries} /Length {len(stream)} >>\nstream\n".encode("latin-1")
+        return self.add(head + stream + b"\nendstream")
+
+    def serialize(self) -> bytes:
+        data = self.pdf.data
+        out = bytearray(b"" if data.endswith(b"\n") else b"\n")
+        offsets = {}
+        for num in sorted(self.objects):
+            offsets[num] = len(data) + len(out)
+            out += b"%d 0 obj\n" % num + self.objects[num] + b"\nendobj\n"
+        xref_at = len(data) + len(out)
+        # object 0 heads the free list; strict readers expect a section to start at 0
+        out += b"xref\n0 1\n0000000000 65535 f \n"
+        nums = sorted(offsets)
+        while nums:
+            # one subsection per run of consecutive object numbers
+            run = 1
+            while run < len(nums) and nums[run] == nums[0] + run:
+                run += 1
+            out += b"%d %d\n" % (nums[0], run)
+            out += b"".join(b"%010d 00000 n \n" % offsets[n] for n in nums[:run])
+            nums = nums[run:]
+        trailer = [f"/Size {max(self.next_num, self.pdf.size)}", f"/Root {self.pdf.root} 0 R",
+                   f"/Prev {self.pdf.startxref}"]
+        info = _ref(self.pdf.trailer, "Info")
+        if info is not None:
+            trailer.append(f"/Info {info} 0 R")
+        ids = re.search(rb"/ID\s*\[[^\]]*\]", self.pdf.trailer)
+        if ids:
+            trailer.append(ids.group().decode("latin-1"))
+        out += b"trailer\n<< " + " ".join(trailer).encode("latin-1") + b" >>\n"
+        out += b"startxref\n%d\n%%%%EOF\n" % xref_at
+        return bytes(out)
+
+
+def _record_pages(pdf: PdfFile, kids: List[int]) -> List[Tuple[int, bytes]]:
+    """The approval record pages among ``kids``, in order."""
+    return [(num, page) for num, page in ((n, pdf.object_dict(n)) for n in kids)
+            if b"/ApprovalRecord true" in page]
+
+
+def append_approval_page(src: str, dst: str, entries: List[ApprovalEntry],
+                         title: str = "Approval Record", subtitle: str = "") -> None:
+    """
+    Write ``src`` plus an incremental update showing ``entries`` on the
+    approval record page to ``dst``. Signature images already embedded by an
+    earlier update (same entry key) are reused rather than embedded again.
+    """
+    with open(src, "rb") as f:
+        pdf = PdfFile(f.read())
+
+    catalog = pdf.object_dict(pdf.root)
+    pages_num = _ref(catalog, "Pages")
+    if pages_num is None:
+        raise StampError("catalog without /Pages")
+    pages = pdf.object_dict(pages_num)
+    kids_m = re.search(rb"/Kids\s*\[([^\]]*)\]", pages)
+    if not kids_m:
+        raise StampError("page tree without /Kids")
+    kids = [int(n) for n in re.findall(rb"(\d+)\s+\d+\s+R", kids_m.group(1))]
+
+    update = _Update(pdf)
+    existing = _record_pages(pdf, kids)
+    images: Dict[int, int] = {}
+    fonts: Dict[str, int] = {}
+    for _, page in existing:
+        images.update({int(k): int(n) for k, n in re.findall(rb"/S(\d+)\s+(\d+)\s+\d+\s+R", page)})
+        fonts.update({k.decode(): int(n) for k, n in re.findall(rb"/(F[12])\s+(\d+)\s+\d+\s+R", page)})
+
+    for name in ("F1", "F2"):
+        if name not in fonts:
+            fonts[name] = update.add(font_object(name))
+
+    sizes: Dict[int, Tuple[int, int]] = {}
+    for e in entries:
+        if not e.signature_path or not os.path.exists(e.signature_path):
+            continue
+        if e.key in images:
+            dims = re.search(rb"/Width\s+(\d+)\s*/Height\s+(\d+)", pdf.object_dict(images[e.key]))
+            if dims:
+                sizes[e.key] = (int(dims.group(1)), int(dims.group(2)))
+                continue
+        entries_s, stream, smask, w, h = load_image(e.signature_path)
+        extra = ""
+        if smask:
+            extra = f" /SMask {update.add_stream(f'/Type /XObject /Subtype /Image /Width {w} /Height {h} {smask[0]}', smask[1])} 0 R"
+        images[e.key] = update.add_stream(
+            f"/Type /XObject /Subtype /Image /Width {w} /Height {h} {entries_s}{extra}", stream)
+        sizes[e.key] = (w, h)
+
+    # ROWS_PER_PAGE entries per record page; existing record pages are rewritten in place
+    chunks = [entries[i:i + ROWS_PER_PAGE] for i in range(0, len(entries), ROWS_PER_PAGE)] or [[]]
+    old_nums = [num for num, _ in existing]
+    page_nums = old_nums[:len(chunks)] + [update.new_num() for _ in chunks[len(old_nums):]]
+    for i, (page_num, chunk) in enumerate(zip(page_nums, chunks)):
+        page_title = title if i == 0 else f"{title} (continued)"
+        chunk_sizes = {e.key: sizes[e.key] for e in chunk if e.key in sizes}
+        content = update.add_stream("/Filter /FlateDecode", _page_content(page_title, subtitle, chunk, chunk_sizes))
+        xobjects = " ".join(f"/S{k} {images[k]} 0 R" for k in chunk_sizes)
+        update.put(page_num, (
+            f"<< /Type /Page /Parent {pages_num} 0 R /MediaBox [0 0 {PAGE_SIZE[0]} {PAGE_SIZE[1]}] "
+            f"/ApprovalRecord true /Resources << /Font << /F1 {fonts['F1']} 0 R /F2 {fonts['F2']} 0 R >> "
+            f"/XObject << {xobjects} >> /ProcSet [/PDF /Text /ImageB /ImageC /ImageI] >> "
+            f"/Contents {content} 0 R >>"
+        ).encode("latin-1"))
+
+    if page_nums != old_nums:
+        # record pages go last, after the body's pages
+        new_kids = [n for n in kids if n not in old_nums] + page_nums
+        refs = b" ".join(b"%d 0 R" % n for n in new_kids)
+        new_pages = pages.replace(kids_m.group(0), b"/Kids [" + refs + b"]", 1)
+        count = re.search(rb"/Count\s+(\d+)", pages)
+        if count:
+            new_count = int(count.group(1)) + len(page_nums) - len(old_nums)
+            new_pages = new_pages.replace(count.group(0), b"/Count %d" % new_count, 1)
+        update.put(pages_num, new_pages)
+
+    tmp = dst + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(pdf.data)
+        f.write(update.serialize())
+    os.replace(tmp, dst)
+
+
+# ----------------- Request PDFs -----------------
+
+def _abs(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(REPO_ROOT, path)
+
+
+def _form_code(request) -> str:
+    return getattr(getattr(request, "form_template", None), "form_code", "form")
+
+
+def body_pdf_path(request) -> str:
+    """Where the typeset body of ``request`` lives (project-root relative)."""
+    return os.path.join(OUTPUT_DIR, f"{_form_code(request)}_{request.id}_body.pdf")
+
+
+def render_body_pdf(request, student_signature: Optional[str]) -> Optional[str]:
+    """
+    Typeset the request body (form values + student signature) once, at
+    submission. Returns its path, or None if rendering failed; approval then
+    falls back to a full render.
+    """
+    try:
+        return pdf_generator.generate_request_pdf(request, [student_signature] if student_signature else [],
+                                                  base_name=f"{_form_code(request)}_{request.id}_body",
+                                                  body_only=True)
+    except RuntimeError as e:
+        log.warning("body PDF for request %s not rendered: %s", request.id, str(e).splitlines()[0])
+        return None
+
+
+def _signed_base(request, step) -> Optional[str]:
+    """The newest PDF of this request to stamp onto: a sibling's signed copy, else the body."""
+    done = [s for s in request.approval_steps
+            if s.id != step.id and s.status == "approved" and s.signed_pdf_path]
+    for s in sorted(done, key=lambda x: (x.actioned_at or datetime.min, x.sequence), reverse=True):
+        if os.path.exists(_abs(s.signed_pdf_path)):
+            return s.signed_pdf_path
+    body = body_pdf_path(request)
+    return body if os.path.exists(_abs(body)) else None
+
+
+def sign_request_pdf(request, step, approvals, student_signature: Optional[str]) -> str:
+    """
+    Signed PDF for ``step`` of ``request``: the latest signed copy (or the
+    body typeset at submission) plus an incremental update listing every
+    approval so far. ``approvals`` is [(step, approver, signature path)] in
+    sequence order, ``step`` included.
+
+    Falls back to a full pdflatex render if there is nothing to stamp onto
+    or the PDF can't be updated in place. Returns the project-root relative
+    path; raises RuntimeError if that render fails too.
+    """
+    base_name = f"{_form_code(request)}_{request.id}_step{step.id}"
+    out = os.path.join(OUTPUT_DIR, f"{base_name}.pdf")
+    src = _signed_base(request, step)
+    if src is None:
+        src = render_body_pdf(request, student_signature)
+    if src is not None:
+        entries = [
+            ApprovalEntry(
+                key=s.id,
+                heading=f"Step {s.sequence}" + (f" - {s.stage}" if s.stage else ""),
+                name=getattr(approver, "name", None) or getattr(approver, "email", None) or "Unknown",
+                date=s.actioned_at.strftime("%Y-%m-%d %H:%M") if s.actioned_at else "",
+                comments=s.comments or "",
+                signature_path=_abs(sig) if sig else None,
+            )
+            for s, approver, sig in approvals
+        ]
+        subtitle = f"Request #{request.id} - {_form_code(request)}"
+        try:
+            append_approval_page(_abs(src), _abs(out), entries, subtitle=subtitle)
+            return out
+        except (PdfError, OSError, ValueError, zlib.error) as e:
+            log.warning("stamping %s failed, re-rendering: %s", src, e)
+    signature_paths = [p for p in [student_signature] + [sig for _, _, sig in approvals] if p]
+    return pdf_generator.generate_request_pdf(request, signature_paths, base_name=base_name)
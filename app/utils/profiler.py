@@ -0,0 +1,211 @@
+# app/utils/profiler.py
+"""
+Opt-in sampling profiler for single requests.
+
+A profile is taken when an admin adds ``?_profile=1`` (or the header
+``X-Profile: 1``) to a request, or at random for ``PROFILE_SAMPLE_RATE`` of
+all requests. A background thread snapshots the handler thread's stack every
+``PROFILE_INTERVAL`` seconds, so time blocked in SQL or waiting on pdflatex
+shows up as well as Python work. Each profile is written to ``PROFILE_DIR``
+as a speedscope file (open at https://www.speedscope.app) or, with
+``?_profile=collapsed``, as collapsed stacks for flamegraph.pl.
+
+When nobody asks for a profile the cost is one dict lookup and a config
+read per request.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, current_app, g, request
+
+from app.users.routes import current_db_user, is_session_admin
+
+DEFAULT_INTERVAL = 0.001
+FORMATS = ("speedscope", "collapsed")
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+
+# The sampler only runs when the GIL is handed over, which by default happens
+# every 5 ms; shorten the switch interval while any profile is active.
+_switch_lock = threading.Lock()
+_active = 0
+_saved_switch_interval = None
+
+
+def _enter_sampling(interval: float) -> None:
+    global _active, _saved_switch_interval
+    with _switch_lock:
+        if _active == 0:
+            _saved_switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(_saved_switch_interval, interval / 2))
+        _active += 1
+
+
+def _leave_sampling() -> None:
+    global _active
+    with _switch_lock:
+        _active -= 1
+        if _active == 0:
+            sys.setswitchinterval(_saved_switch_interval)
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        # (root-first stack, seconds the sample stands for)
+        self.samples: List[Tuple[Tuple[Frame, ...], float]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self.started = self.elapsed = 0.0
+
+    def _stack(self) -> Optional[Tuple[Frame, ...]]:
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        me = sys._getframe()
+        while frame is not None and frame is not me:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack) if stack else None
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            stack = self._stack()
+            now = time.perf_counter()
+            if stack:
+                self.samples.append((stack, now - last))
+            last = now
+
+    def start(self) -> "StackSampler":
+        _enter_sampling(self.interval)
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        _leave_sampling()
+
+
+def _frame_name(frame: Frame) -> str:
+    name, path, line = frame
+    return f"{name} ({os.path.basename(path)}:{line})"
+
+
+def to_collapsed(samples) -> str:
+    """Brendan Gregg's folded format, weighted in microseconds."""
+    folded: Counter = Counter()
+    for stack, weight in samples:
+        folded[";".join(_frame_name(f) for f in stack)] += weight
+    return "".join(f"{k} {max(1, round(v * 1e6))}\n" for k, v in folded.most_common())
+
+
+def to_speedscope(samples, name: str, elapsed: float) -> Dict:
+    index: Dict[Frame, int] = {}
+    frames = []
+    out_samples, weights = [], []
+    for stack, weight in samples:
+        ids = []
+        for f in stack:
+            if f not in index:
+                index[f] = len(frames)
+                frames.append({"name": f[0], "file": f[1], "line": f[2]})
+            ids.append(index[f])
+        out_samples.append(ids)
+        weights.append(weight)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "app.utils.profiler",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled", "name": name, "unit": "seconds",
+            "startValue": 0, "endValue": elapsed,
+            "samples": out_samples, "weights": weights,
+        }],
+    }
+
+
+def write_profile(sampler: StackSampler, directory: str, label: str, fmt: str = "speedscope") -> str:
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    safe = "".join(c if c.isalnum() or c in "._-" else "_" for c in label)
+    ms = round(sampler.elapsed * 1000)
+    if fmt == "collapsed":
+        path = os.path.join(directory, f"{stamp}_{safe}_{ms}ms.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(to_collapsed(sampler.samples))
+    else:
+        path = os.path.join(directory, f"{stamp}_{safe}_{ms}ms.speedscope.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(to_speedscope(sampler.samples, label, sampler.elapsed), f)
+    return path
+
+
+# ----------------- Flask -----------------
+
+def _requested_format() -> Optional[str]:
+    flag = request.args.get("_profile") or request.headers.get("X-Profile")
+    if not flag or flag in ("0", "false"):
+        return None
+    return flag if flag in FORMATS else "speedscope"
+
+
+def _is_admin() -> bool:
+    me = current_db_user()
+    if me and me.status == "active" and (me.role or "").lower() == "admin":
+        return True
+    return is_session_admin()
+
+
+def _start_profile():
+    fmt = _requested_format()
+    if fmt is not None:
+        if not _is_admin():
+            return
+    else:
+        rate = current_app.config.get("PROFILE_SAMPLE_RATE", 0.0)
+        if not rate or random.random() >= rate:
+            return
+        fmt = current_app.config.get("PROFILE_FORMAT", "speedscope")
+    g.profile_format = fmt
+    g.profiler = StackSampler(threading.get_ident(),
+                              current_app.config.get("PROFILE_INTERVAL", DEFAULT_INTERVAL)).start()
+
+
+def _finish_profile(response):
+    sampler = g.pop("profiler", None)
+    if sampler is None:
+        return response
+    sampler.stop()
+    label = f"{request.method}_{request.endpoint or 'unmatched'}"
+    path = write_profile(sampler, current_app.config.get("PROFILE_DIR", "profiles"), label, g.profile_format)
+    response.headers["X-Profile-File"] = os.path.basename(path)
+    return response
+
+
+def _abandon_profile(exc):
+    # the handler raised: after_request never ran, so just stop sampling
+    sampler = g.pop("profiler", None)
+    if sampler is not None:
+        sampler.stop()
+
+
+def init_profiler(app: Flask) -> None:
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_abandon_profile)
@@ -0,0 +1,163 @@
+# app/utils/render_governor.py
+"""
+Admission control and limits for PDF renders.
+
+At most ``RENDER_MAX_CONCURRENT`` renders run at once in a process; up to
+``RENDER_MAX_QUEUE`` more wait for a slot (for ``RENDER_QUEUE_TIMEOUT``
+seconds at most), and anything past that is refused straight away with
+RenderBusy. A burst of approvals then gets quick "busy, retry" answers
+instead of tying up every web worker behind pdflatex.
+
+pdflatex runs in its own process group under a wall-clock limit
+(``RENDER_TIMEOUT``) and, on POSIX, an address-space limit per process
+(``RENDER_MEMORY_MB``). A render that runs over is killed together with
+its children and its partial output is removed.
+"""
+import os
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+from flask import Flask
+
+from app.utils.metrics import METRICS, Counter, Histogram, register_collector
+
+QUEUE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+RENDER_QUEUE_WAIT = Histogram("pdf_render_queue_wait_seconds", "Time renders waited for a slot, by backend.",
+                              QUEUE_BUCKETS)
+RENDER_SHED = Counter("pdf_render_shed_total", "Renders refused as busy, by backend and reason.")
+RENDER_KILLED = Counter("pdf_render_killed_total", "Renders killed for running over RENDER_TIMEOUT.")
+METRICS.extend([RENDER_QUEUE_WAIT, RENDER_SHED, RENDER_KILLED])
+
+
+class RenderBusy(RuntimeError):
+    """Too many renders running and queued; retry shortly."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"PDF renderer busy ({reason}), retry shortly")
+        self.reason = reason
+
+
+class RenderKilled(RuntimeError):
+    """A render ran over its wall-clock limit and was killed."""
+
+
+class RenderGovernor:
+    """A counting semaphore with a bounded, time-limited wait queue."""
+
+    def __init__(self, max_concurrent: Optional[int] = None, max_queue: Optional[int] = None,
+                 queue_timeout: float = 10.0, render_timeout: float = 60.0, memory_mb: Optional[int] = 1024):
+        self._cond = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.configure(max_concurrent, max_queue, queue_timeout, render_timeout, memory_mb)
+
+    def configure(self, max_concurrent: Optional[int] = None, max_queue: Optional[int] = None,
+                  queue_timeout: float = 10.0, render_timeout: float = 60.0,
+                  memory_mb: Optional[int] = 1024) -> None:
+        with self._cond:
+            self.max_concurrent = max(1, max_concurrent or os.cpu_count() or 2)
+            self.max_queue = max(0, 2 * self.max_concurrent if max_queue is None else max_queue)
+            self.queue_timeout = queue_timeout
+            self.render_timeout = render_timeout
+            self.memory_mb = memory_mb
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, backend: str):
+        """Hold one render slot for the ``with`` body; raises RenderBusy if none comes free."""
+        started = time.perf_counter()
+        with self._cond:
+            if self.running >= self.max_concurrent and self.waiting >= self.max_queue:
+                RENDER_SHED.inc(backend=backend, reason="queue_full")
+                raise RenderBusy("queue full")
+            self.waiting += 1
+            try:
+                deadline = started + self.queue_timeout
+                while self.running >= self.max_concurrent:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        RENDER_SHED.inc(backend=backend, reason="queue_timeout")
+                        raise RenderBusy("timed out waiting for a slot")
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.running += 1
+        RENDER_QUEUE_WAIT.observe(time.perf_counter() - started, backend=backend)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.running -= 1
+                self._cond.notify()
+
+
+GOVERNOR = RenderGovernor()
+
+register_collector("pdf_render_slots", "Renders running and waiting, with the configured limits.", "gauge",
+                   lambda: {(("state", "running"),): GOVERNOR.running,
+                            (("state", "waiting"),): GOVERNOR.waiting,
+                            (("state", "max_concurrent"),): GOVERNOR.max_concurrent,
+                            (("state", "max_queue"),): GOVERNOR.max_queue})
+
+
+def _limit_memory(cmd: List[str], memory_mb: int) -> List[str]:
+    """
+    ``cmd`` run through ``sh`` under an address-space limit. Done in the
+    shell rather than with preexec_fn, which isn't safe in a threaded server;
+    where ``ulimit -v`` isn't supported the command runs unlimited.
+    """
+    return ["sh", "-c", 'ulimit -v "$0" 2>/dev/null; exec "$@"', str(memory_mb * 1024)] + list(cmd)
+
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_limited(cmd: List[str], cleanup: Iterable[str] = ()) -> subprocess.CompletedProcess:
+    """
+    ``subprocess.run(cmd, capture_output=True, text=True)`` under GOVERNOR's
+    wall-clock and memory limits. On timeout the whole process group is
+    killed, the ``cleanup`` paths are removed and RenderKilled is raised.
+    """
+    kwargs = {}
+    args = cmd
+    if os.name == "posix":
+        kwargs["start_new_session"] = True  # pdflatex is make's child; kill both
+        if GOVERNOR.memory_mb:
+            args = _limit_memory(cmd, GOVERNOR.memory_mb)
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, **kwargs)
+    try:
+        stdout, stderr = proc.communicate(timeout=GOVERNOR.render_timeout)
+    except subprocess.TimeoutExpired:
+        _kill_group(proc)
+        proc.communicate()
+        for path in cleanup:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        RENDER_KILLED.inc()
+        raise RenderKilled(f"render killed after {GOVERNOR.render_timeout:g}s: {' '.join(cmd)}")
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def init_render_governor(app: Flask) -> None:
+    """Apply the RENDER_* settings from the app config."""
+    GOVERNOR.configure(
+        max_concurrent=app.config.get("RENDER_MAX_CONCURRENT"),
+        max_queue=app.config.get("RENDER_MAX_QUEUE"),
+        queue_timeout=app.config.get("RENDER_QUEUE_TIMEOUT", 10.0),
+        render_timeout=app.config.get("RENDER_TIMEOUT", 60.0),
+        memory_mb=app.config.get("RENDER_MEMORY_MB", 1024),
+    )
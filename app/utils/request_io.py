@@ -0,0 +1,386 @@
+# app/utils/request_io.py
+"""
+Streaming JSONL import/export of requests with their approval steps.
+
+One line per request:
+
+    {"id": 12, "form_code": "ferpa_auth", "requester_email": "s@uh.edu",
+     "requester_name": "Sam", "status": "approved", "form_data": {...},
+     "created_at": "...", "updated_at": "...", "submitted_at": "...",
+     "steps": [{"sequence": 1, "stage": "registrar", "stage_mode": "one",
+                "approver_email": "r@uh.edu", "status": "approved",
+                "comments": null, "signed_pdf_path": null, "actioned_at": "..."}]}
+
+Both directions are chains of generators, so memory stays flat however big
+the file is. Exposed as ``flask export-requests`` / ``flask import-requests``.
+"""
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert
+
+from app.approvals.archive import iter_archived
+from app.models import db, User, Request, FormTemplate, ApprovalStep, ArchivedRequest
+from app.utils.form_schema import CompiledSchema
+
+CHUNK_SIZE = 1000
+REQUEST_STATUSES = ("draft", "pending", "returned", "approved", "rejected")
+STEP_STATUSES = ("pending", "approved", "rejected", "returned", "skipped")
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    return dt.isoformat() if dt else None
+
+
+def _parse_dt(value: Any) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _chunks(it: Iterable, size: int) -> Iterator[list]:
+    it = iter(it)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Throughput:
+    """Counts rows and reports rows/second for a pipeline run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.counts: Dict[str, int] = {}
+
+    def add(self, name: str, n: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        out: Dict[str, Any] = {"elapsed_s": round(elapsed, 3)}
+        for name, n in self.counts.items():
+            out[name] = n
+            out[f"{name}_per_s"] = round(n / elapsed, 1)
+        return out
+
+
+# ----------------- Export -----------------
+
+def iter_request_records(chunk_size: int = CHUNK_SIZE, status: Optional[str] = None,
+                         form_code: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one export record per request, reading in id-ordered chunks: the
+    live requests, then those moved to the archive (see approvals.archive).
+    """
+    emails = dict(db.session.query(User.id, User.email).all())
+    names = dict(db.session.query(User.id, User.name).all())
+    codes = dict(db.session.query(FormTemplate.id, FormTemplate.form_code).all())
+
+    last_id = 0
+    while True:
+        query = Request.query.filter(Request.id > last_id)
+        if status:
+            query = query.filter(Request.status == status)
+        if form_code:
+            query = query.join(FormTemplate).filter(FormTemplate.form_code == form_code)
+        batch = query.order_by(Request.id).limit(chunk_size).all()
+        if not batch:
+            break
+        ids = [r.id for r in batch]
+        steps: Dict[int, List[ApprovalStep]] = {}
+        for s in (ApprovalStep.query.filter(ApprovalStep.request_id.in_(ids))
+                  .order_by(ApprovalStep.request_id, ApprovalStep.sequence, ApprovalStep.id)):
+            steps.setdefault(s.request_id, []).append(s)
+
+        for r in batch:
+            yield {
+                "id": r.id,
+                "form_code": codes.get(r.form_template_id),
+                "requester_email": emails.get(r.requester_id),
+                "requester_name": names.get(r.requester_id),
+                "status": r.status,
+                "form_data": r.form_data_json,
+                "created_at": _iso(r.created_at),
+                "updated_at": _iso(r.updated_at),
+                "submitted_at": _iso(r.submitted_at),
+                "steps": [{
+                    "sequence": s.sequence,
+                    "stage": s.stage,
+                    "stage_mode": s.stage_mode,
+                    "approver_email": emails.get(s.approver_id),
+                    "status": s.status,
+                    "comments": s.comments,
+                    "signed_pdf_path": s.signed_pdf_path,
+                    "actioned_at": _iso(s.actioned_at),
+                } for s in steps.get(r.id, [])],
+            }
+        last_id = batch[-1].id
+
+    where = []
+    if status:
+        where.append(ArchivedRequest.status == status)
+    if form_code:
+        where.append(ArchivedRequest.form_template_id.in_([i for i, c in codes.items() if c == form_code]))
+    for chunk in iter_archived(chunk_size, where):
+        for r in chunk:
+            # the payload's dates are already ISO strings
+            yield {
+                "id": r["id"],
+                "form_code": codes.get(r["form_template_id"]),
+                "requester_email": emails.get(r["requester_id"]),
+                "requester_name": names.get(r["requester_id"]),
+                "status": r["status"],
+                "form_data": r["form_data_json"],
+                "created_at": r["created_at"],
+                "updated_at": r["updated_at"],
+                "submitted_at": r["submitted_at"],
+                "steps": [{
+                    "sequence": s["sequence"],
+                    "stage": s["stage"],
+                    "stage_mode": s["stage_mode"],
+                    "approver_email": emails.get(s["approver_id"]),
+                    "status": s["status"],
+                    "comments": s["comments"],
+                    "signed_pdf_path": s["signed_pdf_path"],
+                    "actioned_at": s["actioned_at"],
+                } for s in sorted(r["steps"], key=lambda s: (s["sequence"], s["id"]))],
+            }
+
+
+def export_requests(out, stats: Throughput = None, **filters) -> Throughput:
+    stats = stats or Throughput()
+    for record in iter_request_records(**filters):
+        out.write(json.dumps(record, ensure_ascii=False))
+        out.write("\n")
+        stats.add("requests")
+        stats.add("steps", len(record["steps"]))
+    return stats
+
+
+# ----------------- Import -----------------
+
+def _check_records(lines: List[str], schemas: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Parse and validate a chunk of JSONL lines. Pure function of its inputs so
+    it can run in a worker process. Returns one dict per line with either
+    "record" or "error".
+    """
+    compiled = {code: CompiledSchema(fields) for code, fields in schemas.items()}
+    parsed: List[Dict[str, Any]] = []
+    for line in lines:
+        try:
+            rec = json.loads(line)
+        except ValueError as e:
+            parsed.append({"error": f"invalid JSON: {e}"})
+            continue
+        if not isinstance(rec, dict):
+            parsed.append({"error": "not an object"})
+        elif rec.get("form_code") not in compiled:
+            parsed.append({"error": f"unknown form_code {rec.get('form_code')!r}"})
+        elif rec.get("status", "draft") not in REQUEST_STATUSES:
+            parsed.append({"error": f"bad status {rec.get('status')!r}"})
+        elif not rec.get("requester_email"):
+            parsed.append({"error": "requester_email required"})
+        elif any((s.get("status") or "pending") not in STEP_STATUSES or not s.get("approver_email")
+                 for s in rec.get("steps") or []):
+            parsed.append({"error": "every step needs approver_email and a valid status"})
+        else:
+            parsed.append({"record": rec})
+
+    # validate form data column-wise, one batch per form
+    by_form: Dict[str, List[int]] = {}
+    for i, p in enumerate(parsed):
+        if "record" in p:
+            by_form.setdefault(p["record"]["form_code"], []).append(i)
+    for code, idxs in by_form.items():
+        results = compiled[code].validate_many(parsed[i]["record"].get("form_data") or {} for i in idxs)
+        for i, (clean, errors) in zip(idxs, results):
+            if errors:
+                parsed[i] = {"error": "; ".join(f"{k}: {v}" for k, v in errors.items())}
+            else:
+                parsed[i]["record"]["form_data"] = clean
+    return parsed
+
+
+def _checked_chunks(chunks: Iterator[List[Tuple[int, str]]], schemas,
+                    workers: int) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    """
+    Run _check_records over chunks of (line number, line), in worker
+    processes if asked, keeping order; yields (line number, result) pairs.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield list(zip((n for n, _ in chunk), _check_records([l for _, l in chunk], schemas)))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = []
+        for chunk in chunks:
+            in_flight.append(([n for n, _ in chunk], pool.submit(_check_records, [l for _, l in chunk], schemas)))
+            # bounded window keeps memory constant
+            if len(in_flight) >= workers * 2:
+                numbers, fut = in_flight.pop(0)
+                yield list(zip(numbers, fut.result()))
+        for numbers, fut in in_flight:
+            yield list(zip(numbers, fut.result()))
+
+
+class _UserResolver:
+    """email -> user id, created on demand when allowed; cached for the run."""
+
+    def __init__(self, create: bool):
+        self.create = create
+        self.ids: Dict[str, int] = {}
+
+    def prefetch(self, emails: Iterable[str]) -> None:
+        missing = {e.lower() for e in emails if e and e.lower() not in self.ids}
+        if not missing:
+            return
+        for uid, email in (db.session.query(User.id, User.email)
+                           .filter(func.lower(User.email).in_(list(missing)))):
+            self.ids[email.lower()] = uid
+
+    def get(self, email: str, name: Optional[str] = None) -> Optional[int]:
+        key = (email or "").lower()
+        if key in self.ids:
+            return self.ids[key]
+        if not self.create:
+            return None
+        uid = db.session.execute(
+            insert(User.__table__).values(name=name or email.split("@")[0], email=email,
+                                          role="basicuser", status="active",
+                                          created_at=datetime.utcnow())
+        ).inserted_primary_key[0]
+        self.ids[key] = uid
+        return uid
+
+
+def import_requests(lines: Iterable[str], chunk_size: int = CHUNK_SIZE, workers: int = 1,
+                    create_users: bool = False, stats: Throughput = None,
+                    errors_out=None) -> Throughput:
+    """
+    Load JSONL requests (with steps) in chunked transactions using
+    executemany inserts. Bad lines are skipped and, if ``errors_out`` is
+    given, written there as {"line": n, "error": ...}.
+    """
+    stats = stats or Throughput()
+    schemas = {t.form_code: t.fields_json for t in FormTemplate.query.all()}
+    template_ids = {t.form_code: t.id for t in FormTemplate.query.all()}
+    users = _UserResolver(create_users)
+    req_table = Request.__table__
+    step_table = ApprovalStep.__table__
+
+    # numbered before blank lines are dropped, so error reports point at the file's own lines
+    non_blank = ((n, l) for n, l in enumerate(lines, 1) if l.strip())
+    for checked in _checked_chunks(_chunks(non_blank, chunk_size), schemas, workers):
+        good = []
+        for line_no, p in checked:
+            if "error" in p:
+                stats.add("rejected")
+                if errors_out is not None:
+                    errors_out.write(json.dumps({"line": line_no, "error": p["error"]}) + "\n")
+            else:
+                good.append((line_no, p["record"]))
+
+        users.prefetch(e for _, rec in good
+                       for e in [rec["requester_email"]] + [s["approver_email"] for s in rec.get("steps") or []])
+
+        req_rows, step_lists = [], []
+        for n, rec in good:
+            requester_id = users.get(rec["requester_email"], rec.get("requester_name"))
+            step_rows = []
+            for s in rec.get("steps") or []:
+                approver_id = users.get(s["approver_email"])
+                if approver_id is None:
+                    break
+                step_rows.append({
+                    "approver_id": approver_id,
+                    "sequence": s.get("sequence") or 1,
+                    "stage": s.get("stage"),
+                    "stage_mode": s.get("stage_mode") or "all",
+                    "status": s.get("status") or "pending",
+                    "comments": s.get("comments"),
+                    "signed_pdf_path": s.get("signed_pdf_path"),
+                    "actioned_at": _parse_dt(s.get("actioned_at")),
+                    "version": 1,
+                })
+            else:
+                if requester_id is not None:
+                    now = datetime.utcnow()
+                    req_rows.append({
+                        "form_template_id": template_ids[rec["form_code"]],
+                        "requester_id": requester_id,
+                        "status": rec.get("status") or "draft",
+                        "form_data_json": rec.get("form_data") or {},
+                        "created_at": _parse_dt(rec.get("created_at")) or now,
+                        "updated_at": _parse_dt(rec.get("updated_at")) or now,
+                        "submitted_at": _parse_dt(rec.get("submitted_at")),
+                        "version": 1,
+                    })
+                    step_lists.append(step_rows)
+                    continue
+            stats.add("rejected")
+            if errors_out is not None:
+                errors_out.write(json.dumps({"line": n, "error": "unknown user (use --create-users)"}) + "\n")
+
+        if req_rows:
+            new_ids = db.session.execute(
+                insert(req_table).returning(req_table.c.id, sort_by_parameter_order=True),
+                req_rows,
+            ).scalars().all()
+            step_rows = [dict(row, request_id=rid) for rid, rows in zip(new_ids, step_lists) for row in rows]
+            if step_rows:
+                db.session.execute(insert(step_table), step_rows)
+            stats.add("requests", len(req_rows))
+            stats.add("steps", len(step_rows))
+        db.session.commit()
+
+    return stats
+
+
+def rebuild_derived_tables() -> None:
+    """Core inserts skip the ORM hooks; bring the work queue, load counters, history and rollups back in line."""
+    from app.approvals.work_queue import rebuild_work_queue
+    from app.approvals.assignment import rebuild_load_counters
+    from app.approvals.history import backfill_events
+    from app.approvals.analytics import rebuild_rollups
+    rebuild_work_queue()
+    rebuild_load_counters()
+    backfill_events()
+    rebuild_rollups()
+
+
+# ----------------- CLI -----------------
+
+@click.command("export-requests")
+@click.argument("output", type=click.File("w", encoding="utf-8"), default="-")
+@click.option("--status", type=click.Choice(REQUEST_STATUSES), default=None)
+@click.option("--form-code", default=None)
+@click.option("--chunk-size", type=int, default=CHUNK_SIZE, show_default=True)
+@with_appcontext
+def export_requests_command(output, status, form_code, chunk_size):
+    """Write requests and their steps to OUTPUT as JSON lines."""
+    stats = export_requests(output, chunk_size=chunk_size, status=status, form_code=form_code)
+    click.echo(json.dumps(stats.report()), err=True)
+
+
+@click.command("import-requests")
+@click.argument("source", type=click.File("r", encoding="utf-8"), default="-")
+@click.option("--chunk-size", type=int, default=CHUNK_SIZE, show_default=True)
+@click.option("--workers", type=int, default=1, show_default=True,
+              help="Processes used to parse and validate lines.")
+@click.option("--create-users", is_flag=True, help="Create users for unknown emails.")
+@click.option("--errors", "errors_out", type=click.File("w", encoding="utf-8"), default=None,
+              help="Write rejected lines' errors here as JSON lines.")
+@with_appcontext
+def import_requests_command(source, chunk_size, workers, create_users, errors_out):
+    """Load requests and their steps from SOURCE (JSON lines)."""
+    stats = import_requests(source, chunk_size=chunk_size, workers=workers,
+                            create_users=create_users, errors_out=errors_out)
+    rebuild_derived_tables()
+    click.echo(json.dumps(stats.report()), err=True)
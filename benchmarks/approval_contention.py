@@ -0,0 +1,127 @@
+"""
+Concurrency harness for approval actions.
+
+Seeds a throwaway SQLite database with pending requests, then lets several
+approver threads race to approve the same requests through Flask's test
+client. The PDF render is replaced with a sleep of --render-ms so the run
+measures contention rather than pdflatex, and reports how many renders were
+wasted on approvals that lost the race.
+
+    python -m benchmarks.approval_contention --approvers 8 --requests 40
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from app import create_app
+from app.models import db, User, Signature, Request, FormTemplate, ApprovalStep
+from app.approvals import routes as approval_routes
+from app.approvals.locking import CONTENTION_STATS
+
+
+def _make_app(db_path):
+    return create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "SQLALCHEMY_ENGINE_OPTIONS": {"connect_args": {"timeout": 30, "check_same_thread": False}},
+        "TESTING": True,
+        "SECRET_KEY": "bench",
+    })
+
+
+def _seed(app, approvers, requests):
+    with app.app_context():
+        student = User(name="Student", email="student@bench.local", role="basicuser")
+        db.session.add(student)
+        users = [User(name=f"Approver {i}", email=f"approver{i}@bench.local", role="approver")
+                 for i in range(approvers)]
+        db.session.add_all(users)
+        db.session.flush()
+        for u in users + [student]:
+            db.session.add(Signature(user_id=u.id, image_path=f"uploads/signatures/{u.id}.png"))
+        form = FormTemplate.query.first()
+        ids = []
+        for _ in range(requests):
+            req = Request(form_template_id=form.id, requester_id=student.id, status="pending",
+                          form_data_json={"student_name": "Student"}, submitted_at=datetime.utcnow())
+            req.approval_steps.append(ApprovalStep(approver_id=users[0].id, sequence=1, status="pending"))
+            db.session.add(req)
+            db.session.flush()
+            approval_routes.sync_work_queue(req)
+            ids.append(req.id)
+        db.session.commit()
+        return [u.email for u in users], ids
+
+
+def run(approvers=8, requests=40, render_ms=100, seed=0):
+    tmp = tempfile.mkdtemp(prefix="contention-")
+    app = _make_app(os.path.join(tmp, "bench.db"))
+    emails, request_ids = _seed(app, approvers, requests)
+
+    renders = {"count": 0}
+    lock = threading.Lock()
+    real_render = approval_routes.sign_request_pdf
+
+    def fake_render(req, step, approvals, student_signature):
+        with lock:
+            renders["count"] += 1
+        time.sleep(render_ms / 1000.0)
+        return f"generated_pdfs/bench_{req.id}.pdf"
+
+    for k in CONTENTION_STATS:
+        CONTENTION_STATS[k] = 0
+
+    def worker(email, rnd):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s["user"] = {"preferred_username": email, "name": email}
+        order = list(request_ids)
+        rnd.shuffle(order)
+        for rid in order:
+            client.post(f"/approvals/approver/requests/{rid}/approve", data={"comments": "bench"})
+
+    approval_routes.sign_request_pdf = fake_render
+    try:
+        threads = [threading.Thread(target=worker, args=(e, random.Random(seed + i)))
+                   for i, e in enumerate(emails)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        approval_routes.sign_request_pdf = real_render
+
+    with app.app_context():
+        approved = ApprovalStep.query.filter_by(status="approved").count()
+
+    return {
+        "approvers": approvers,
+        "requests": requests,
+        "render_ms": render_ms,
+        "elapsed_s": round(elapsed, 3),
+        "approved_steps": approved,
+        "renders": renders["count"],
+        "wasted_renders": renders["count"] - approved,
+        **CONTENTION_STATS,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--approvers", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--render-ms", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    result = run(args.approvers, args.requests, args.render_ms, args.seed)
+    for k, v in result.items():
+        print(f"{k:>18}: {v}")
+
+
+if __name__ == "__main__":
+    main()
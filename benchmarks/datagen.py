@@ -0,0 +1,182 @@
+"""
+Synthetic data for benchmarks.
+
+Fills a database with users, signatures, requests and approval steps at a
+named scale (number of requests), using chunked executemany inserts so even
+the 1M scale loads in minutes rather than hours:
+
+    10k  -> 10,000 requests,   ~1,000 students,  50 approvers
+    100k -> 100,000 requests,  ~10,000 students, 50 approvers
+    1M   -> 1,000,000 requests, ~100,000 students, 50 approvers
+
+About 70% of requests are pending with one open step, the rest approved.
+
+    python -m benchmarks.datagen --scale 100k --db /tmp/bench.db
+"""
+import argparse
+import os
+import random
+import struct
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app import create_app
+from app.models import db, User, Signature, Request, FormTemplate, ApprovalStep
+from app.approvals.work_queue import rebuild_work_queue
+from app.approvals.assignment import rebuild_load_counters
+from app.approvals.history import backfill_events
+from app.approvals.analytics import rebuild_rollups
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+APPROVERS = 50
+CHUNK = 5000
+
+FERPA_DATA = {
+    "student_name": "Jordan Smith", "peoplesoft_id": "1234567", "date": "2024-09-03",
+    "campus": ["Main"], "authorized_offices": ["Registrar", "Financial Aid"],
+    "info_types": ["Grades/Transcripts", "Billing/Financial Aid"], "release_to": "Parent & Guardian",
+    "purpose_of_disclosure": ["Family"], "phone_password": "blue_sky#42",
+}
+PETITION_DATA = {
+    "student_name": "Jordan Smith", "student_id": "1234567", "phone_number": "713-555-0100",
+    "mailing_address": "4800 Calhoun Rd", "city": "Houston", "state": "TX", "zip": "77004",
+    "email": "jordan@uh.edu", "petition_reason_number": "5. Major Change (From → To)",
+    "from_value": "Biology", "to_value": "Computer Science", "additional_details": "Spring 2025 start",
+    "explanation_of_request": "Moving to CS after taking COSC 1336 & 1437 (100% interest).",
+    "date": "2024-09-03",
+}
+
+
+def signature_png(path):
+    """Write a tiny valid PNG so renders have a real image to include."""
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    raw = b"".join(b"\x00" + b"\x00\xff" * 8 for _ in range(4))  # 8x4 grayscale+alpha
+    png = (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 8, 4, 8, 4, 0, 0, 0))
+           + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+    with open(path, "wb") as f:
+        f.write(png)
+    return path
+
+
+def body_pdf(path):
+    """Write a one-page PDF with a classic xref table, like the body pdflatex renders."""
+    content = b"BT /F1 12 Tf 72 720 Td (Request body) Tj ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (num, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
+
+
+def _insert(table, rows):
+    for i in range(0, len(rows), CHUNK):
+        db.session.execute(insert(table), rows[i:i + CHUNK])
+
+
+def generate(scale="10k", seed=0, sig_dir=None):
+    """Populate the current app's database. Returns a summary of what was created."""
+    n_requests = SCALES[scale]
+    n_students = max(n_requests // 10, 1)
+    rnd = random.Random(seed)
+    sig_path = signature_png(os.path.join(sig_dir or tempfile.mkdtemp(prefix="sigs-"), "signature.png"))
+    now = datetime.utcnow()
+
+    users = [{"name": f"Approver {i}", "email": f"approver{i}@bench.local",
+              "role": "admin" if i % 5 == 0 else "approver", "status": "active", "created_at": now}
+             for i in range(APPROVERS)]
+    users += [{"name": f"Student {i}", "email": f"student{i}@bench.local",
+               "role": "basicuser", "status": "active", "created_at": now}
+              for i in range(n_students)]
+    _insert(User.__table__, users)
+    ids = dict(db.session.query(User.email, User.id))
+    approver_ids = [ids[f"approver{i}@bench.local"] for i in range(APPROVERS)]
+    student_ids = [ids[f"student{i}@bench.local"] for i in range(n_students)]
+    _insert(Signature.__table__, [{"user_id": uid, "image_path": sig_path, "uploaded_at": now}
+                                  for uid in approver_ids + student_ids])
+
+    forms = {f.form_code: f.id for f in FormTemplate.query.all()}
+    created = 0
+    while created < n_requests:
+        batch = min(CHUNK, n_requests - created)
+        req_rows, step_rows = [], []
+        for _ in range(batch):
+            code = "ferpa_auth" if rnd.random() < 0.5 else "general_petition"
+            submitted = now - timedelta(minutes=rnd.randrange(60 * 24 * 120))
+            req_rows.append({
+                "form_template_id": forms[code], "requester_id": rnd.choice(student_ids),
+                "status": "pending" if rnd.random() < 0.7 else "approved",
+                "form_data_json": FERPA_DATA if code == "ferpa_auth" else PETITION_DATA,
+                "created_at": submitted, "updated_at": submitted, "submitted_at": submitted, "version": 1,
+            })
+        new_ids = db.session.execute(
+            insert(Request.__table__).returning(Request.__table__.c.id, sort_by_parameter_order=True),
+            req_rows,
+        ).scalars().all()
+        for rid, row in zip(new_ids, req_rows):
+            done = row["status"] == "approved"
+            step_rows.append({
+                "request_id": rid, "approver_id": rnd.choice(approver_ids), "sequence": 1,
+                "stage": "approver", "stage_mode": "one", "status": "approved" if done else "pending",
+                "actioned_at": row["submitted_at"] + timedelta(hours=rnd.randrange(1, 72)) if done else None,
+                "version": 1,
+            })
+        _insert(ApprovalStep.__table__, step_rows)
+        db.session.commit()
+        created += batch
+
+    rebuild_work_queue()
+    rebuild_load_counters()
+    backfill_events()
+    rebuild_rollups()
+    return {"scale": scale, "requests": n_requests, "students": n_students,
+            "approvers": APPROVERS, "signature": sig_path}
+
+
+def bench_app(db_path=None):
+    """A throwaway app on its own SQLite file, as the other benchmarks use."""
+    db_path = db_path or os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    return create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "TESTING": True,
+        "SECRET_KEY": "bench",
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", choices=list(SCALES), default="10k")
+    parser.add_argument("--db", default=None, help="SQLite file to fill (default: a temp file)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    app = bench_app(args.db)
+    started = time.perf_counter()
+    with app.app_context():
+        summary = generate(args.scale, args.seed)
+    summary["elapsed_s"] = round(time.perf_counter() - started, 1)
+    summary["database"] = app.config["SQLALCHEMY_DATABASE_URI"]
+    for k, v in summary.items():
+        print(f"{k:>12}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+LaTeX escaping benchmark.
+
+Compares app.utils.latex against the character-by-character escaper it
+replaced, on --size byte inputs of different shapes (plain ASCII prose,
+prose with typographic Unicode, text dense with TeX specials), plus list
+rendering.
+
+    python -m benchmarks.latex_escape --size 100000
+"""
+import argparse
+import random
+import time
+
+from app.utils import latex
+
+
+def legacy_latex_escape(s):
+    # the previous app.utils.pdf_generator._latex_escape, kept for comparison
+    replacements = {
+        "\\": r"\textbackslash{}", "{": r"\{", "}": r"\}", "#": r"\#", "$": r"\$",
+        "%": r"\%", "&": r"\&", "_": r"\_", "~": r"\textasciitilde{}", "^": r"\textasciicircum{}",
+    }
+    out = []
+    for ch in s:
+        out.append(replacements.get(ch, ch))
+    return "".join(out)
+
+
+def legacy_render_list_items(items):
+    if not items:
+        return "None selected"
+    lines = ["\\begin{itemize}"]
+    for item in items:
+        lines.append(f"  \\item {legacy_latex_escape(str(item))}")
+    lines.append("\\end{itemize}")
+    return "\n".join(lines)
+
+
+PROSE = ("I am requesting a change of major from Biology to Computer Science (COSC) after taking "
+         "COSC 1336 & 1437, where I earned 95% in both. My advisor agreed it is a good fit; see item #2.\n")
+
+
+def inputs(size, seed=0):
+    rnd = random.Random(seed)
+    unicode_prose = PROSE.replace("after", "– after").replace("a good fit", "“a good fit”")
+    return {
+        "ascii_prose": (PROSE * (size // len(PROSE) + 1))[:size],
+        "unicode_prose": (unicode_prose * (size // len(unicode_prose) + 1))[:size],
+        "dense_specials": "".join(rnd.choice("abcdefgh ij\\{}#$%&_~^") for _ in range(size)),
+    }
+
+
+def _time(fn, arg, number):
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn(arg)
+        best = min(best, (time.perf_counter() - started) / number)
+    return best * 1000
+
+
+def run(size=100_000, number=20):
+    rows = []
+    for name, text in inputs(size).items():
+        old = _time(legacy_latex_escape, text, number)
+        new = _time(latex.escape_inline, text, number)
+        rows.append((f"escape {name}", old, new))
+    items = [f"Office {i} & Co. (100%)" for i in range(2000)]
+    rows.append(("render_list 2000 items", _time(legacy_render_list_items, items, number),
+                 _time(latex.render_list, items, number)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'case':<28} {'legacy ms':>10} {'new ms':>10} {'speedup':>8}")
+    for name, old, new in run(args.size, args.number):
+        print(f"{name:<28} {old:>10.3f} {new:>10.3f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Simulated dashboard fleet for the live event stream.
+
+Starts the stream listener on a throwaway app and opens --clients idle
+EventSource-style connections from --procs separate processes (one
+asyncio loop each, so the fleet's parsing does not compete with the
+server), then publishes --events queue events at --rate per second and measures
+how long each took to reach every client. Also reports the server's
+thread count before and after the fleet connected (it should not grow
+with the fleet) and the server process's memory per connection.
+
+    python -m benchmarks.live_stream --clients 2000 --events 200 --rate 20 --procs 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from app import create_app
+from app.models import db, User
+from app.approvals.live import BUS, LIVE, LIVE_STATS, STREAM_PATH
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _raise_fd_limit(needed):
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+
+async def _client(port, cookie, state):
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=1 << 16)
+    except OSError:
+        state["failed"] += 1
+        return
+    writer.write((f"GET {STREAM_PATH} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+                  f"Accept: text/event-stream\r\nCookie: session={cookie}\r\n\r\n").encode())
+    await writer.drain()
+    if b" 200 " not in await reader.readline():
+        state["failed"] += 1
+        writer.close()
+        return
+    await reader.readuntil(b"retry: 3000\n\n")
+    state["connected"] += 1
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b"data: "):
+                sent = json.loads(line[6:]).get("sent")
+                if sent is None:
+                    break  # end of run
+                state["latencies"].append(time.time() - sent)
+    finally:
+        writer.close()
+
+
+def _fleet(port, cookie, clients, ready, results):
+    """Child process: connect the fleet, report when it is up, then the latencies at the end."""
+    _raise_fd_limit(clients + 256)
+    state = {"connected": 0, "failed": 0, "latencies": []}
+
+    async def main():
+        tasks = [asyncio.ensure_future(_client(port, cookie, state)) for _ in range(clients)]
+        while state["connected"] + state["failed"] < clients:
+            await asyncio.sleep(0.05)
+        ready.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(main())
+    results.put(state)
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)
+
+
+def run(clients=1000, events=100, rate=20.0, procs=4):
+    tmp = tempfile.mkdtemp(prefix="live-")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        "TESTING": True,
+        "SECRET_KEY": "bench",
+        "LIVE_STREAM_PORT": 0,
+        "LIVE_STREAM_HOST": "127.0.0.1",
+        "LIVE_MAX_CLIENTS": clients + 10,
+    })
+    with app.app_context():
+        approver = User(name="Approver", email="approver@bench.local", role="approver")
+        db.session.add(approver)
+        db.session.commit()
+        approver_id = approver.id
+    cookie = app.session_interface.get_signing_serializer(app).dumps(
+        {"user": {"preferred_username": "approver@bench.local", "name": "Approver"}})
+    _raise_fd_limit(clients + 256)
+
+    port = LIVE.ensure_started()
+    threads_before = threading.active_count()
+    rss_before = _rss_kb()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    shares = [clients // procs + (i < clients % procs) for i in range(procs)]
+    fleet = []
+    for n in shares:
+        if n:
+            ready = ctx.Event()
+            fleet.append((ready, ctx.Process(target=_fleet, args=(port, cookie, n, ready, results), daemon=True)))
+    started = time.perf_counter()
+    for _, proc in fleet:
+        proc.start()
+    for ready, _ in fleet:
+        ready.wait(timeout=120)
+    connect_s = time.perf_counter() - started
+    threads_after = threading.active_count()
+    rss_after = _rss_kb()
+
+    for k in LIVE_STATS:
+        LIVE_STATS[k] = 0
+    for i in range(events):
+        BUS.publish("pending", {"request_id": i, "step_id": i, "approver_id": approver_id, "student_name": "Student",
+                                "form_name": "Bench", "step_number": 1, "updated_at": "",
+                                "sent": time.time()})
+        time.sleep(1.0 / rate)
+    BUS.publish("removed", {"request_id": -1, "step_id": -1, "approver_id": approver_id})  # tells the fleet to hang up
+    states = [results.get(timeout=120) for _ in fleet]
+    for _, proc in fleet:
+        proc.join(timeout=10)
+    connected = sum(st["connected"] for st in states)
+    expected = events * connected
+
+    lat = [x for st in states for x in st["latencies"]]
+    return {
+        "clients": clients,
+        "connected": connected,
+        "failed": sum(st["failed"] for st in states),
+        "connect_s": round(connect_s, 3),
+        "server_threads_before": threads_before,
+        "server_threads_after": threads_after,
+        "rss_kb_per_client": round((rss_after - rss_before) / max(connected, 1), 1),
+        "events": events,
+        "deliveries": f"{len(lat)}/{expected}",
+        "latency_p50_ms": _pct(lat, 0.5),
+        "latency_p99_ms": _pct(lat, 0.99),
+        "latency_max_ms": round(max(lat) * 1000, 2) if lat else None,
+        "latency_mean_ms": round(statistics.mean(lat) * 1000, 2) if lat else None,
+        **LIVE_STATS,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=20.0, help="events published per second")
+    parser.add_argument("--procs", type=int, default=4, help="processes the fleet is spread over")
+    args = parser.parse_args()
+    result = run(args.clients, args.events, args.rate, args.procs)
+    for k, v in result.items():
+        print(f"{k:>22}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+PDF backend benchmark: LaTeX vs the in-process Python renderer.
+
+Renders both shipped forms with each backend and reports per-render latency
+(median / p95 over --number renders in one process) and throughput per core
+(--workers processes rendering flat out for --seconds, renders per second
+divided by workers). The LaTeX rows are skipped when pdflatex isn't
+installed.
+
+    python -m benchmarks.pdf_backends --number 20 --workers 2 --seconds 5
+"""
+import argparse
+import glob
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.utils.pdf_generator import REPO_ROOT, generate_request_pdf
+from benchmarks.datagen import FERPA_DATA, PETITION_DATA, signature_png
+
+FORMS = {"ferpa_auth": FERPA_DATA, "general_petition": PETITION_DATA}
+BACKENDS = ("latex", "python")
+
+
+def _request(form_code):
+    return SimpleNamespace(
+        id=0,
+        form_template=SimpleNamespace(form_code=form_code, fields_json=None, name=None),
+        form_data_json=FORMS[form_code],
+        requester=SimpleNamespace(name="Jordan Smith"),
+        submitted_at=datetime(2024, 9, 3, 10, 0),
+    )
+
+
+def _render(form_code, backend, sigs, base_name):
+    return generate_request_pdf(_request(form_code), sigs, base_name=base_name, renderer=backend)
+
+
+def _latency(form_code, backend, sigs, number):
+    times = []
+    for _ in range(number):
+        started = time.perf_counter()
+        _render(form_code, backend, sigs, f"bench_{backend}_{form_code}")
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    return statistics.median(times), times[min(len(times) - 1, int(len(times) * 0.95))]
+
+
+def _worker(form_code, backend, sigs, seconds, slot):
+    """Render until ``seconds`` are up; returns the number of renders."""
+    count, deadline = 0, time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        _render(form_code, backend, sigs, f"bench_{backend}_{form_code}_w{slot}")
+        count += 1
+    return count
+
+
+def _throughput(form_code, backend, sigs, workers, seconds):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        counts = list(pool.map(_worker, [form_code] * workers, [backend] * workers, [sigs] * workers,
+                               [seconds] * workers, range(workers)))
+    return sum(counts) / seconds / workers
+
+
+def run(number=20, workers=2, seconds=5.0):
+    tmp = tempfile.mkdtemp(prefix="pdf-backends-")
+    sig = signature_png(os.path.join(tmp, "signature.png"))
+    sigs = [sig, sig]
+    rows = []
+    try:
+        for form_code in FORMS:
+            for backend in BACKENDS:
+                if backend == "latex" and not shutil.which("pdflatex"):
+                    rows.append((form_code, backend, None, None, None))
+                    continue
+                _render(form_code, backend, sigs, f"bench_{backend}_{form_code}")  # warm caches
+                median, p95 = _latency(form_code, backend, sigs, number)
+                rate = _throughput(form_code, backend, sigs, workers, seconds)
+                rows.append((form_code, backend, median, p95, rate))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+        for path in glob.glob(os.path.join(REPO_ROOT, "generated_pdfs", "bench_*")):
+            os.remove(path)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20, help="renders per latency measurement")
+    parser.add_argument("--workers", type=int, default=2, help="processes for the throughput run")
+    parser.add_argument("--seconds", type=float, default=5.0, help="length of the throughput run")
+    args = parser.parse_args()
+    print(f"{'form':<18} {'backend':<8} {'median ms':>10} {'p95 ms':>10} {'renders/s/core':>15}")
+    for form_code, backend, median, p95, rate in run(args.number, args.workers, args.seconds):
+        if median is None:
+            print(f"{form_code:<18} {backend:<8} {'skipped: pdflatex not installed':>37}")
+            continue
+        print(f"{form_code:<18} {backend:<8} {median:>10.2f} {p95:>10.2f} {rate:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
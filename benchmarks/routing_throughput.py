@@ -0,0 +1,75 @@
+"""
+Routing engine throughput benchmark.
+
+Creates --submissions pending requests against a throwaway SQLite database
+and routes each one through build_steps + the work-queue sync, exactly as a
+form submission does, then reports submissions per minute. By default every
+submission is its own transaction (as in the routes); --batch N commits every
+N submissions, as a bulk import would.
+
+    python -m benchmarks.routing_throughput --submissions 10000 --approvers 50
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from app import create_app
+from app.models import db, User, Request, FormTemplate
+from app.approvals.routing import build_steps
+from app.approvals.work_queue import sync_request
+
+
+def run(submissions=10000, approvers=50, form_code="general_petition", batch=1):
+    tmp = tempfile.mkdtemp(prefix="routing-")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        "TESTING": True,
+    })
+    with app.app_context():
+        student = User(name="Student", email="student@bench.local", role="basicuser")
+        db.session.add(student)
+        db.session.add_all([User(name=f"Approver {i}", email=f"approver{i}@bench.local",
+                                 role="admin" if i % 5 == 0 else "approver")
+                            for i in range(approvers)])
+        db.session.commit()
+        form = FormTemplate.query.filter_by(form_code=form_code).first()
+
+        steps = 0
+        started = time.perf_counter()
+        for i in range(1, submissions + 1):
+            req = Request(form_template=form, requester=student, status="pending",
+                          form_data_json={"student_name": "Student"}, submitted_at=datetime.utcnow())
+            db.session.add(req)
+            steps += len(build_steps(req))
+            sync_request(req)
+            if i % batch == 0:
+                db.session.commit()
+        db.session.commit()
+        elapsed = time.perf_counter() - started
+
+    return {
+        "form_code": form_code,
+        "submissions": submissions,
+        "approvers": approvers,
+        "batch": batch,
+        "steps_created": steps,
+        "elapsed_s": round(elapsed, 3),
+        "submissions_per_min": round(submissions / elapsed * 60),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--submissions", type=int, default=10000)
+    parser.add_argument("--approvers", type=int, default=50)
+    parser.add_argument("--form-code", default="general_petition")
+    parser.add_argument("--batch", type=int, default=1)
+    args = parser.parse_args()
+    for k, v in run(args.submissions, args.approvers, args.form_code, args.batch).items():
+        print(f"{k:>20}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Render pipeline benchmark suite with a regression gate.
+
+Runs micro-benchmarks (LaTeX escaping, replacement builders, template
+filling, approval stamping), macro-benchmarks (dashboard, detail, my-requests and approve routes
+through Flask's test client, on synthetic data from benchmarks.datagen) and
+end-to-end render latency (the LaTeX backend only when pdflatex is installed). Results are written as
+JSON; given a baseline, timings that got slower than --tolerance (fastest
+run by default, see --metric) are flagged and the run exits non-zero.
+
+    python -m benchmarks.suite --scale 10k --output bench.json
+    python -m benchmarks.suite --scale 10k --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.models import db, User, Request, FormTemplate
+from app.approvals import routes as approval_routes
+from app.utils import latex, pdf_generator
+from app.utils.pdf_replacements import get_builder, template_placeholders
+from app.utils.pdf_stamp import ApprovalEntry, append_approval_page
+from benchmarks.datagen import bench_app, body_pdf, generate, FERPA_DATA, PETITION_DATA
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def measure(fn, repeat=7, number=1):
+    """Call fn ``number`` times per run, ``repeat`` runs; per-call timings in ms."""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - started) * 1000 / number)
+    runs.sort()
+    return {
+        "median_ms": round(statistics.median(runs), 4),
+        "p95_ms": round(runs[min(len(runs) - 1, int(len(runs) * 0.95))], 4),
+        "min_ms": round(runs[0], 4),
+        "runs": repeat,
+        "calls_per_run": number,
+    }
+
+
+# ----------------- Micro -----------------
+
+def micro(sig_path):
+    text = ("Jordan O'Neil & Co. paid $1,200 (100%) for course #COSC_1336 {lab} ~ ^ \\ " * 20)
+    latex_dir = os.path.join(REPO_ROOT, "latex_templates")
+    sigs = [sig_path, sig_path]
+    builders, templates, placeholders = {}, {}, {}
+    for code in ("ferpa_auth", "general_petition"):
+        builders[code] = get_builder(SimpleNamespace(form_code=code, fields_json=None))
+        with open(os.path.join(latex_dir, f"{code}_template.tex"), encoding="utf-8") as f:
+            templates[code] = f.read()
+        placeholders[code] = template_placeholders(templates[code])
+
+    def build(code, data):
+        return lambda: builders[code](data, "Jordan Smith", "2024-09-03 10:00", sigs, latex_dir,
+                                      placeholders=placeholders[code])
+
+    ferpa = build("ferpa_auth", FERPA_DATA)()
+    petition = build("general_petition", PETITION_DATA)()
+
+    # an approval stamps the latest signed copy instead of re-running pdflatex
+    stamp_dir = os.path.dirname(sig_path)
+    src = body_pdf(os.path.join(stamp_dir, "body.pdf"))
+    entries = [ApprovalEntry(i, f"Step {i}", "Jordan Smith", "2024-09-03 10:00", "Looks good.", sig_path)
+               for i in (1, 2, 3)]
+    return {
+        "micro.latex_escape_1k_chars": measure(lambda: latex.escape_inline(text[:1000]), number=500),
+        "micro.build_ferpa_replacements": measure(build("ferpa_auth", FERPA_DATA), number=500),
+        "micro.build_petition_replacements": measure(build("general_petition", PETITION_DATA), number=500),
+        "micro.fill_ferpa_template": measure(lambda: pdf_generator._fill_template(templates["ferpa_auth"], ferpa),
+                                             number=500),
+        "micro.fill_petition_template": measure(
+            lambda: pdf_generator._fill_template(templates["general_petition"], petition), number=500),
+        "micro.stamp_approval": measure(
+            lambda: append_approval_page(src, os.path.join(stamp_dir, "signed.pdf"), entries), number=50),
+    }
+
+
+# ----------------- Macro (routes) -----------------
+
+def _client(app, email):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["user"] = {"preferred_username": email, "name": email}
+    return client
+
+
+def _get(client, url):
+    def call():
+        resp = client.get(url)
+        assert resp.status_code == 200, f"{url} -> {resp.status_code}"
+    return call
+
+
+def macro(app, repeat, seed=0):
+    rnd = random.Random(seed)
+    with app.app_context():
+        pending = [rid for (rid,) in db.session.query(Request.id).filter_by(status="pending").order_by(Request.id)]
+        busiest = (db.session.query(Request.requester_id, db.func.count())
+                   .group_by(Request.requester_id).order_by(db.func.count().desc()).first()[0])
+        student = db.session.get(User, busiest).email
+
+    approver = _client(app, "approver0@bench.local")
+    requester = _client(app, student)
+    detail_ids = rnd.sample(pending, min(len(pending), 50))
+    it = iter(detail_ids * (repeat + 1))
+
+    def detail_cold():
+        approval_routes.detail_cache.clear()
+        _get(approver, f"/approvals/approver/requests/{next(it)}")()
+
+    results = {
+        "route.dashboard": measure(_get(approver, "/approvals/approver/dashboard"), repeat),
+        "route.dashboard_mine": measure(_get(approver, "/approvals/approver/dashboard?mine=1"), repeat),
+        "route.dashboard_search": measure(_get(approver, "/approvals/approver/dashboard?q=jordan"), repeat),
+        "route.detail_cold": measure(detail_cold, repeat, number=5),
+        "route.detail_warm": measure(_get(approver, f"/approvals/approver/requests/{detail_ids[0]}"), repeat, 5),
+        "route.my_requests": measure(_get(requester, "/approvals/my_requests"), repeat),
+        # approver0 is an admin; a year of rollups per call
+        "route.analytics_by_form": measure(_get(approver, "/approvals/admin/analytics?by=form"), repeat),
+        "route.analytics_by_week": measure(_get(approver, "/approvals/admin/analytics?by=week"), repeat),
+    }
+
+    # approve consumes a pending request per call; the render itself is timed separately
+    to_approve = iter(pending[-(repeat * 5 + 5):])
+    real_render = approval_routes.sign_request_pdf
+    approval_routes.sign_request_pdf = lambda req, step, approvals, student: f"generated_pdfs/bench_{req.id}.pdf"
+    try:
+        def approve():
+            resp = approver.post(f"/approvals/approver/requests/{next(to_approve)}/approve",
+                                 data={"comments": "bench"})
+            assert resp.status_code == 302, resp.status_code
+        results["route.approve_no_render"] = measure(approve, repeat, number=5)
+    finally:
+        approval_routes.sign_request_pdf = real_render
+    return results
+
+
+# ----------------- End to end -----------------
+
+def end_to_end(app, sig_path, repeat):
+    """
+    Full renders of both shipped forms. The in-process backend always runs;
+    the LaTeX rows keep their original ``render.<form_code>`` names so old
+    baselines still compare, and are skipped without pdflatex.
+    """
+    latex = shutil.which("pdflatex")
+    results = {} if latex else {"render.skipped": "pdflatex not installed"}
+    with app.app_context():
+        for code in ("ferpa_auth", "general_petition"):
+            req = (Request.query.join(FormTemplate).filter(FormTemplate.form_code == code)
+                   .order_by(Request.id).first())
+            results[f"render.python.{code}"] = measure(
+                lambda: pdf_generator.generate_request_pdf(req, [sig_path, sig_path], renderer="python"),
+                repeat=repeat)
+            if latex:
+                results[f"render.{code}"] = measure(
+                    lambda: pdf_generator.generate_request_pdf(req, [sig_path, sig_path], renderer="latex"),
+                    repeat=max(3, repeat // 3))
+    return results
+
+
+# ----------------- Baseline comparison -----------------
+
+def compare(current, baseline, tolerance, metric="min_ms"):
+    """
+    Rows of (name, baseline ms, current ms, ratio, regressed). The fastest run
+    is compared by default: it is the least disturbed by other load on the
+    machine, so it gives the fewest false alarms.
+    """
+    rows = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not isinstance(cur, dict) or not isinstance(base, dict):
+            continue
+        ratio = cur[metric] / base[metric] if base[metric] else 1.0
+        rows.append((name, base[metric], cur[metric], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(scale="10k", repeat=15, seed=0, db_path=None):
+    app = bench_app(db_path)
+    started = time.perf_counter()
+    with app.app_context():
+        data = generate(scale, seed)
+    setup_s = time.perf_counter() - started
+
+    results = {}
+    results.update(micro(data["signature"]))
+    results.update(macro(app, repeat, seed))
+    results.update(end_to_end(app, data["signature"], repeat))
+    return {
+        "meta": {
+            "scale": scale,
+            "repeat": repeat,
+            "setup_s": round(setup_s, 1),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", choices=["10k", "100k", "1M"], default="10k")
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default=None, help="SQLite file for the synthetic data (default: a temp file)")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--metric", choices=["min_ms", "median_ms", "p95_ms"], default="min_ms")
+    args = parser.parse_args()
+
+    result = run(args.scale, args.repeat, args.seed, args.db)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if not args.baseline:
+        for name, r in result["results"].items():
+            print(f"{name:<36} {r['median_ms']:>10.3f} ms" if isinstance(r, dict) else f"{name:<36} {r}")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(result, baseline, args.tolerance, args.metric)
+    print(f"{'benchmark':<36} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, base, cur, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<36} {base:>10.3f} {cur:>10.3f} {(ratio - 1) * 100:>+7.1f}%{flag}")
+    if any(r[4] for r in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
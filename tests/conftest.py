@@ -0,0 +1,39 @@
+# tests/conftest.py
+import pytest
+
+from app import create_app
+from app.models import db, FormTemplate, Request, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SECRET_KEY": "test",
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}",
+        "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+    })
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def make_user(app):
+    def make(name, role="approver"):
+        user = User(name=name, email=f"{name.lower()}@test.edu", role=role, status="active")
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_request(app):
+    def make(requester, status="draft", form_data=None):
+        form = FormTemplate.query.filter_by(form_code="general_petition").one()
+        req = Request(form_template=form, requester=requester, status=status, form_data_json=form_data or {})
+        db.session.add(req)
+        db.session.commit()
+        return req
+    return make
@@ -0,0 +1,63 @@
+# tests/test_analytics.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.approvals.analytics import _next, _ranges, period
+
+
+def _assert_stitched(pieces, since, until):
+    """Pieces are whole periods of their grain that tile [since, until) exactly."""
+    pieces = sorted(pieces, key=lambda p: p[1] or datetime.min)
+    assert pieces[0][1] == since
+    assert pieces[-1][2] == until
+    for (_, _, end), (_, start, _) in zip(pieces, pieces[1:]):
+        assert end == start
+    for grain, start, end in pieces:
+        if start is not None:
+            assert period(start, grain) == start
+            at = start
+            while at < end:
+                at = _next(at, grain)
+            assert at == end
+
+
+def test_month_range_with_ragged_ends():
+    since, until = datetime(2024, 1, 10), datetime(2024, 4, 17)
+    assert sorted(_ranges(since, until, "month"), key=lambda p: p[1]) == [
+        ("day", datetime(2024, 1, 10), datetime(2024, 1, 15)),
+        ("week", datetime(2024, 1, 15), datetime(2024, 1, 29)),
+        ("day", datetime(2024, 1, 29), datetime(2024, 2, 1)),
+        ("month", datetime(2024, 2, 1), datetime(2024, 4, 1)),
+        ("week", datetime(2024, 4, 1), datetime(2024, 4, 15)),
+        ("day", datetime(2024, 4, 15), datetime(2024, 4, 17)),
+    ]
+
+
+def test_aligned_range_is_one_piece():
+    assert _ranges(datetime(2024, 1, 1), datetime(2024, 3, 1), "month") == \
+        [("month", datetime(2024, 1, 1), datetime(2024, 3, 1))]
+    assert _ranges(datetime(2024, 1, 3), datetime(2024, 1, 5), "day") == \
+        [("day", datetime(2024, 1, 3), datetime(2024, 1, 5))]
+
+
+def test_range_shorter_than_a_period_falls_back_to_finer_grains():
+    assert _ranges(datetime(2024, 3, 5), datetime(2024, 3, 9), "month") == \
+        [("day", datetime(2024, 3, 5), datetime(2024, 3, 9))]
+
+
+def test_open_start():
+    until = datetime(2024, 4, 17)
+    assert sorted(_ranges(None, until, "month"), key=lambda p: p[1] or datetime.min) == [
+        ("month", None, datetime(2024, 4, 1)),
+        ("week", datetime(2024, 4, 1), datetime(2024, 4, 15)),
+        ("day", datetime(2024, 4, 15), datetime(2024, 4, 17)),
+    ]
+
+
+@pytest.mark.parametrize("grain", ["month", "week", "day"])
+@pytest.mark.parametrize("days", [1, 6, 7, 13, 31, 45, 90, 400])
+@pytest.mark.parametrize("since", [datetime(2023, 12, 31), datetime(2024, 1, 1), datetime(2024, 2, 27)])
+def test_ranges_tile_the_interval(grain, days, since):
+    until = since + timedelta(days=days)
+    _assert_stitched(_ranges(since, until, grain), since, until)
@@ -0,0 +1,100 @@
+# tests/test_drafts.py
+import pytest
+
+from app.approvals.drafts import DraftConflict, PatchError, apply_patch, coalesce, patch_draft
+from app.models import db, Request
+from app.utils.form_schema import CompiledSchema
+
+SCHEMA = CompiledSchema({
+    "name": "text",
+    "courses": ["MATH 1431", "MATH 1432", "PHYS 1321"],
+    "transcript": "file",
+})
+
+
+def test_apply_patch_sets_and_removes_fields():
+    data = {"name": "Ana", "courses": []}
+    out = apply_patch(data, [
+        {"op": "replace", "path": "/name", "value": "Ana Lopez"},
+        {"op": "remove", "path": "/courses"},
+    ], SCHEMA)
+    assert out == {"name": "Ana Lopez"}
+    assert data == {"name": "Ana", "courses": []}  # input left alone
+
+
+def test_apply_patch_edits_list_items():
+    out = apply_patch({"courses": ["MATH 1431"]}, [
+        {"op": "add", "path": "/courses/-", "value": "PHYS 1321"},
+        {"op": "add", "path": "/courses/0", "value": "MATH 1432"},
+        {"op": "test", "path": "/courses/1", "value": "MATH 1431"},
+        {"op": "remove", "path": "/courses/1"},
+    ], SCHEMA)
+    assert out == {"courses": ["MATH 1432", "PHYS 1321"]}
+
+
+@pytest.mark.parametrize("op", [
+    {"op": "replace", "path": "/transcript", "value": "x.pdf"},   # file fields aren't patched
+    {"op": "replace", "path": "/nope", "value": "x"},             # unknown field
+    {"op": "replace", "path": "/name", "value": ["x"]},           # wrong type
+    {"op": "add", "path": "/name/0", "value": "x"},               # not a list
+    {"op": "remove", "path": "/courses/1"},                       # past the end
+    {"op": "test", "path": "/name", "value": "Bob"},              # test failed
+    {"op": "move", "path": "/name"},                              # unsupported op
+    {"op": "replace", "path": "name", "value": "x"},              # bad path
+])
+def test_apply_patch_rejects(op):
+    with pytest.raises(PatchError):
+        apply_patch({"name": "Ana", "courses": ["MATH 1431"]}, [op], SCHEMA)
+
+
+def test_coalesce_keeps_last_write_per_field():
+    ops = [
+        {"op": "replace", "path": "/name", "value": "A"},
+        {"op": "add", "path": "/courses/-", "value": "MATH 1431"},
+        {"op": "replace", "path": "/name", "value": "An"},
+        {"op": "replace", "path": "/courses", "value": ["PHYS 1321"]},
+        {"op": "replace", "path": "/name", "value": "Ana"},
+        {"op": "add", "path": "/courses/-", "value": "MATH 1432"},
+    ]
+    assert coalesce(ops) == ops[3:]
+
+
+def test_coalesce_keeps_ops_before_a_test():
+    ops = [
+        {"op": "replace", "path": "/name", "value": "Ana"},
+        {"op": "test", "path": "/name", "value": "Ana"},
+        {"op": "replace", "path": "/name", "value": "Ana Lopez"},
+    ]
+    assert coalesce(ops) == ops
+
+
+def test_coalesced_patch_applies_the_same():
+    ops = [
+        {"op": "add", "path": "/courses/-", "value": "MATH 1431"},
+        {"op": "replace", "path": "/name", "value": "A"},
+        {"op": "remove", "path": "/courses"},
+        {"op": "replace", "path": "/name", "value": "Ana"},
+        {"op": "add", "path": "/courses/-", "value": "PHYS 1321"},
+    ]
+    assert apply_patch({}, coalesce(ops), SCHEMA) == apply_patch({}, ops, SCHEMA)
+
+
+def test_patch_draft_is_version_checked(make_user, make_request):
+    student = make_user("Student", role="basicuser")
+    req = make_request(student, form_data={"student_name": "Ana"})
+    req_id, version = req.id, req.version
+    patch = [{"op": "replace", "path": "/student_name", "value": "Ana Lopez"}]
+
+    new_version = patch_draft(req_id, student.id, version, patch)
+    assert new_version == version + 1
+    assert db.session.get(Request, req_id).form_data_json["student_name"] == "Ana Lopez"
+
+    # a second tab still on the old version is told what the draft is now
+    with pytest.raises(DraftConflict) as e:
+        patch_draft(req_id, student.id, version, [{"op": "replace", "path": "/student_name", "value": "A"}])
+    assert e.value.version == new_version
+    assert e.value.form_data["student_name"] == "Ana Lopez"
+
+    assert patch_draft(req_id, student.id, new_version, patch) == new_version  # no change, no write
+    with pytest.raises(LookupError):
+        patch_draft(req_id, make_user("Other", role="basicuser").id, new_version, patch)
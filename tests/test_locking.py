@@ -0,0 +1,86 @@
+# tests/test_locking.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.approvals.locking import StepConflict, claim_holder, claim_step, release_claim
+from app.models import db, ApprovalStep
+
+
+@pytest.fixture
+def step(make_user, make_request):
+    student = make_user("Student", role="basicuser")
+    req = make_request(student, status="pending")
+    step = ApprovalStep(request=req, approver=make_user("Advisor"), sequence=1, status="pending", stage_mode="any")
+    db.session.add(step)
+    db.session.commit()
+    return step
+
+
+def test_claim_is_exclusive_until_released(step, make_user):
+    alice, bob = make_user("Alice"), make_user("Bob")
+    claim_step(step, alice)
+    assert claim_holder(step) == alice.id
+
+    with pytest.raises(StepConflict):
+        claim_step(step, bob)
+    claim_step(step, alice)  # renewing your own claim is fine
+
+    release_claim(step)
+    db.session.commit()
+    claim_step(step, bob)
+    assert claim_holder(step) == bob.id
+
+
+def test_expired_claim_can_be_taken(step, make_user):
+    alice, bob = make_user("Alice"), make_user("Bob")
+    claim_step(step, alice, lease=timedelta(seconds=-1))
+    assert claim_holder(step) is None
+    claim_step(step, bob)
+    assert claim_holder(step) == bob.id
+
+
+def test_actioned_step_cannot_be_claimed(step, make_user):
+    step.status = "approved"
+    db.session.commit()
+    with pytest.raises(StepConflict):
+        claim_step(step, make_user("Alice"))
+
+
+def test_claim_race_loser_gets_conflict(step, make_user):
+    alice, bob = make_user("Alice"), make_user("Bob")
+    step_id, alice_id = step.id, alice.id
+
+    # Alice claims from another worker after this session loaded the step
+    with Session(db.engine) as other:
+        theirs = other.get(ApprovalStep, step_id)
+        theirs.claimed_by_id = alice_id
+        theirs.claim_expires_at = datetime.utcnow() + timedelta(minutes=2)
+        other.commit()
+
+    with pytest.raises(StepConflict):
+        claim_step(step, bob)
+    assert claim_holder(db.session.get(ApprovalStep, step_id)) == alice_id
+
+
+def test_complete_race_loser_cannot_overwrite(step, make_user):
+    alice_id, bob_id = make_user("Alice").id, make_user("Bob").id
+    step_id = step.id
+
+    # Both approvers loaded the step; Alice's approval commits first
+    with Session(db.engine) as other:
+        theirs = other.get(ApprovalStep, step_id)
+        theirs.status = "approved"
+        theirs.approver_id = alice_id
+        other.commit()
+
+    step.status = "returned"
+    step.approver_id = bob_id
+    with pytest.raises(StaleDataError):
+        db.session.commit()
+    db.session.rollback()
+
+    step = db.session.get(ApprovalStep, step_id)
+    assert (step.status, step.approver_id) == ("approved", alice_id)
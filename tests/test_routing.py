@@ -0,0 +1,43 @@
+# tests/test_routing.py
+from app.approvals.routing import complete_step
+from app.models import ApprovalStep, Request
+
+
+def _request(*steps):
+    req = Request(status="pending", form_data_json={})
+    req.approval_steps = [ApprovalStep(sequence=seq, stage_mode=mode, status="pending") for seq, mode in steps]
+    return req
+
+
+def test_any_stage_skips_siblings():
+    req = _request((1, "any"), (1, "any"), (1, "any"), (2, "one"))
+    first, *siblings, registrar = req.approval_steps
+
+    first.status = "approved"
+    assert complete_step(req, first) is False
+    assert [s.status for s in siblings] == ["skipped", "skipped"]
+    assert registrar.status == "pending"
+
+    registrar.status = "approved"
+    assert complete_step(req, registrar) is True
+
+
+def test_all_stage_waits_for_every_approver():
+    req = _request((1, "all"), (1, "all"))
+    first, second = req.approval_steps
+
+    first.status = "approved"
+    assert complete_step(req, first) is False
+    assert second.status == "pending"
+
+    second.status = "approved"
+    assert complete_step(req, second) is True
+
+
+def test_any_stage_leaves_other_stages_alone():
+    req = _request((1, "any"), (2, "any"), (2, "any"))
+    first, *department = req.approval_steps
+
+    first.status = "approved"
+    assert complete_step(req, first) is False
+    assert [s.status for s in department] == ["pending", "pending"]